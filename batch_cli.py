@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+
+from config.settings import TASK_CONFIG
+from core.batch_runner import run_batch
+from core.openai_batch import run_offline_batch
+from core.similarity import SIMILARITY_TASK, run_similarity_batch
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a JSONL/CSV file of prompts through a task without the UI.")
+    parser.add_argument("input", help="Input .jsonl or .csv file")
+    parser.add_argument(
+        "output",
+        help=(
+            "Output .jsonl file. chat/embedding: appended to, rows already written without an error are skipped "
+            "on resume. batch: rewritten in input order; resume re-attaches to the batches recorded in "
+            "<output>.batch.json if the input is unchanged (not with --fake)"
+        ),
+    )
+    parser.add_argument("--task", required=True, choices=list(TASK_CONFIG.keys()))
+    parser.add_argument(
+        "--backend",
+        choices=("chat", "batch", "embedding"),
+        default="chat",
+        help=(
+            "'chat': concurrent Chat Completions calls; 'batch': OpenAI Batch API (cheaper, up to 24h); "
+            f"'embedding': {SIMILARITY_TASK} only, cosine of batched embeddings per pair"
+        ),
+    )
+    parser.add_argument("--fake", action="store_true", help="Batch backend only: use the in-process fake client (no network)")
+    parser.add_argument("--poll-seconds", type=float, default=30.0, help="Batch backend only: status poll interval")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (default 8)")
+    parser.add_argument("--rpm", type=float, default=None, help="Chat backend: requests per minute for the task model's rate-limiter lane (overrides its rpm)")
+    parser.add_argument("--input-field", default="input", help="Column/key holding the prompt text (default 'input')")
+    parser.add_argument("--id-field", default="id", help="Column/key holding the row id (default 'id')")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries on 429/5xx per row (default 5)")
+    parser.add_argument("--left-field", default="text_a", help="Embedding backend: first sentence of a pair (default 'text_a')")
+    parser.add_argument("--right-field", default="text_b", help="Embedding backend: second sentence of a pair (default 'text_b')")
+    args = parser.parse_args()
+
+    if args.backend == "embedding":
+        if args.task != SIMILARITY_TASK:
+            parser.error(f"--backend embedding only supports --task '{SIMILARITY_TASK}'")
+        asyncio.run(
+            run_similarity_batch(
+                args.input,
+                args.output,
+                left_field=args.left_field,
+                right_field=args.right_field,
+                id_field=args.id_field,
+            )
+        )
+        return
+
+    if args.backend == "batch":
+        client = None
+        if args.fake:
+            from utils.fake_openai import FakeBatchClient
+
+            client = FakeBatchClient()
+        run_offline_batch(
+            args.input,
+            args.output,
+            args.task,
+            client=client,
+            input_field=args.input_field,
+            id_field=args.id_field,
+            poll_seconds=0.0 if args.fake else args.poll_seconds,
+            resume=not args.fake,  # fake batches only live in this process
+        )
+        return
+
+    asyncio.run(
+        run_batch(
+            args.input,
+            args.output,
+            args.task,
+            concurrency=args.concurrency,
+            rpm=args.rpm,
+            input_field=args.input_field,
+            id_field=args.id_field,
+            max_retries=args.max_retries,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
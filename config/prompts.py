@@ -16,3 +16,12 @@ SYS_PROMPTS = {
     "Table Question Answering": "You are a helpful question answering assistant, especially capable of summarising data in tables. Always generate text as markdown.",
     "Sentence Similarity": "You are an expert in detecting similar sentences. Always generate text as markdown.",
 }
+
+# "Chat with Document" with RETRIEVAL_BACKEND=local: there is no file_search tool;
+# the relevant excerpts are placed in the user's message instead
+LOCAL_DOCUMENT_PROMPT = (
+    "You are an expert at answering questions based on the provided files. Each question comes with numbered excerpts retrieved from the uploaded documents; "
+    "answer from those excerpts, cite them by number like [1], and say so if they do not contain the answer. "
+    "Always follow the word limit and the tone suggested by the user. If no word limit is provided, ask the user for it. "
+    "If no tone is provided, always answer in a formal tone. Always generate text as markdown."
+)
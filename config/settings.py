@@ -1,6 +1,10 @@
+import hashlib
 import os
+from typing import TypeVar
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
+
+_Client = TypeVar("_Client", OpenAI, AsyncOpenAI)
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -15,6 +19,209 @@ def dprint(msg: str) -> None:
         except Exception:
             pass
 
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return default
+
+
+# Per-session state store limits (one entry per Gradio browser session)
+SESSION_MAX_SESSIONS = _env_int("SESSION_MAX_SESSIONS", 1000)
+SESSION_TTL_SECONDS = _env_float("SESSION_TTL_SECONDS", 3600.0)
+
+# Assistant pool: reuse assistants with identical configuration across sessions.
+# Set ASSISTANT_POOL_PATH to persist the pool to a JSON file across restarts.
+ASSISTANT_POOL_PATH = os.environ.get("ASSISTANT_POOL_PATH", "").strip() or None
+ASSISTANT_POOL_IDLE_TTL_SECONDS = _env_float("ASSISTANT_POOL_IDLE_TTL_SECONDS", 86400.0)
+ASSISTANT_POOL_CLEANUP_INTERVAL_SECONDS = _env_float("ASSISTANT_POOL_CLEANUP_INTERVAL_SECONDS", 600.0)
+
+# UI update coalescing for streamed replies: push at most every N ms or M characters
+STREAM_FLUSH_INTERVAL_MS = _env_float("STREAM_FLUSH_INTERVAL_MS", 50.0)
+STREAM_FLUSH_CHARS = _env_int("STREAM_FLUSH_CHARS", 200)
+
+# Non-streaming run polling: exponential backoff with jitter and a wall-clock budget
+RUN_POLL_INITIAL_DELAY_SECONDS = _env_float("RUN_POLL_INITIAL_DELAY_SECONDS", 0.25)
+RUN_POLL_MAX_DELAY_SECONDS = _env_float("RUN_POLL_MAX_DELAY_SECONDS", 2.0)
+RUN_POLL_BUDGET_SECONDS = _env_float("RUN_POLL_BUDGET_SECONDS", 120.0)
+
+# Function tool calls within one run step execute concurrently on a bounded pool
+TOOL_MAX_WORKERS = _env_int("TOOL_MAX_WORKERS", 8)
+TOOL_STEP_DEADLINE_SECONDS = _env_float("TOOL_STEP_DEADLINE_SECONDS", 25.0)
+
+# Tavily web search result cache (TTL 0 disables). Set TAVILY_CACHE_PATH to a
+# SQLite file to share cached results between worker processes.
+TAVILY_CACHE_TTL_SECONDS = _env_float("TAVILY_CACHE_TTL_SECONDS", 900.0)
+TAVILY_CACHE_MAX_ENTRIES = _env_int("TAVILY_CACHE_MAX_ENTRIES", 1024)
+TAVILY_CACHE_PATH = os.environ.get("TAVILY_CACHE_PATH", "").strip() or None
+
+# Tavily HTTP client: keep-alive pool size and retries on transient failures
+TAVILY_API_URL = os.environ.get("TAVILY_API_URL", "https://api.tavily.com/search")
+TAVILY_POOL_SIZE = _env_int("TAVILY_POOL_SIZE", 16)
+TAVILY_MAX_RETRIES = _env_int("TAVILY_MAX_RETRIES", 2)
+
+# Serve chat from the asyncio pipeline (AsyncOpenAI) instead of worker threads
+ASYNC_CHAT = os.environ.get("ASYNC_CHAT", "1").lower() in ("1", "true", "yes", "on")
+
+# Local manifest of uploaded files (SHA-256 of contents -> file IDs / vector stores)
+UPLOAD_MANIFEST_PATH = os.environ.get("UPLOAD_MANIFEST_PATH", ".cache/upload_manifest.json")
+
+# Background ingestion: files uploaded/indexed concurrently per process. This is
+# also the window of simultaneously open upload files.
+UPLOAD_CONCURRENCY = _env_int("UPLOAD_CONCURRENCY", 4)
+# Give up on a file still being indexed after this long (frees the worker; the file is marked failed)
+UPLOAD_INDEX_TIMEOUT_SECONDS = _env_float("UPLOAD_INDEX_TIMEOUT_SECONDS", 600.0)
+# Checked with stat() before a file is ever opened
+UPLOAD_MAX_FILE_MB = _env_float("UPLOAD_MAX_FILE_MB", 512.0)
+UPLOAD_ALLOWED_EXTENSIONS = tuple(
+    ext.strip().lower()
+    for ext in os.environ.get(
+        "UPLOAD_ALLOWED_EXTENSIONS",
+        ".c,.cpp,.cs,.css,.doc,.docx,.go,.html,.java,.js,.json,.md,.pdf,.php,.pptx,.py,.rb,.sh,.tex,.ts,.txt",
+    ).split(",")
+    if ext.strip()
+)
+
+# Embedding model used by similarity features (response cache semantic tier, etc.)
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small")
+
+# Batched embeddings shared by similarity features, cached by text hash (TTL 0
+# disables). Set EMBEDDING_CACHE_PATH to a SQLite file to share across processes.
+EMBEDDING_BATCH_SIZE = _env_int("EMBEDDING_BATCH_SIZE", 256)
+EMBEDDING_BATCH_MAX_TOKENS = _env_int("EMBEDDING_BATCH_MAX_TOKENS", 100000)
+EMBEDDING_CONCURRENCY = _env_int("EMBEDDING_CONCURRENCY", 4)
+EMBEDDING_CACHE_TTL_SECONDS = _env_float("EMBEDDING_CACHE_TTL_SECONDS", 604800.0)
+EMBEDDING_CACHE_MAX_ENTRIES = _env_int("EMBEDDING_CACHE_MAX_ENTRIES", 50000)
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "").strip() or None
+
+# Retrieval for "Chat with Document": "remote" uses OpenAI vector stores and
+# file_search; "local" chunks and embeds uploads into memory-mapped indexes under
+# RETRIEVAL_INDEX_DIR (reused by content hash) and streams via Chat Completions.
+RETRIEVAL_BACKEND = os.environ.get("RETRIEVAL_BACKEND", "remote").strip().lower()
+RETRIEVAL_INDEX_DIR = os.environ.get("RETRIEVAL_INDEX_DIR", ".cache/retrieval")
+RETRIEVAL_CHUNK_CHARS = _env_int("RETRIEVAL_CHUNK_CHARS", 1600)
+RETRIEVAL_CHUNK_OVERLAP = _env_int("RETRIEVAL_CHUNK_OVERLAP", 200)
+RETRIEVAL_TOP_K = _env_int("RETRIEVAL_TOP_K", 6)
+
+# Sentence Similarity engine: "chat" asks the task's chat model; "embedding"
+# scores with cosine similarity of embeddings (chat model only for /explain)
+SIMILARITY_ENGINE = os.environ.get("SIMILARITY_ENGINE", "chat").strip().lower()
+SIMILARITY_DISPLAY_MAX = _env_int("SIMILARITY_DISPLAY_MAX", 20)
+
+# Response cache for deterministic tasks on the Chat Completions path (TTL 0 disables).
+# RESPONSE_CACHE_SEMANTIC_THRESHOLD > 0 enables the embedding-similarity tier.
+RESPONSE_CACHE_TASKS = tuple(
+    t.strip()
+    for t in os.environ.get("RESPONSE_CACHE_TASKS", "Translation,Text Classification,Sentence Similarity").split(",")
+    if t.strip()
+)
+RESPONSE_CACHE_TTL_SECONDS = _env_float("RESPONSE_CACHE_TTL_SECONDS", 86400.0)
+RESPONSE_CACHE_MAX_ENTRIES = _env_int("RESPONSE_CACHE_MAX_ENTRIES", 4096)
+RESPONSE_CACHE_PATH = os.environ.get("RESPONSE_CACHE_PATH", "").strip() or None
+RESPONSE_CACHE_SEMANTIC_THRESHOLD = _env_float("RESPONSE_CACHE_SEMANTIC_THRESHOLD", 0.0)
+# Tasks where a near-duplicate request may reuse a reply (not Translation: a
+# one-word difference changes the answer)
+RESPONSE_CACHE_SEMANTIC_TASKS = tuple(
+    t.strip() for t in os.environ.get("RESPONSE_CACHE_SEMANTIC_TASKS", "Text Classification").split(",") if t.strip()
+)
+RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES = _env_int("RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES", 2048)
+RESPONSE_CACHE_REPLAY_CHARS = _env_int("RESPONSE_CACHE_REPLAY_CHARS", 24)
+
+# Table Question Answering: CSV/TSV/XLSX uploads are parsed locally into
+# columnar arrays (cached by content hash) and queried through a `query_table`
+# function tool; only small result slices reach the prompt.
+TABLE_QA_ENABLED = os.environ.get("TABLE_QA_ENABLED", "1").lower() in ("1", "true", "yes", "on")
+TABLE_EXTENSIONS = tuple(
+    ext.strip().lower() for ext in os.environ.get("TABLE_EXTENSIONS", ".csv,.tsv,.xlsx").split(",") if ext.strip()
+)
+TABLE_CACHE_MAX_TABLES = _env_int("TABLE_CACHE_MAX_TABLES", 8)
+TABLE_QUERY_MAX_ROWS = _env_int("TABLE_QUERY_MAX_ROWS", 50)
+TABLE_RESULT_MAX_CHARS = _env_int("TABLE_RESULT_MAX_CHARS", 6000)
+TABLE_QA_MAX_TOOL_ROUNDS = _env_int("TABLE_QA_MAX_TOOL_ROUNDS", 6)
+
+# Define task configurations with model, temperature, etc.
+# max_context_tokens: prompt budget for the Chat Completions path; older turns
+# are dropped to fit (0 disables trimming).
+# rpm/tpm: requests and tokens per minute allowed for the task's model (tasks
+# sharing a model share one budget; the lowest configured value applies).
+# Defaults are tier-1 limits; override per model with RATE_LIMIT_RPM_<MODEL> /
+# RATE_LIMIT_TPM_<MODEL> (see model_rate_limit below).
+TASK_CONFIG = {
+    "Generic Assistant": {"model": "gpt-4.1-mini", "temperature": 0.0, "max_context_tokens": 16000, "rpm": 500, "tpm": 200000},
+    "Chat with Document": {"model": "gpt-4.1", "temperature": 0.0, "max_context_tokens": 24000, "rpm": 500, "tpm": 30000},
+    "Summarisation": {"model": "gpt-4.1-mini", "temperature": 0.0, "max_context_tokens": 32000, "rpm": 500, "tpm": 200000},
+    "Translation": {"model": "gpt-4.1-mini", "temperature": 0.0, "max_context_tokens": 8000, "rpm": 500, "tpm": 200000},
+    "Text Classification": {"model": "gpt-4.1-mini", "temperature": 0.0, "max_context_tokens": 8000, "rpm": 500, "tpm": 200000},
+    "Table Question Answering": {"model": "gpt-4.1", "temperature": 0.0, "max_context_tokens": 24000, "rpm": 500, "tpm": 30000},
+    "Sentence Similarity": {"model": "gpt-4.1-mini", "temperature": 0.0, "max_context_tokens": 8000, "rpm": 500, "tpm": 200000},
+}
+
+# History trimming moves the window start in steps of this many messages so the
+# kept prefix is stable across turns (helps provider-side prompt caching)
+CONTEXT_TRIM_STEP = _env_int("CONTEXT_TRIM_STEP", 8)
+
+# Global rate limiter for OpenAI calls (per-model lanes, fair across sessions).
+# Off by default: the rpm/tpm in TASK_CONFIG are tier-1 numbers, so enable it
+# once they match the account's limits. DEFAULT_RPM/TPM apply to models not in
+# TASK_CONFIG (e.g. embeddings) and DEFAULT_RPM to non-model calls (threads,
+# files). Calls are shed with a "busy" reply once MAX_QUEUE callers are waiting
+# on a lane (0 = unbounded) or after MAX_WAIT_SECONDS. COMPLETION_TOKENS is the
+# output estimate counted against TPM.
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+RATE_LIMIT_DEFAULT_RPM = _env_float("RATE_LIMIT_DEFAULT_RPM", 500.0)
+RATE_LIMIT_DEFAULT_TPM = _env_float("RATE_LIMIT_DEFAULT_TPM", 200000.0)
+RATE_LIMIT_MAX_QUEUE = _env_int("RATE_LIMIT_MAX_QUEUE", 64)
+RATE_LIMIT_MAX_WAIT_SECONDS = _env_float("RATE_LIMIT_MAX_WAIT_SECONDS", 30.0)
+RATE_LIMIT_MAX_RETRIES = _env_int("RATE_LIMIT_MAX_RETRIES", 3)
+RATE_LIMIT_COMPLETION_TOKENS = _env_int("RATE_LIMIT_COMPLETION_TOKENS", 512)
+
+
+def model_rate_limit(kind: str, model: str, default: float) -> float:
+    """Per-model override from RATE_LIMIT_<RPM|TPM>_<MODEL>, e.g. RATE_LIMIT_TPM_GPT_4_1 for gpt-4.1."""
+    key = "".join(c if c.isalnum() else "_" for c in model.upper())
+    return _env_float(f"RATE_LIMIT_{kind}_{key}", default)
+
+
+# Apply per-model overrides. With the limiter on, make sure one full-context
+# request can be admitted within MAX_WAIT_SECONDS even from an empty TPM bucket
+# (otherwise every large turn after the first is shed): the prompt budget is
+# lowered to tpm * min(MAX_WAIT_SECONDS, 60) / 60 - COMPLETION_TOKENS if needed.
+for _task, _cfg in TASK_CONFIG.items():
+    _cfg["rpm"] = model_rate_limit("RPM", _cfg["model"], _cfg.get("rpm", RATE_LIMIT_DEFAULT_RPM))
+    _cfg["tpm"] = model_rate_limit("TPM", _cfg["model"], _cfg.get("tpm", RATE_LIMIT_DEFAULT_TPM))
+    _fits = int(_cfg["tpm"] * min(RATE_LIMIT_MAX_WAIT_SECONDS, 60.0) / 60.0) - RATE_LIMIT_COMPLETION_TOKENS
+    if RATE_LIMIT_ENABLED and _cfg.get("max_context_tokens", 0) > _fits > 0:
+        print(
+            f"[settings] {_task}: max_context_tokens {_cfg['max_context_tokens']} + completion "
+            f"{RATE_LIMIT_COMPLETION_TOKENS} cannot refill within {RATE_LIMIT_MAX_WAIT_SECONDS:.0f}s at tpm "
+            f"{_cfg['tpm']:.0f} for {_cfg['model']}; using {_fits}. Raise RATE_LIMIT_TPM_* to keep the full context."
+        )
+        _cfg["max_context_tokens"] = _fits
+
+# Retries the OpenAI SDK makes itself. With the limiter on, calls it wraps are
+# retried by the limiter (which pauses the lane), so those clients are built
+# with max_retries=0; stream managers, which the limiter only admits, keep
+# OPENAI_MAX_RETRIES (see sdk_retrying).
+OPENAI_MAX_RETRIES = _env_int("OPENAI_MAX_RETRIES", 2)
+
+
+def _new_clients(key: str) -> tuple[OpenAI, AsyncOpenAI]:
+    retries = 0 if RATE_LIMIT_ENABLED else OPENAI_MAX_RETRIES
+    return OpenAI(api_key=key, max_retries=retries), AsyncOpenAI(api_key=key, max_retries=retries)
+
+
+def sdk_retrying(c: _Client) -> _Client:
+    """`c` with the SDK's own retries, for calls the limiter does not wrap (stream managers)."""
+    return c.with_options(max_retries=OPENAI_MAX_RETRIES) if RATE_LIMIT_ENABLED else c
+
+
 # Initialise OpenAI client
 # Prefer .env or environment variable; UI can set at runtime.
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
@@ -22,37 +229,40 @@ if OPENAI_API_KEY:
     # Ensure the key is available to other modules in this process
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
     dprint("OPENAI_API_KEY loaded from environment.")
-    client = OpenAI(api_key=OPENAI_API_KEY)
+    client, async_client = _new_clients(OPENAI_API_KEY)
 else:
     dprint("OPENAI_API_KEY not set at startup; waiting for UI input or .env.")
     client = None
+    async_client = None
 
-# Define task configurations with model, temperature, etc.
-TASK_CONFIG = {
-    "Generic Assistant": {"model": "gpt-4.1-mini", "temperature": 0.0},
-    "Chat with Document": {"model": "gpt-4.1", "temperature": 0.0},
-    "Summarisation": {"model": "gpt-4.1-mini", "temperature": 0.0},
-    "Translation": {"model": "gpt-4.1-mini", "temperature": 0.0},
-    "Text Classification": {"model": "gpt-4.1-mini", "temperature": 0.0},
-    "Table Question Answering": {"model": "gpt-4.1", "temperature": 0.0},
-    "Sentence Similarity": {"model": "gpt-4.1-mini", "temperature": 0.0},
-}
+# Timing spans exported as Prometheus histograms on /metrics (served by serve.py).
+# Off by default; when off, span hooks are shared no-ops.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "0").lower() in ("1", "true", "yes", "on")
+
+
+def account_fingerprint() -> str:
+    """Short, non-reversible tag for the active API key (remote objects are per-account)."""
+    key = OPENAI_API_KEY or ""
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
 
 
 def set_openai_api_key(new_key: str) -> str:
     """Update the OpenAI API key at runtime and reinitialize the client.
 
+    The clients are module globals, so the new key applies to every session in
+    this process, not just the one that set it; deployments serving several
+    users should set OPENAI_API_KEY in the environment instead.
     Returns a short status message suitable for UI display.
     """
-    global OPENAI_API_KEY, client
+    global OPENAI_API_KEY, client, async_client
     try:
         key = (new_key or "").strip()
         if not key:
             return "Error: API key cannot be empty."
         os.environ["OPENAI_API_KEY"] = key
         OPENAI_API_KEY = key
-        client = OpenAI(api_key=OPENAI_API_KEY)
+        client, async_client = _new_clients(OPENAI_API_KEY)
         dprint("OPENAI_API_KEY updated at runtime.")
-        return "API key updated. Session has been reset."
+        return "API key updated for all sessions in this process. Session has been reset."
     except Exception as e:
         return f"Error updating API key: {e}"
@@ -1,25 +1,60 @@
 from __future__ import annotations
 
-from typing import Any, Iterator, List, Tuple
+from typing import Any, AsyncIterator, Iterator, List, Tuple
+import asyncio
 import json
+import random
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import threading
+import time
 
-from openai.types.beta.assistant_create_params import ToolResources
+import gradio as gr
 
 import config.settings as settings
 from config.prompts import SYS_PROMPTS
-from core import state
-from core.responses_chat import responses_stream_chat
+from core import assistant_pool, metrics, state
+from core.rate_limit import estimate_tokens, limiter
+from core.state import SessionState
+from core.responses_chat import responses_stream_chat, responses_stream_chat_async
+from core.retrieval import uses_local_retrieval
+from core.similarity import embedding_enabled, similarity_stream_chat, similarity_stream_chat_async
+from core.table_qa import has_tables, table_stream_chat, table_stream_chat_async
+from utils.coalesce import UpdateCoalescer
 from utils.chat_format import (
     messages_append_user,
     messages_append_assistant,
-    ensure_last_assistant_message,
-    append_to_last_assistant,
+    StreamingMessageBuffer,
     extract_text_blocks_from_assistant,
-    sanitize_messages,
 )
 
-
-def _ensure_assistant_and_thread(task: str, enabled_tools: List[str], history_messages: List[dict], message: str) -> tuple[bool, List[dict]]:
+# Function tool schema for web search; kept constant so pooled assistants hash stably
+WEB_SEARCH_TOOL: dict[str, Any] = {
+    "type": "function",
+    "function": {
+        "name": "web_search",
+        "description": "Search the web for up-to-date information and return a brief, source-linked summary.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The search query to look up on the web.",
+                },
+                "max_results": {
+                    "type": "integer",
+                    "description": "Maximum number of results to include (1-10).",
+                    "minimum": 1,
+                    "maximum": 10,
+                    "default": 5,
+                },
+            },
+            "required": ["query"],
+        },
+    },
+}
+
+
+def _ensure_assistant_and_thread(session: SessionState, task: str, enabled_tools: List[str], history_messages: List[dict], message: str) -> tuple[bool, List[dict]]:
     """Ensure assistant and thread exist. Returns (ok, messages)."""
     # Guard: require OpenAI client
     if settings.client is None:
@@ -29,62 +64,33 @@ def _ensure_assistant_and_thread(task: str, enabled_tools: List[str], history_me
             "Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'.",
         )
         return False, msgs
-    # --- 1. Create or Update Assistant ---
-    if not state.assistant_id:
-        settings.dprint("No assistant found. Creating a new one...")
+    # --- 1. Resolve Assistant from the pool (created once per configuration) ---
+    if not session.assistant_id:
         instructions = SYS_PROMPTS.get(task, "You are a helpful assistant.")
         cfg = settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"})
 
         assistant_tools: List[dict[str, Any]] = []
         if "Web Search" in enabled_tools:
             # Register a function tool for web search; the model can request it when needed
-            assistant_tools.append(
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "web_search",
-                        "description": "Search the web for up-to-date information and return a brief, source-linked summary.",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "query": {
-                                    "type": "string",
-                                    "description": "The search query to look up on the web.",
-                                },
-                                "max_results": {
-                                    "type": "integer",
-                                    "description": "Maximum number of results to include (1-10).",
-                                    "minimum": 1,
-                                    "maximum": 10,
-                                    "default": 5,
-                                },
-                            },
-                            "required": ["query"],
-                        },
-                    },
-                }
-            )
+            assistant_tools.append(WEB_SEARCH_TOOL)
 
-        # Initialize tool_resources as None, with the correct type hint
-        tool_resources: ToolResources | None = None
+        vector_store_ids: List[str] = []
         if "File Search" in enabled_tools:
             assistant_tools.append({"type": "file_search"})
-            if state.vector_store_id:
-                tool_resources = ToolResources(file_search={"vector_store_ids": [state.vector_store_id]})
+            if session.vector_store_id:
+                vector_store_ids.append(session.vector_store_id)
             else:
                 print("Warning: File Search is enabled, but no files have been uploaded.")
 
         try:
-            assistant = settings.client.beta.assistants.create(
-                name="Multi-Task Chatbot",
+            session.assistant_id = assistant_pool.pool.acquire(
                 instructions=instructions,
                 tools=assistant_tools,
                 model=cfg["model"],
-                tool_resources=tool_resources,
+                vector_store_ids=vector_store_ids,
             )
-            state.assistant_id = assistant.id
             settings.dprint(
-                f"Created new Assistant (ID: {state.assistant_id}) for task '{task}' with tools: {enabled_tools}"
+                f"Using Assistant (ID: {session.assistant_id}) for task '{task}' with tools: {enabled_tools}"
             )
         except Exception as e:
             print(f"Error creating assistant: {e}")
@@ -92,13 +98,17 @@ def _ensure_assistant_and_thread(task: str, enabled_tools: List[str], history_me
             msgs = messages_append_assistant(msgs, f"Error: Could not create the assistant. {e}")
             return False, msgs
 
+    else:
+        # Keep the pooled assistant alive while this conversation uses it
+        assistant_pool.pool.touch(session.assistant_id)
+
     # --- 2. Create a Thread ---
-    if not state.thread_id:
+    if not session.thread_id:
         settings.dprint("No thread found. Creating a new one...")
         try:
-            thread = settings.client.beta.threads.create()
-            state.thread_id = thread.id
-            settings.dprint(f"Created new Thread (ID: {state.thread_id})")
+            thread = limiter.call(settings.client.beta.threads.create, session_id=session.session_id)
+            session.thread_id = thread.id
+            settings.dprint(f"Created new Thread (ID: {session.thread_id})")
         except Exception as e:
             print(f"Error creating thread: {e}")
             msgs = messages_append_user(list(history_messages or []), message)
@@ -108,19 +118,412 @@ def _ensure_assistant_and_thread(task: str, enabled_tools: List[str], history_me
     return True, history_messages
 
 
-def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools: List[str]) -> tuple[str, List[dict]]:
+def _search_cache_stats() -> dict[str, int]:
+    from utils.web_search import search_cache
+
+    return search_cache.stats()
+
+
+metrics.register("chatbot_search_cache", "gauge", "Tavily search cache counters.", "stat", _search_cache_stats)
+
+_RUN_TERMINAL_STATUSES = ("completed", "failed", "cancelled", "cancelling", "expired", "incomplete")
+
+# Process-wide polling counters (runs finished, total retrieve calls, runs cancelled)
+RUN_POLL_STATS: dict[str, int] = {"runs": 0, "polls": 0, "cancelled": 0}
+_run_poll_stats_lock = threading.Lock()
+metrics.register(
+    "chatbot_run_polls_total", "counter", "Non-streaming run polling totals.", "kind", lambda: dict(RUN_POLL_STATS)
+)
+
+
+class RunPoller:
+    """Exponential backoff with jitter and a wall-clock budget for `runs.retrieve` loops."""
+
+    def __init__(
+        self,
+        initial_delay: float | None = None,
+        max_delay: float | None = None,
+        budget_seconds: float | None = None,
+    ) -> None:
+        self.initial_delay = settings.RUN_POLL_INITIAL_DELAY_SECONDS if initial_delay is None else initial_delay
+        self.max_delay = settings.RUN_POLL_MAX_DELAY_SECONDS if max_delay is None else max_delay
+        budget = settings.RUN_POLL_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+        self.deadline = time.monotonic() + budget
+        self.delay = self.initial_delay
+        self.polls = 0
+        self.timed_out = False
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def reset_backoff(self) -> None:
+        self.delay = self.initial_delay
+
+    def wait(self) -> None:
+        """Sleep for the current delay (+/- 50% jitter, capped at the deadline) and back off."""
+        remaining = self.deadline - time.monotonic()
+        pause = min(self.delay * random.uniform(0.5, 1.5), max(0.0, remaining))
+        if pause > 0:
+            time.sleep(pause)
+        self.delay = min(self.delay * 2, self.max_delay)
+        self.polls += 1
+
+    def cancel(self, thread_id: str | None, run_id: str) -> None:
+        self.timed_out = self.expired()
+        try:
+            limiter.call(settings.client.beta.threads.runs.cancel, thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            settings.dprint(f"Could not cancel run {run_id}: {e}")
+        _count_cancelled()
+
+    def finish(self, run_id: str) -> None:
+        with _run_poll_stats_lock:
+            RUN_POLL_STATS["runs"] += 1
+            RUN_POLL_STATS["polls"] += self.polls
+        settings.dprint(f"Run {run_id} finished after {self.polls} polls.")
+
+
+def _web_search_calls(tool_calls: List[Any]) -> List[tuple[str, str | None]]:
+    """Return (call_id, arguments_json) for every `web_search` function call."""
+    calls: List[tuple[str, str | None]] = []
+    for call in tool_calls:
+        try:
+            fname = getattr(call, "function", None).name  # type: ignore[union-attr]
+            fargs_json = getattr(call, "function", None).arguments  # type: ignore[union-attr]
+        except Exception:
+            fname = None
+            fargs_json = None
+        if fname == "web_search":
+            calls.append((call.id, fargs_json))
+    return calls
+
+
+def _web_search_args(fargs_json: str | None) -> tuple[str, int]:
+    try:
+        args = json.loads(fargs_json or "{}")
+    except Exception:
+        args = {}
+    return args.get("query", ""), args.get("max_results", 5)
+
+
+def _web_search_tool(fargs_json: str | None, deadline: float) -> str:
+    query, max_results = _web_search_args(fargs_json)
+    # The worker thread cannot be cancelled, so the request itself must end by the step deadline
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return "Error performing web search: step deadline passed before the search started."
+    # Execute Tavily search
+    try:
+        from utils.web_search import tavily_search_summarize
+
+        return tavily_search_summarize(query=query, max_results=max_results, timeout=remaining)
+    except Exception as err:
+        return f"Error performing web search: {err}"
+
+
+# Shared, bounded pool for tool calls issued in the same `requires_action` step
+_tool_executor = ThreadPoolExecutor(max_workers=settings.TOOL_MAX_WORKERS, thread_name_prefix="tool-call")
+
+
+def _run_tool_calls(tool_calls: List[Any]) -> List[dict[str, str]]:
+    """Execute function tool calls requested by a run and return `tool_outputs`.
+
+    Calls in one step run concurrently; any call still running when the step
+    deadline passes is reported as timed out so the remaining outputs can
+    still be submitted. Each call's HTTP timeout is the time left until that
+    deadline, so abandoned calls stop soon after and free their worker.
+    """
+    deadline = settings.TOOL_STEP_DEADLINE_SECONDS
+    step_deadline = time.monotonic() + deadline
+    futures: List[tuple[str, Future[str]]] = [
+        (call_id, _tool_executor.submit(_web_search_tool, fargs_json, step_deadline))
+        for call_id, fargs_json in _web_search_calls(tool_calls)
+    ]
+    if not futures:
+        return []
+    with metrics.span("tools", "assistant"):
+        wait([f for _, f in futures], timeout=deadline)
+
+    tool_outputs: List[dict[str, str]] = []
+    for call_id, future in futures:
+        if future.done():
+            try:
+                output_text = future.result()
+            except Exception as err:
+                output_text = f"Error performing web search: {err}"
+        else:
+            future.cancel()
+            output_text = f"Error performing web search: no result within {deadline:.0f}s."
+        tool_outputs.append({
+            "tool_call_id": call_id,
+            "output": output_text,
+        })
+    return tool_outputs
+
+
+async def _web_search_tool_async(fargs_json: str | None) -> str:
+    query, max_results = _web_search_args(fargs_json)
+    try:
+        from utils.web_search import tavily_search_summarize_async
+
+        return await tavily_search_summarize_async(query=query, max_results=max_results)
+    except Exception as err:
+        return f"Error performing web search: {err}"
+
+
+async def _run_tool_calls_async(tool_calls: List[Any]) -> List[dict[str, str]]:
+    """Asyncio counterpart of `_run_tool_calls` (same deadline and partial results)."""
+    calls = _web_search_calls(tool_calls)
+    if not calls:
+        return []
+    tasks = [asyncio.ensure_future(_web_search_tool_async(fargs_json)) for _, fargs_json in calls]
+    deadline = settings.TOOL_STEP_DEADLINE_SECONDS
+    with metrics.span("tools", "assistant_async"):
+        await asyncio.wait(tasks, timeout=deadline)
+
+    tool_outputs: List[dict[str, str]] = []
+    for (call_id, _), task in zip(calls, tasks):
+        if task.done() and not task.cancelled():
+            output_text = task.result()
+        else:
+            task.cancel()
+            output_text = f"Error performing web search: no result within {deadline:.0f}s."
+        tool_outputs.append({
+            "tool_call_id": call_id,
+            "output": output_text,
+        })
+    return tool_outputs
+
+
+def _extract_delta_text(event: Any, etype: str | None) -> str:
+    """Extract the textual delta from an Assistants stream event (several SDK shapes)."""
+    # Try to extract textual delta from multiple shapes
+    delta_text = ""
+    # 1) response.output_text.delta (Responses-style)
+    if etype == "response.output_text.delta":
+        delta_obj = getattr(event, "delta", None)
+        delta_text = getattr(delta_obj, "value", "") or ""
+    # 2) thread.message.delta (Assistants-style)
+    elif etype == "thread.message.delta":
+        # Based on repr: ThreadMessageDelta(data=MessageDeltaEvent(..., delta=MessageDelta(content=[TextDeltaBlock(... text=TextDelta(value='...'))])))
+        try:
+            data_obj = getattr(event, "data", None)
+            msg_delta = getattr(data_obj, "delta", None)
+            content_list = getattr(msg_delta, "content", None)
+            if content_list and isinstance(content_list, (list, tuple)):
+                parts = []
+                for block in content_list:
+                    try:
+                        if getattr(block, "type", None) == "text":
+                            text_obj = getattr(block, "text", None)
+                            val = getattr(text_obj, "value", None)
+                            if isinstance(val, str) and val:
+                                parts.append(val)
+                    except Exception:
+                        continue
+                delta_text = "".join(parts)
+            else:
+                delta_text = ""
+        except Exception:
+            delta_text = ""
+    # 3) Generic response.delta/message.delta fallbacks
+    elif etype in ("response.delta", "message.delta", "run.step.delta"):
+        delta_obj = getattr(event, "delta", None)
+        delta_text = (
+            getattr(delta_obj, "value", None)
+            or getattr(delta_obj, "text", None)
+            or (delta_obj if isinstance(delta_obj, str) else "")
+        ) or ""
+
+    # 4) Fallback: dict-like payloads with nested text
+    elif etype is None:
+        try:
+            # If event behaves like a dict, try common shapes
+            if isinstance(event, dict):
+                # e.g., {"delta": {"value": "..."}}
+                d = event.get("delta") or {}
+                delta_text = d.get("value") or d.get("text") or ""
+                if not delta_text:
+                    data = event.get("data") or {}
+                    # Try nested content blocks
+                    content = data.get("content") or []
+                    for block in content:
+                        val = (
+                            block.get("text", {}).get("value")
+                            if isinstance(block.get("text"), dict)
+                            else block.get("value")
+                        )
+                        if isinstance(val, str) and val:
+                            delta_text = val
+                            break
+        except Exception:
+            pass
+
+    return delta_text
+
+
+def _consume_stream_event(
+    event: Any, buf: StreamingMessageBuffer, coalescer: UpdateCoalescer, completed: List[str]
+) -> tuple[bool, List[Any] | None]:
+    """Apply one Assistants stream event to `buf`.
+
+    Returns (emit, tool_calls): `emit` is True when the UI should be updated;
+    `tool_calls` is set (possibly empty) when the run requires action. The
+    text of each `thread.message.completed` event is appended to `completed`.
+    """
+    # Some SDKs expose `event.event` instead of `event.type`
+    etype = getattr(event, "type", None) or getattr(event, "event", None)
+    # Per-event logging is only formatted when DEBUG is on (this runs for every token)
+    if settings.DEBUG:
+        try:
+            settings.dprint(f"[assist_stream] event: {etype}")
+            if etype is None:
+                settings.dprint(f"[assist_stream] event class: {event.__class__.__name__}")
+                # Print a shortened repr to avoid flooding
+                er = repr(event)
+                if len(er) > 300:
+                    er = er[:300] + "..."
+                settings.dprint(f"[assist_stream] event repr: {er}")
+        except Exception:
+            pass
+
+    if etype == "thread.message.completed":
+        message = getattr(event, "data", None)
+        if getattr(message, "role", "assistant") == "assistant":
+            completed.append(extract_text_blocks_from_assistant(message))
+        return False, None
+
+    if etype == "thread.run.requires_action":
+        try:
+            return False, list(event.data.required_action.submit_tool_outputs.tool_calls)  # type: ignore[union-attr]
+        except Exception:
+            return False, []
+
+    delta_text = _extract_delta_text(event, etype)
+    if delta_text:
+        buf.append(delta_text)
+        return coalescer.ready(len(delta_text)), None
+    return False, None
+
+
+def _finalize_streamed_text(buf: StreamingMessageBuffer, completed: List[str]) -> bool:
+    """Reconcile streamed deltas with the completed messages of the run.
+
+    Returns False when no `thread.message.completed` event arrived, in which
+    case the caller should fetch the latest message instead.
+    """
+    if not completed:
+        return False
+    if "".join(completed) != buf.text:
+        # Some deltas were missed; the completed messages are authoritative
+        buf.set_text("\n\n".join(t for t in completed if t))
+    return True
+
+
+def _latest_message_text(session: SessionState, path: str) -> str:
+    """Text of the newest thread message (one-item page, newest first)."""
+    with metrics.span("final_messages_list", path):
+        page = limiter.call(
+            settings.client.beta.threads.messages.list,
+            thread_id=session.thread_id,
+            limit=1,
+            order="desc",
+            session_id=session.session_id,
+        )
+    return extract_text_blocks_from_assistant(page.data[0])
+
+
+def _forget_missing(session: SessionState, e: Exception) -> None:
+    """After a 404, drop the vanished IDs so the next message recreates them.
+
+    The pooled assistant is invalidated only when the error names it; a missing
+    thread just resets the session, and the assistant is re-acquired from the pool.
+    """
+    if getattr(e, "status_code", None) != 404:
+        return
+    text = str(e)
+    if (session.assistant_id and session.assistant_id in text) or "no assistant found" in text.lower():
+        assistant_pool.pool.invalidate(session.assistant_id)
+    session.reset()
+
+
+def _stream_failed(session: SessionState, buf: StreamingMessageBuffer, e: Exception) -> None:
+    print(f"Error during streaming: {e}")
+    _forget_missing(session, e)
+    buf.append(f"Error: The assistant failed to stream. {e}")
+
+
+def _count_cancelled() -> None:
+    with _run_poll_stats_lock:
+        RUN_POLL_STATS["cancelled"] += 1
+
+
+def _cancel_unanswered_run(session: SessionState, run_id: str) -> None:
+    """Cancel a run left in requires_action with no tool outputs, so the thread accepts new messages."""
+    try:
+        limiter.call(
+            settings.client.beta.threads.runs.cancel,
+            thread_id=session.thread_id,
+            run_id=run_id,
+            session_id=session.session_id,
+        )
+    except Exception as e:
+        settings.dprint(f"Could not cancel run {run_id}: {e}")
+    _count_cancelled()
+
+
+async def _cancel_unanswered_run_async(session: SessionState, run_id: str) -> None:
+    try:
+        await limiter.acall(
+            settings.async_client.beta.threads.runs.cancel,
+            thread_id=session.thread_id,
+            run_id=run_id,
+            session_id=session.session_id,
+        )
+    except Exception as e:
+        settings.dprint(f"Could not cancel run {run_id}: {e}")
+    _count_cancelled()
+
+
+def _run_failed_text(run: Any) -> str:
+    err = f"Run failed with status: {run.status}."
+    if getattr(run, "last_error", None):
+        err += f" Details: {run.last_error.message}"
+    return err
+
+
+def _run_lane(task: str) -> str:
+    return settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"}).get("model", "gpt-4o-mini")
+
+
+def _tool_output_tokens(model: str, tool_outputs: List[dict[str, str]]) -> int:
+    return estimate_tokens(model, [{"role": "tool", "content": o["output"]} for o in tool_outputs])
+
+
+def chat_fn(
+    message: str,
+    history_messages: List[dict],
+    task: str,
+    enabled_tools: List[str],
+    session: SessionState | None = None,
+) -> tuple[str, List[dict]]:
     """Non-streaming chat (Assistants API); returns messages for Gradio Chatbot(type="messages")."""
-    ok, history_messages = _ensure_assistant_and_thread(task, enabled_tools, history_messages, message)
+    session = session or state.get_session()
+    with metrics.span("ensure", "assistant_poll"):
+        ok, history_messages = _ensure_assistant_and_thread(session, task, enabled_tools, history_messages, message)
     if not ok:
         return "", history_messages
 
     # --- 3. Add User's Message to the Thread ---
     try:
-        settings.client.beta.threads.messages.create(
-            thread_id=state.thread_id,
-            role="user",
-            content=message,
-        )
+        with metrics.span("message_create", "assistant_poll"):
+            limiter.call(
+                settings.client.beta.threads.messages.create,
+                thread_id=session.thread_id,
+                role="user",
+                content=message,
+                session_id=session.session_id,
+            )
     except Exception as e:
         print(f"Error adding message to thread: {e}")
         msgs = messages_append_user(list(history_messages or []), message)
@@ -129,16 +532,23 @@ def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools
 
     # --- 4. Run the Assistant and Poll for Completion ---
     try:
-        settings.dprint(f"Running Assistant {state.assistant_id} on Thread {state.thread_id}...")
-        run = settings.client.beta.threads.runs.create(
-            thread_id=state.thread_id,
-            assistant_id=state.assistant_id,
-        )
+        settings.dprint(f"Running Assistant {session.assistant_id} on Thread {session.thread_id}...")
+        lane = _run_lane(task)
+        with metrics.span("run_start", "assistant_poll"):
+            run = limiter.call(
+                settings.client.beta.threads.runs.create,
+                thread_id=session.thread_id,
+                assistant_id=session.assistant_id,
+                lane=lane,
+                tokens=estimate_tokens(lane, [{"role": "user", "content": message}]),
+                session_id=session.session_id,
+            )
 
-        # Handle function tool-calls loop
+        # Handle function tool-calls loop; wait between polls with backoff
+        poller = RunPoller()
         while True:
             status = getattr(run, "status", None)
-            if status == "completed":
+            if status in _RUN_TERMINAL_STATUSES:
                 break
             if status == "requires_action":
                 try:
@@ -146,47 +556,36 @@ def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools
                 except Exception:
                     tool_calls = []
 
-                tool_outputs: List[dict[str, str]] = []
-                for call in tool_calls:
-                    try:
-                        fname = getattr(call, "function", None).name  # type: ignore[union-attr]
-                        fargs_json = getattr(call, "function", None).arguments  # type: ignore[union-attr]
-                    except Exception:
-                        fname = None
-                        fargs_json = None
-                    if fname == "web_search":
-                        try:
-                            args = json.loads(fargs_json or "{}")
-                        except Exception:
-                            args = {}
-                        query = args.get("query", "")
-                        max_results = args.get("max_results", 5)
-                        # Execute Tavily search
-                        try:
-                            from utils.web_search import tavily_search_summarize
-
-                            output_text = tavily_search_summarize(query=query, max_results=max_results)
-                        except Exception as err:
-                            output_text = f"Error performing web search: {err}"
-                        tool_outputs.append({
-                            "tool_call_id": call.id,
-                            "output": output_text,
-                        })
-                # Submit tool outputs and poll until next state
-                if tool_outputs:
-                    run = settings.client.beta.threads.runs.submit_tool_outputs_and_poll(
-                        thread_id=state.thread_id,
-                        run_id=run.id,
-                        tool_outputs=tool_outputs,
-                    )
-                    continue
-            # Fallback: poll until completion or next action required
-            run = settings.client.beta.threads.runs.retrieve(
-                thread_id=state.thread_id,
+                tool_outputs = _run_tool_calls(tool_calls)
+                if not tool_outputs:
+                    # Nothing we can answer; don't wait for the run to expire
+                    poller.cancel(session.thread_id, run.id)
+                    break
+                run = limiter.call(
+                    settings.client.beta.threads.runs.submit_tool_outputs,
+                    thread_id=session.thread_id,
+                    run_id=run.id,
+                    tool_outputs=tool_outputs,
+                    lane=lane,
+                    tokens=_tool_output_tokens(lane, tool_outputs),
+                    session_id=session.session_id,
+                )
+                poller.reset_backoff()
+                continue
+            if poller.expired():
+                poller.cancel(session.thread_id, run.id)
+                break
+            poller.wait()
+            run = limiter.call(
+                settings.client.beta.threads.runs.retrieve,
+                thread_id=session.thread_id,
                 run_id=run.id,
+                session_id=session.session_id,
             )
+        poller.finish(run.id)
     except Exception as e:
         print(f"Error during assistant run: {e}")
+        _forget_missing(session, e)
         msgs = messages_append_user(list(history_messages or []), message)
         msgs = messages_append_assistant(msgs, f"Error: The assistant failed to run. {e}")
         return "", msgs
@@ -196,9 +595,7 @@ def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools
         msgs_list = list(history_messages or [])
         msgs_list = messages_append_user(msgs_list, message)
         try:
-            thread_messages = settings.client.beta.threads.messages.list(thread_id=state.thread_id)
-            latest = thread_messages.data[0]
-            final_reply = extract_text_blocks_from_assistant(latest)
+            final_reply = _latest_message_text(session, "assistant_poll")
             msgs_list = messages_append_assistant(msgs_list, final_reply)
         except Exception as e:
             print(f"Error fetching final message: {e}")
@@ -206,7 +603,12 @@ def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools
         return "", msgs_list
     else:
         settings.dprint(f"Run failed with status: {run.status}")
-        error_message = f"Run failed with status: {run.status}. Please try again."
+        if poller.timed_out:
+            error_message = (
+                f"Run did not finish within {settings.RUN_POLL_BUDGET_SECONDS:.0f}s and was cancelled. Please try again."
+            )
+        else:
+            error_message = f"Run failed with status: {run.status}. Please try again."
         if getattr(run, "last_error", None):
             error_message += f" Details: {run.last_error.message}"
         msgs_list = list(history_messages or [])
@@ -216,24 +618,34 @@ def chat_fn(message: str, history_messages: List[dict], task: str, enabled_tools
 
 
 def chat_fn_streaming(
-    message: str, history_messages: List[dict], task: str, enabled_tools: List[str]
+    message: str,
+    history_messages: List[dict],
+    task: str,
+    enabled_tools: List[str],
+    session: SessionState | None = None,
 ) -> Iterator[tuple[str, List[dict]]]:
     """Streaming chat function using Assistants API streaming.
 
     Yields progressive updates to the last assistant message in history.
     """
-    ok, history_messages = _ensure_assistant_and_thread(task, enabled_tools, history_messages, message)
+    session = session or state.get_session()
+    timer = metrics.StreamTimer("assistant")
+    with metrics.span("ensure", "assistant"):
+        ok, history_messages = _ensure_assistant_and_thread(session, task, enabled_tools, history_messages, message)
     if not ok:
         yield "", history_messages
         return
 
     # Add the user's message and prime the assistant reply in history
     try:
-        settings.client.beta.threads.messages.create(
-            thread_id=state.thread_id,
-            role="user",
-            content=message,
-        )
+        with metrics.span("message_create", "assistant"):
+            limiter.call(
+                settings.client.beta.threads.messages.create,
+                thread_id=session.thread_id,
+                role="user",
+                content=message,
+                session_id=session.session_id,
+            )
     except Exception as e:
         print(f"Error adding message to thread: {e}")
         msgs = messages_append_user(list(history_messages or []), message)
@@ -242,132 +654,76 @@ def chat_fn_streaming(
         return
 
     # Prepare a working copy of history with a placeholder assistant reply
-    work_messages = messages_append_user(list(history_messages or []), message)
-    work_messages = ensure_last_assistant_message(work_messages)
+    buf = StreamingMessageBuffer(history_messages, message)
+    coalescer = UpdateCoalescer()
+    completed: List[str] = []
 
     # True token-by-token streaming via Assistants API
     try:
-        settings.dprint(f"Streaming Assistant {state.assistant_id} on Thread {state.thread_id}...")
+        settings.dprint(f"Streaming Assistant {session.assistant_id} on Thread {session.thread_id}...")
         # Emit an immediate placeholder so the UI shows progress
         try:
             # Emit placeholder assistant if empty
-            if not (work_messages and work_messages[-1].get("role") == "assistant" and work_messages[-1].get("content")):
-                tmp = list(work_messages)
-                tmp[-1]["content"] = "..."
-                yield "", tmp
-                work_messages[-1]["content"] = ""
+            yield "", buf.snapshot(placeholder="...")
         except Exception:
             pass
 
-        with settings.client.beta.threads.runs.stream(
-            thread_id=state.thread_id, assistant_id=state.assistant_id
-        ) as stream:
-            for event in stream:
-                # Some SDKs expose `event.event` instead of `event.type`
-                etype = getattr(event, "type", None) or getattr(event, "event", None)
-                try:
-                    settings.dprint(f"[assist_stream] event: {etype}")
-                    if etype is None:
-                        settings.dprint(f"[assist_stream] event class: {event.__class__.__name__}")
-                        # Print a shortened repr to avoid flooding
-                        er = repr(event)
-                        if len(er) > 300:
-                            er = er[:300] + "..."
-                        settings.dprint(f"[assist_stream] event repr: {er}")
-                except Exception:
-                    pass
-
-                # Try to extract textual delta from multiple shapes
-                delta_text = ""
-                # 1) response.output_text.delta (Responses-style)
-                if etype == "response.output_text.delta":
-                    delta_obj = getattr(event, "delta", None)
-                    delta_text = getattr(delta_obj, "value", "") or ""
-                # 2) thread.message.delta (Assistants-style)
-                elif etype == "thread.message.delta":
-                    # Based on repr: ThreadMessageDelta(data=MessageDeltaEvent(..., delta=MessageDelta(content=[TextDeltaBlock(... text=TextDelta(value='...'))])))
-                    try:
-                        data_obj = getattr(event, "data", None)
-                        msg_delta = getattr(data_obj, "delta", None)
-                        content_list = getattr(msg_delta, "content", None)
-                        if content_list and isinstance(content_list, (list, tuple)):
-                            parts = []
-                            for block in content_list:
-                                try:
-                                    if getattr(block, "type", None) == "text":
-                                        text_obj = getattr(block, "text", None)
-                                        val = getattr(text_obj, "value", None)
-                                        if isinstance(val, str) and val:
-                                            parts.append(val)
-                                except Exception:
-                                    continue
-                            delta_text = "".join(parts)
-                        else:
-                            delta_text = ""
-                    except Exception:
-                        delta_text = ""
-                # 3) Generic response.delta/message.delta fallbacks
-                elif etype in ("response.delta", "message.delta", "run.step.delta"):
-                    delta_obj = getattr(event, "delta", None)
-                    delta_text = (
-                        getattr(delta_obj, "value", None)
-                        or getattr(delta_obj, "text", None)
-                        or (delta_obj if isinstance(delta_obj, str) else "")
-                    ) or ""
-
-                # 4) Fallback: dict-like payloads with nested text
-                elif etype is None:
-                    try:
-                        # If event behaves like a dict, try common shapes
-                        if isinstance(event, dict):
-                            # e.g., {"delta": {"value": "..."}}
-                            d = event.get("delta") or {}
-                            delta_text = d.get("value") or d.get("text") or ""
-                            if not delta_text:
-                                data = event.get("data") or {}
-                                # Try nested content blocks
-                                content = data.get("content") or []
-                                for block in content:
-                                    val = (
-                                        block.get("text", {}).get("value")
-                                        if isinstance(block.get("text"), dict)
-                                        else block.get("value")
-                                    )
-                                    if isinstance(val, str) and val:
-                                        delta_text = val
-                                        break
-                    except Exception:
-                        pass
-
-                if delta_text:
-                    work_messages = append_to_last_assistant(work_messages, delta_text)
-                    yield "", list(work_messages)
-
-            # Final run status
-            run = stream.get_final_run()
+        # Stream managers send their request on enter; admit first (the SDK retries 429s itself)
+        lane = _run_lane(task)
+        limiter.acquire(lane, estimate_tokens(lane, [{"role": "user", "content": message}]), session.session_id)
+        stream_manager = settings.sdk_retrying(settings.client).beta.threads.runs.stream(
+            thread_id=session.thread_id, assistant_id=session.assistant_id
+        )
+        # Each pass consumes one stream; a `requires_action` run continues on a
+        # new stream opened by submitting the tool outputs.
+        while stream_manager is not None:
+            required_tool_calls: List[Any] = []
+            timer.stream_opened()
+            with stream_manager as stream:
+                for event in stream:
+                    timer.event()
+                    emit, tool_calls = _consume_stream_event(event, buf, coalescer, completed)
+                    if tool_calls is not None:
+                        required_tool_calls = tool_calls
+                    elif emit:
+                        timer.delta()
+                        yield "", buf.snapshot()
+
+                # Final run status for this pass
+                run = stream.get_final_run()
+
+            stream_manager = None
+            if run.status == "requires_action":
+                if not buf.text:
+                    yield "", buf.snapshot(placeholder="_Searching the web..._")
+                tool_outputs = _run_tool_calls(required_tool_calls)
+                if tool_outputs:
+                    limiter.acquire(lane, _tool_output_tokens(lane, tool_outputs), session.session_id)
+                    stream_manager = settings.sdk_retrying(settings.client).beta.threads.runs.submit_tool_outputs_stream(
+                        thread_id=session.thread_id,
+                        run_id=run.id,
+                        tool_outputs=tool_outputs,
+                    )
+                else:
+                    # Nothing to submit: end the run, or it blocks the thread until it expires
+                    _cancel_unanswered_run(session, run.id)
     except Exception as e:
-        print(f"Error during streaming: {e}")
-        work_messages = append_to_last_assistant(work_messages, f"Error: The assistant failed to stream. {e}")
-        yield "", work_messages
+        _stream_failed(session, buf, e)
+        yield "", buf.snapshot()
         return
 
     if run.status == "completed":
-        # Ensure final text is complete (in case some tokens weren't emitted as deltas)
-        try:
-            thread_messages = settings.client.beta.threads.messages.list(thread_id=state.thread_id)
-            assistant_message = thread_messages.data[0]
-            final_reply = extract_text_blocks_from_assistant(assistant_message)
-            # Replace last assistant content with final
-            work_messages[-1]["content"] = final_reply
-        except Exception as e:
-            settings.dprint(f"Error fetching final message after stream: {e}")
-        yield "", work_messages
+        # The completed-message events carry the final text; fetch only if none arrived
+        if not _finalize_streamed_text(buf, completed):
+            try:
+                buf.set_text(_latest_message_text(session, "assistant"))
+            except Exception as e:
+                settings.dprint(f"Error fetching final message after stream: {e}")
+        timer.finish()
+        yield "", buf.snapshot()
     else:
-        err = f"Run failed with status: {run.status}."
-        if getattr(run, "last_error", None):
-            err += f" Details: {run.last_error.message}"
-        work_messages = append_to_last_assistant(work_messages, err)
-        yield "", work_messages
+        buf.append(_run_failed_text(run))
+        yield "", buf.snapshot()
 
 
 def chat_entry(
@@ -376,6 +732,7 @@ def chat_entry(
     task: str,
     enabled_tools: List[str],
     stream: bool,
+    request: gr.Request | None = None,
 ):
     """Entry point used by the UI. If stream=True, yields streaming updates.
 
@@ -383,24 +740,191 @@ def chat_entry(
     yields output tuples matching the outputs spec. Returning a generator object
     (instead of yielding) causes a ValueError about output arity.
     """
-    # Messages-only model: sanitize incoming history for robustness
-    history_messages: List[dict] = sanitize_messages(history)
+    session = state.get_session(request)
+    # Messages-only model: sanitize incoming history for robustness (incrementally per session)
+    history_messages: List[dict] = session.normalizer.sanitize(history)
+
+    local_path = None
+    if has_tables(task, session):
+        # Uploaded CSV/XLSX tables are answered locally through the query_table tool
+        local_path = table_stream_chat
+    elif embedding_enabled(task):
+        # Sentence Similarity from embeddings; the chat model is only used for /explain
+        local_path = similarity_stream_chat
+    elif uses_local_retrieval(task, session, enabled_tools):
+        # Documents in the local index: retrieved chunks stream through Chat Completions
+        local_path = responses_stream_chat
+    if local_path is not None:
+        out_messages = history_messages
+        for _, out_messages in local_path(message, history_messages, task, session):
+            if stream:
+                yield "", out_messages
+        if not stream:
+            return "", out_messages
+        return
 
     if stream:
         # If no tools are enabled, use the simpler Responses API streaming path
         if not enabled_tools:
-            for _, out_messages in responses_stream_chat(message, history_messages, task):
+            for _, out_messages in responses_stream_chat(message, history_messages, task, session):
                 yield "", out_messages
             return
-        # If Web Search is enabled, fall back to non-streaming (function tool requires action loop)
-        if "Web Search" in enabled_tools:
-            _, out_messages = chat_fn(message, history_messages, task, enabled_tools)
-            yield "", out_messages
-            return
-        # Otherwise, use Assistants streaming (supports file_search), messages-based
-        for _, out_messages in chat_fn_streaming(message, history_messages, task, enabled_tools):
+        # Otherwise, use Assistants streaming (supports file_search and the web_search function tool)
+        for _, out_messages in chat_fn_streaming(message, history_messages, task, enabled_tools, session):
             yield "", out_messages
         return
     # Non-streaming path
-    _, out_messages = chat_fn(message, history_messages, task, enabled_tools)
+    _, out_messages = chat_fn(message, history_messages, task, enabled_tools, session)
     return "", out_messages
+
+
+async def chat_fn_streaming_async(
+    message: str,
+    history_messages: List[dict],
+    task: str,
+    enabled_tools: List[str],
+    session: SessionState | None = None,
+) -> AsyncIterator[tuple[str, List[dict]]]:
+    """Async generator version of `chat_fn_streaming` on `settings.async_client`.
+
+    Waiting on the stream does not pin a worker thread; only assistant/thread
+    resolution (usually a pool hit) runs in a thread.
+    """
+    session = session or state.get_session()
+    timer = metrics.StreamTimer("assistant_async")
+    with metrics.span("ensure", "assistant_async"):
+        ok, history_messages = await asyncio.to_thread(
+            _ensure_assistant_and_thread, session, task, enabled_tools, history_messages, message
+        )
+    if not ok:
+        yield "", history_messages
+        return
+    aclient = settings.async_client
+
+    # Add the user's message and prime the assistant reply in history
+    try:
+        with metrics.span("message_create", "assistant_async"):
+            await limiter.acall(
+                aclient.beta.threads.messages.create,
+                thread_id=session.thread_id,
+                role="user",
+                content=message,
+                session_id=session.session_id,
+            )
+    except Exception as e:
+        print(f"Error adding message to thread: {e}")
+        msgs = messages_append_user(list(history_messages or []), message)
+        msgs = messages_append_assistant(msgs, f"Error: Could not process your message. {e}")
+        yield "", msgs
+        return
+
+    buf = StreamingMessageBuffer(history_messages, message)
+    coalescer = UpdateCoalescer()
+    completed: List[str] = []
+
+    try:
+        settings.dprint(f"Streaming (async) Assistant {session.assistant_id} on Thread {session.thread_id}...")
+        yield "", buf.snapshot(placeholder="...")
+
+        lane = _run_lane(task)
+        await limiter.acquire_async(
+            lane, estimate_tokens(lane, [{"role": "user", "content": message}]), session.session_id
+        )
+        stream_manager = settings.sdk_retrying(aclient).beta.threads.runs.stream(
+            thread_id=session.thread_id, assistant_id=session.assistant_id
+        )
+        while stream_manager is not None:
+            required_tool_calls: List[Any] = []
+            timer.stream_opened()
+            async with stream_manager as stream:
+                async for event in stream:
+                    timer.event()
+                    emit, tool_calls = _consume_stream_event(event, buf, coalescer, completed)
+                    if tool_calls is not None:
+                        required_tool_calls = tool_calls
+                    elif emit:
+                        timer.delta()
+                        yield "", buf.snapshot()
+
+                run = await stream.get_final_run()
+
+            stream_manager = None
+            if run.status == "requires_action":
+                if not buf.text:
+                    yield "", buf.snapshot(placeholder="_Searching the web..._")
+                tool_outputs = await _run_tool_calls_async(required_tool_calls)
+                if tool_outputs:
+                    await limiter.acquire_async(lane, _tool_output_tokens(lane, tool_outputs), session.session_id)
+                    stream_manager = settings.sdk_retrying(aclient).beta.threads.runs.submit_tool_outputs_stream(
+                        thread_id=session.thread_id,
+                        run_id=run.id,
+                        tool_outputs=tool_outputs,
+                    )
+                else:
+                    await _cancel_unanswered_run_async(session, run.id)
+    except Exception as e:
+        _stream_failed(session, buf, e)
+        yield "", buf.snapshot()
+        return
+
+    if run.status == "completed":
+        # The completed-message events carry the final text; fetch only if none arrived
+        if not _finalize_streamed_text(buf, completed):
+            try:
+                with metrics.span("final_messages_list", "assistant_async"):
+                    page = await limiter.acall(
+                        aclient.beta.threads.messages.list,
+                        thread_id=session.thread_id,
+                        limit=1,
+                        order="desc",
+                        session_id=session.session_id,
+                    )
+                buf.set_text(extract_text_blocks_from_assistant(page.data[0]))
+            except Exception as e:
+                settings.dprint(f"Error fetching final message after stream: {e}")
+        timer.finish()
+        yield "", buf.snapshot()
+    else:
+        buf.append(_run_failed_text(run))
+        yield "", buf.snapshot()
+
+
+async def chat_entry_async(
+    message: str,
+    history: List[Any],
+    task: str,
+    enabled_tools: List[str],
+    stream: bool,
+    request: gr.Request | None = None,
+):
+    """Async generator counterpart of `chat_entry` used by the UI when ASYNC_CHAT is on."""
+    session = state.get_session(request)
+    history_messages: List[dict] = session.normalizer.sanitize(history)
+
+    local_path = None
+    if has_tables(task, session):
+        local_path = table_stream_chat_async
+    elif embedding_enabled(task):
+        local_path = similarity_stream_chat_async
+    elif uses_local_retrieval(task, session, enabled_tools):
+        local_path = responses_stream_chat_async
+    if local_path is not None:
+        out_messages = history_messages
+        async for _, out_messages in local_path(message, history_messages, task, session):
+            if stream:
+                yield "", out_messages
+        if not stream:
+            yield "", out_messages
+        return
+
+    if stream:
+        if not enabled_tools:
+            async for _, out_messages in responses_stream_chat_async(message, history_messages, task, session):
+                yield "", out_messages
+            return
+        async for _, out_messages in chat_fn_streaming_async(message, history_messages, task, enabled_tools, session):
+            yield "", out_messages
+        return
+    # Non-streaming path keeps the polling implementation, off the event loop
+    _, out_messages = await asyncio.to_thread(chat_fn, message, history_messages, task, enabled_tools, session)
+    yield "", out_messages
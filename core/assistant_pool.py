@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+import config.settings as settings
+from core.rate_limit import limiter
+
+
+def assistant_key(instructions: str, model: str, tools: List[dict], vector_store_ids: List[str]) -> str:
+    """Content address of an assistant configuration."""
+    payload = {
+        "account": settings.account_fingerprint(),
+        "instructions": instructions,
+        "model": model,
+        "tools": tools,
+        "vector_store_ids": sorted(vector_store_ids),
+    }
+    blob = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class AssistantPool:
+    """Registry of created assistants keyed by the hash of their configuration.
+
+    Identical (instructions, model, tools, vector stores) reuse one assistant,
+    so task or tool toggles become a dictionary lookup instead of an API
+    round-trip. Entries not used by any run for longer than `idle_ttl_seconds`
+    are deleted by a background thread.
+    """
+
+    def __init__(self, path: str | None, idle_ttl_seconds: float, cleanup_interval_seconds: float) -> None:
+        self.path = path
+        self.idle_ttl_seconds = float(idle_ttl_seconds)
+        self.cleanup_interval_seconds = float(cleanup_interval_seconds)
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # One lock per key so concurrent sessions don't create duplicates
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._cleanup_thread: threading.Thread | None = None
+        self._load()
+
+    # --- Persistence ---
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            if isinstance(data, dict):
+                self._entries = {k: v for k, v in data.items() if isinstance(v, dict) and v.get("assistant_id")}
+            settings.dprint(f"Loaded {len(self._entries)} pooled assistants from {self.path}")
+        except Exception as e:
+            print(f"Warning: could not load assistant pool from {self.path}: {e}")
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self._entries, fh)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Warning: could not persist assistant pool to {self.path}: {e}")
+
+    # --- Lookup / creation ---
+    def acquire(
+        self,
+        *,
+        instructions: str,
+        model: str,
+        tools: List[dict],
+        vector_store_ids: List[str],
+        name: str = "Multi-Task Chatbot",
+    ) -> str:
+        """Return the ID of an assistant matching the configuration, creating it once if needed."""
+        key = assistant_key(instructions, model, tools, vector_store_ids)
+        self._ensure_cleanup_thread()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+                return entry["assistant_id"]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another session may have created it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["last_used"] = time.time()
+                    return entry["assistant_id"]
+
+            tool_resources = None
+            if vector_store_ids:
+                tool_resources = {"file_search": {"vector_store_ids": list(vector_store_ids)}}
+            assistant = limiter.call(
+                settings.client.beta.assistants.create,
+                name=name,
+                instructions=instructions,
+                tools=tools,
+                model=model,
+                tool_resources=tool_resources,
+            )
+            now = time.time()
+            with self._lock:
+                self._entries[key] = {
+                    "assistant_id": assistant.id,
+                    "account": settings.account_fingerprint(),
+                    "created_at": now,
+                    "last_used": now,
+                }
+                self._key_locks.pop(key, None)
+                self._save_locked()
+            return assistant.id
+
+    def touch(self, assistant_id: str | None) -> None:
+        """Mark a pooled assistant as in use (called on every run so live sessions keep it alive)."""
+        if not assistant_id:
+            return
+        now = time.time()
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.get("assistant_id") == assistant_id:
+                    entry["last_used"] = now
+
+    def invalidate(self, assistant_id: str | None) -> None:
+        """Forget an assistant (e.g. it was deleted outside this process)."""
+        if not assistant_id:
+            return
+        with self._lock:
+            stale = [k for k, v in self._entries.items() if v.get("assistant_id") == assistant_id]
+            for k in stale:
+                self._entries.pop(k, None)
+            if stale:
+                self._save_locked()
+
+    # --- Background cleanup ---
+    def _ensure_cleanup_thread(self) -> None:
+        if self._cleanup_thread is not None or self.idle_ttl_seconds <= 0:
+            return
+        with self._lock:
+            if self._cleanup_thread is not None:
+                return
+            self._cleanup_thread = threading.Thread(
+                target=self._cleanup_loop, name="assistant-pool-cleanup", daemon=True
+            )
+            self._cleanup_thread.start()
+
+    def _cleanup_loop(self) -> None:
+        while True:
+            time.sleep(max(1.0, self.cleanup_interval_seconds))
+            try:
+                self.cleanup_idle()
+            except Exception as e:
+                settings.dprint(f"Assistant pool cleanup failed: {e}")
+
+    def cleanup_idle(self) -> int:
+        """Delete assistants of the current account that have been idle past the TTL."""
+        if settings.client is None:
+            return 0
+        account = settings.account_fingerprint()
+        cutoff = time.time() - self.idle_ttl_seconds
+        with self._lock:
+            expired = [
+                (k, v["assistant_id"])
+                for k, v in self._entries.items()
+                if v.get("account") == account and float(v.get("last_used", 0)) < cutoff
+            ]
+        removed = 0
+        for key, assistant_id in expired:
+            # Unpool before deleting, unless a run touched it since the scan
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None or float(entry.get("last_used", 0)) >= cutoff:
+                    continue
+                self._entries.pop(key)
+                self._save_locked()
+            try:
+                limiter.call(settings.client.beta.assistants.delete, assistant_id)
+            except Exception as e:
+                # Already gone remotely is fine; anything else is put back and retried next cycle
+                if getattr(e, "status_code", None) != 404:
+                    settings.dprint(f"Could not delete pooled assistant {assistant_id}: {e}")
+                    with self._lock:
+                        self._entries.setdefault(key, entry)
+                        self._save_locked()
+                    continue
+            removed += 1
+        if removed:
+            settings.dprint(f"Assistant pool: removed {removed} idle assistants.")
+        return removed
+
+
+pool = AssistantPool(
+    settings.ASSISTANT_POOL_PATH,
+    settings.ASSISTANT_POOL_IDLE_TTL_SECONDS,
+    settings.ASSISTANT_POOL_CLEANUP_INTERVAL_SECONDS,
+)
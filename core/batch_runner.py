@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Iterator, List
+
+import config.settings as settings
+from config.prompts import SYS_PROMPTS
+from core.rate_limit import RateLimitShed, estimate_tokens, limiter, retry_after_seconds
+
+
+def build_task_messages(task: str, text: str) -> List[Dict[str, str]]:
+    """Single-turn Chat Completions payload for `task`, using the same system prompts as the UI."""
+    instructions = SYS_PROMPTS.get(task, "You are a helpful assistant.")
+    return [
+        {"role": "system", "content": instructions},
+        {"role": "user", "content": text},
+    ]
+
+
+def task_model(task: str) -> tuple[str, float]:
+    cfg = settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"})
+    return cfg.get("model", "gpt-4o-mini"), float(cfg.get("temperature", 0.0))
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Yield raw records (dicts) from a JSONL or CSV file (a UTF-8 BOM, as Excel writes, is ignored)."""
+    is_csv = path.lower().endswith(".csv")
+    with open(path, "r", encoding="utf-8-sig", newline="") as fh:
+        records = csv.DictReader(fh) if is_csv else (json.loads(line) for line in fh if line.strip())
+        yield from records
+
+
+def row_id(record: Dict[str, Any], id_field: str, index: int) -> str:
+    """The record's id, or its 0-based index so resumes are stable while the input is unchanged."""
+    value = record.get(id_field)
+    return str(value) if value not in (None, "") else str(index)
+
+
+def field(record: Dict[str, Any], name: str, index: int) -> str:
+    """The record's `name` value as text; a missing field is an error rather than an empty prompt."""
+    if name not in record:
+        raise ValueError(f"row {index} has no '{name}' field (found: {', '.join(map(str, record)) or 'none'})")
+    value = record[name]
+    return "" if value is None else str(value)
+
+
+def read_rows(path: str, input_field: str = "input", id_field: str = "id") -> Iterator[Dict[str, Any]]:
+    """Yield {"id", "input"} rows from a JSONL or CSV file (see `row_id`)."""
+    for index, record in enumerate(read_records(path)):
+        yield {"id": row_id(record, id_field, index), "input": field(record, input_field, index)}
+
+
+def ends_with_newline(path: str) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return True
+    with open(path, "rb") as fh:
+        fh.seek(-1, os.SEEK_END)
+        return fh.read(1) == b"\n"
+
+
+def completed_ids(output_path: str) -> set[str]:
+    """IDs already written to `output_path` without an error (used to resume).
+
+    Error records and partially written lines are dropped from the file, so the
+    rows that are retried end up with a single record each.
+    """
+    done: set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    kept: List[str] = []
+    dropped = 0
+    with open(output_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                dropped += line.strip() != ""  # a partially written last line from an interrupted run
+                continue
+            if record.get("error") is None and "id" in record and str(record["id"]) not in done:
+                done.add(str(record["id"]))
+                kept.append(line if line.endswith("\n") else line + "\n")
+            else:
+                dropped += 1
+    if dropped:
+        tmp = f"{output_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.writelines(kept)
+        os.replace(tmp, output_path)
+    return done
+
+
+class BatchStats:
+    def __init__(self) -> None:
+        self.started = time.monotonic()
+        self.rows = 0
+        self.errors = 0
+        self.skipped = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def summary(self) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        tokens = self.prompt_tokens + self.completion_tokens
+        return (
+            f"{self.rows} rows ({self.errors} errors, {self.skipped} skipped) in {elapsed:.1f}s"
+            f" | {self.rows / elapsed:.2f} rows/s"
+            f" | {tokens / elapsed:.0f} tokens/s ({self.completion_tokens / elapsed:.0f} completion tokens/s)"
+        )
+
+
+async def _complete(task: str, text: str, max_retries: int) -> Any:
+    model, temperature = task_model(task)
+    messages = build_task_messages(task, text)
+    attempt = 0
+    while True:
+        try:
+            await limiter.acquire_async(model, estimate_tokens(model, messages), "batch")
+        except RateLimitShed:
+            # The lane is saturated by our own workers: back off and queue again (not a failed attempt)
+            await asyncio.sleep(random.uniform(0.5, 1.5))
+            continue
+        try:
+            return await settings.async_client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                messages=messages,
+            )
+        except Exception as e:
+            status = getattr(e, "status_code", None)
+            if attempt >= max_retries or status not in (408, 409, 429, 500, 502, 503, 504):
+                raise
+            delay = retry_after_seconds(e) or min(60.0, 2.0**attempt) * random.uniform(0.5, 1.5)
+            attempt += 1
+            if status == 429:
+                limiter.pause(model, delay)  # the limiter holds every worker until the lane resumes
+                continue
+            await asyncio.sleep(delay)
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    task: str,
+    concurrency: int = 8,
+    rpm: float | None = None,
+    input_field: str = "input",
+    id_field: str = "id",
+    max_retries: int = 5,
+    progress_every: int = 100,
+) -> BatchStats:
+    """Run every row of `input_path` through `task` and append JSONL results to `output_path`.
+
+    Rows already present in the output without an error are skipped, so an
+    interrupted run can be resumed by running the same command again (earlier
+    error records are removed first). `rpm`
+    sets the request budget of the task model's rate-limiter lane.
+    """
+    if settings.async_client is None:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    if task not in settings.TASK_CONFIG:
+        raise ValueError(f"Unknown task '{task}'")
+
+    stats = BatchStats()
+    done = completed_ids(output_path)
+    if rpm:
+        limiter.configure(task_model(task)[0], rpm=rpm)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    terminated = ends_with_newline(output_path)
+    with open(output_path, "a", encoding="utf-8") as out:
+        if not terminated:
+            out.write("\n")  # close off a line truncated by an interrupted run
+
+        def write(record: Dict[str, Any]) -> None:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if progress_every and stats.rows % progress_every == 0:
+                print(stats.summary(), flush=True)
+
+        async def worker() -> None:
+            while True:
+                row = await queue.get()
+                if row is None:
+                    return
+                record: Dict[str, Any] = {"id": row["id"], "task": task}
+                try:
+                    resp = await _complete(task, row["input"], max_retries)
+                    record["output"] = resp.choices[0].message.content or ""
+                    record["error"] = None
+                    usage = getattr(resp, "usage", None)
+                    if usage is not None:
+                        stats.prompt_tokens += usage.prompt_tokens or 0
+                        stats.completion_tokens += usage.completion_tokens or 0
+                except Exception as e:
+                    record["output"] = None
+                    record["error"] = str(e)
+                    stats.errors += 1
+                stats.rows += 1
+                write(record)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+        for row in read_rows(input_path, input_field, id_field):
+            if row["id"] in done:
+                stats.skipped += 1
+                continue
+            await queue.put(row)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    print(stats.summary(), flush=True)
+    return stats
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+import config.settings as settings
+from core import metrics
+from core.rate_limit import limiter
+from utils.cache import SQLiteCache, TTLCache
+from utils.token_budget import count_message_tokens
+
+
+def text_key(model: str, text: str) -> str:
+    """Cache key for one embedding: the model plus the SHA-256 of the exact text."""
+    return f"{model}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+def _encode(vector: np.ndarray) -> str:
+    # float32 bytes as base64: compact in memory and JSON-safe for the SQLite backend
+    return base64.b64encode(np.ascontiguousarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode(blob: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(blob), dtype=np.float32)
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def _batches(texts: List[str], model: str) -> Iterator[List[str]]:
+    """Split `texts` into requests of at most EMBEDDING_BATCH_SIZE inputs / EMBEDDING_BATCH_MAX_TOKENS tokens."""
+    batch: List[str] = []
+    tokens = 0
+    for text in texts:
+        n = count_message_tokens(model, {"content": text})
+        if batch and (len(batch) >= settings.EMBEDDING_BATCH_SIZE or tokens + n > settings.EMBEDDING_BATCH_MAX_TOKENS):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += n
+    if batch:
+        yield batch
+
+
+class Embedder:
+    """Batched OpenAI embeddings behind a cache keyed by text hash.
+
+    Vectors are returned L2-normalized, so cosine similarity is a dot product.
+    Repeated texts within a call are embedded once; cached texts not at all.
+    Set EMBEDDING_CACHE_PATH to share the cache between processes (SQLite).
+    """
+
+    def __init__(self) -> None:
+        backend = None
+        if settings.EMBEDDING_CACHE_PATH:
+            backend = SQLiteCache(
+                settings.EMBEDDING_CACHE_PATH,
+                settings.EMBEDDING_CACHE_TTL_SECONDS,
+                max_entries=max(settings.EMBEDDING_CACHE_MAX_ENTRIES, 100_000),
+            )
+        self.cache = TTLCache(settings.EMBEDDING_CACHE_MAX_ENTRIES, settings.EMBEDDING_CACHE_TTL_SECONDS, backend=backend)
+        self.requests = 0
+        self.embedded = 0
+
+    def _lookup(self, texts: Sequence[str], model: str) -> tuple[Dict[str, np.ndarray], List[str]]:
+        """(cached vectors by text, distinct texts still to embed)."""
+        found: Dict[str, np.ndarray] = {}
+        missing: List[str] = []
+        for text in dict.fromkeys(texts):
+            blob = self.cache.get(text_key(model, text)) if settings.EMBEDDING_CACHE_TTL_SECONDS > 0 else None
+            if blob is not None:
+                found[text] = _decode(blob)
+            else:
+                missing.append(text)
+        return found, missing
+
+    def _store(self, found: Dict[str, np.ndarray], batch: List[str], data: List[Any], model: str) -> None:
+        vectors = _unit_rows(np.array([d.embedding for d in sorted(data, key=lambda d: d.index)], dtype=np.float32))
+        fresh = dict(zip(batch, vectors))
+        found.update(fresh)
+        self.requests += 1
+        self.embedded += len(batch)
+        if settings.EMBEDDING_CACHE_TTL_SECONDS > 0:
+            self.cache.set_many({text_key(model, t): _encode(v) for t, v in fresh.items()})
+
+    @staticmethod
+    def _request(batch: List[str], model: str, session_id: str | None) -> Dict[str, Any]:
+        return {
+            "model": model,
+            # The API rejects empty strings
+            "input": [t or " " for t in batch],
+            "lane": model,
+            "tokens": sum(count_message_tokens(model, {"content": t}) for t in batch),
+            "session_id": session_id,
+        }
+
+    def embed(self, texts: Sequence[str], model: str | None = None, session_id: str | None = None) -> np.ndarray:
+        """(len(texts), dim) float32 matrix of unit vectors, in input order."""
+        model = model or settings.EMBEDDING_MODEL
+        found, missing = self._lookup(texts, model)
+        with metrics.span("embed", "embeddings"):
+            for batch in _batches(missing, model):
+                resp = limiter.call(settings.client.embeddings.create, **self._request(batch, model, session_id))
+                self._store(found, batch, resp.data, model)
+        return np.stack([found[t] for t in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+    async def aembed(self, texts: Sequence[str], model: str | None = None, session_id: str | None = None) -> np.ndarray:
+        """Asyncio counterpart of `embed`; up to EMBEDDING_CONCURRENCY batches are in flight."""
+        model = model or settings.EMBEDDING_MODEL
+        found, missing = await asyncio.to_thread(self._lookup, texts, model)
+        gate = asyncio.Semaphore(max(1, settings.EMBEDDING_CONCURRENCY))
+
+        async def one(batch: List[str]) -> None:
+            async with gate:
+                resp = await limiter.acall(settings.async_client.embeddings.create, **self._request(batch, model, session_id))
+            await asyncio.to_thread(self._store, found, batch, resp.data, model)
+
+        with metrics.span("embed", "embeddings_async"):
+            await asyncio.gather(*(one(batch) for batch in _batches(missing, model)))
+        return np.stack([found[t] for t in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict[str, int]:
+        out = self.cache.stats()
+        out["requests"] = self.requests
+        out["embedded"] = self.embedded
+        return out
+
+
+embedder = Embedder()
+metrics.register("chatbot_embedding_cache", "gauge", "Embedding cache and request counters.", "stat", embedder.stats)
@@ -7,27 +7,103 @@ import gradio as gr
 
 import config.settings as settings
 from core.state import reset_session
+from core.ingestion import ingestion
+from core import metrics
+from core import retrieval
+from core.rate_limit import limiter
+from core.tables import table_store
 import os
 from pathlib import Path
 
 
-def upload_files(files: List[os.PathLike | str] | None) -> Tuple[str, Any, Any]:
-    """Uploads files to OpenAI and adds them to a vector store.
+def _normalize_paths(files: List[Any]) -> List[Path]:
+    """Normalize incoming paths from Gradio (may be str or PathLike objects)."""
+    paths: List[Path] = []
+    for f in files:
+        try:
+            if isinstance(f, (str, bytes, os.PathLike)):
+                p = Path(f)
+            else:
+                name_attr = getattr(f, "name", None)
+                p = Path(name_attr) if isinstance(name_attr, str) else None
+            if p is not None:
+                paths.append(p)
+        except Exception:
+            continue
+    return paths
+
+
+def _validate_paths(
+    paths: List[Path], allowed_extensions: Tuple[str, ...] = settings.UPLOAD_ALLOWED_EXTENSIONS
+) -> Tuple[List[Path], List[Tuple[Path, str]]]:
+    """Apply type and size limits using stat() only, before any file is opened.
+
+    Returns (accepted, rejected) where rejected items carry a reason.
+    """
+    max_bytes = settings.UPLOAD_MAX_FILE_MB * 1024 * 1024
+    accepted: List[Path] = []
+    rejected: List[Tuple[Path, str]] = []
+    for p in paths:
+        if allowed_extensions and p.suffix.lower() not in allowed_extensions:
+            rejected.append((p, f"unsupported type '{p.suffix or 'none'}'"))
+            continue
+        try:
+            size = p.stat().st_size
+        except OSError as e:
+            rejected.append((p, f"not readable: {e.strerror or e}"))
+            continue
+        if size > max_bytes:
+            rejected.append((p, f"{size / (1024 * 1024):.1f} MB exceeds {settings.UPLOAD_MAX_FILE_MB:.0f} MB limit"))
+            continue
+        accepted.append(p)
+    return accepted, rejected
+
+
+def _attach_tables(session: Any, paths: List[Path]) -> List[str]:
+    """Register CSV/XLSX files as session tables; parsing starts in the background."""
+    names: List[str] = []
+    for p in paths:
+        name, n = p.stem, 2
+        while name in session.tables and session.tables[name].path != p:
+            name, n = f"{p.stem}_{n}", n + 1
+        session.tables[name] = table_store.register(p, name)
+        names.append(name)
+    return names
+
+
+def upload_files(
+    files: List[os.PathLike | str] | None, request: gr.Request | None = None
+) -> Tuple[str, Any, Any, Any]:
+    """Uploads files to OpenAI and adds them to the session's vector store.
+
+    Returns as soon as an ingestion job is queued (see `core.ingestion`);
+    progress is reported by `ingestion_status`. Files are identified by the
+    SHA-256 of their contents: documents already indexed in the store are
+    skipped, and documents uploaded before are attached by file ID.
 
     Returns a tuple for Gradio outputs:
-    (upload_status_text, tools_checkbox_value, task_radio_value)
+    (upload_status_text, tools_checkbox_value, task_radio_value, status_timer)
+    The status timer is switched on only while an ingestion job is running.
 
     On success: enables File Search and switches task to Document Question Answering.
+    With RETRIEVAL_BACKEND=local, files are indexed in-process instead (see
+    `core.retrieval`) and File Search is left off.
+    Table files (TABLE_EXTENSIONS) are not sent to the vector store: they are
+    parsed locally for Table Question Answering, and an upload of only tables
+    switches to that task instead.
     On no files/error: leaves tool/task unchanged using gr.update().
     """
     # Use a local import to avoid circular import of state at module import time
     from core import state
 
+    session = state.get_session(request)
+
     if not files:
         return (
             "No files selected. Please upload at least one file.",
             gr.update(),
             gr.update(),
+            gr.update(),
         )
 
     try:
@@ -37,60 +113,79 @@ def upload_files(files: List[os.PathLike | str] | None) -> Tuple[str, Any, Any]:
                 "Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'.",
                 gr.update(),
                 gr.update(),
+                gr.update(),
             )
-        # Create a vector store
-        vs = settings.client.vector_stores.create(name=f"chatbot_store_{int(time.time())}")
-        state.vector_store_id = vs.id
-
-        # Normalize incoming paths from Gradio (may be str or PathLike objects)
-        paths: List[Path] = []
-        for f in files:
-            try:
-                if isinstance(f, (str, bytes, os.PathLike)):
-                    p = Path(f)
-                else:
-                    name_attr = getattr(f, "name", None)
-                    p = Path(name_attr) if isinstance(name_attr, str) else None
-                if p is not None:
-                    paths.append(p)
-            except Exception:
-                continue
 
+        paths = _normalize_paths(files)
         if not paths:
             return (
                 "No valid file paths were provided.",
                 gr.update(),
                 gr.update(),
+                gr.update(),
             )
 
-        # Open files and ensure they are always closed
-        file_streams = []
-        try:
-            for p in paths:
-                file_streams.append(open(str(p), "rb"))
-
-            print(
-                f"Uploading {len(paths)} files to new Vector Store: {state.vector_store_id}"
+        table_note = ""
+        if settings.TABLE_QA_ENABLED:
+            table_paths = [p for p in paths if p.suffix.lower() in settings.TABLE_EXTENSIONS]
+            paths = [p for p in paths if p.suffix.lower() not in settings.TABLE_EXTENSIONS]
+            table_paths, table_rejected = _validate_paths(table_paths, settings.TABLE_EXTENSIONS)
+            names = _attach_tables(session, table_paths)
+            if names:
+                table_note = f"Loaded {len(names)} table(s) for Table Question Answering: {', '.join(names)}"
+            if table_rejected:
+                table_note += "\nTables rejected: " + "; ".join(f"{p.name}: {why}" for p, why in table_rejected)
+            table_note = table_note.strip()
+            if not paths and table_note:
+                return table_note, gr.update(), "Table Question Answering" if names else gr.update(), gr.update()
+
+        paths, rejected = _validate_paths(paths)
+        if not paths:
+            reasons = "; ".join(f"{p.name}: {why}" for p, why in rejected)
+            return (
+                f"No files accepted. {reasons}",
+                gr.update(),
+                gr.update(),
+                gr.update(),
             )
 
-            # Upload and poll
-            file_batch = settings.client.vector_stores.file_batches.upload_and_poll(
-                vector_store_id=state.vector_store_id, files=file_streams
+        if retrieval.enabled():
+            # Local index: nothing to create remotely; answers stream through Chat Completions
+            job = ingestion.submit_local(session, paths, rejected)
+            session.ingestion_job_id = job.id
+            print(f"Ingestion job {job.id}: {len(paths)} files into the local retrieval index")
+            return (
+                job.summary() + (f"\n{table_note}" if table_note else ""),
+                [],
+                "Chat with Document",
+                gr.Timer(active=True),
             )
-        finally:
-            for stream in file_streams:
-                try:
-                    stream.close()
-                except Exception:
-                    pass
 
-        # Reset current assistant to force recreation with new vector store
-        reset_session()
+        # Reuse the session's vector store; create one only for the first upload
+        new_store = session.vector_store_id is None
+        if new_store:
+            with metrics.span("vector_store_create", "upload"):
+                vs = limiter.call(
+                    settings.client.vector_stores.create,
+                    name=f"chatbot_store_{int(time.time())}",
+                    session_id=session.session_id,
+                )
+            session.vector_store_id = vs.id
+
+        # Upload/index in the background; file_search sees each file as soon as it is ready
+        job = ingestion.submit(session.vector_store_id, paths, rejected)
+        session.ingestion_job_id = job.id
+        print(f"Ingestion job {job.id}: {len(paths)} files into Vector Store {session.vector_store_id}")
+
+        # A new store must be attached to the assistant; an existing one already is
+        if new_store:
+            reset_session(request)
 
         return (
-            f"Uploaded {len(paths)} files. Vector Store Status: {file_batch.status}",
+            job.summary() + (f"\n{table_note}" if table_note else ""),
             ["File Search"],
             "Chat with Document",
+            gr.Timer(active=True),
         )
 
     except Exception as e:
@@ -99,4 +194,20 @@ def upload_files(files: List[os.PathLike | str] | None) -> Tuple[str, Any, Any]:
             f"An error occurred: {e}",
             gr.update(),
             gr.update(),
+            gr.update(),
         )
+
+
+def ingestion_status(request: gr.Request | None = None) -> Tuple[Any, Any]:
+    """(progress text, timer update) for the session's latest ingestion job (polled by the UI)."""
+    from core import state
+
+    session = state.get_session(request)
+    job = ingestion.get(session.ingestion_job_id)
+    if job is None:
+        return gr.update(), gr.Timer(active=False)
+    if job.done:
+        # Report the final state once, then stop polling until the next upload
+        session.ingestion_job_id = None
+        return job.summary(), gr.Timer(active=False)
+    return job.summary(), gr.update()
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import config.settings as settings
+from core import metrics
+from core.rate_limit import limiter
+from core.retrieval import retriever
+from core.state import SessionState
+from core.upload_manifest import file_sha256, manifest
+
+# Per-file lifecycle
+QUEUED = "queued"
+UPLOADED = "uploaded"
+INDEXING = "indexing"
+READY = "ready"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+_FINAL_STATES = (READY, FAILED, SKIPPED)
+
+# Placeholder store ID for jobs indexed by the local retrieval backend
+LOCAL_STORE = "local"
+
+
+class IngestionJob:
+    """Progress of one upload click: a status per file, updated by worker threads."""
+
+    def __init__(self, vector_store_id: str, paths: List[Path]) -> None:
+        self.id = uuid.uuid4().hex[:12]
+        self.vector_store_id = vector_store_id
+        self.created_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+        self._seen_hashes: set[str] = set()
+        self.files: "OrderedDict[str, dict]" = OrderedDict(
+            (str(p), {"name": p.name, "status": QUEUED, "error": None}) for p in paths
+        )
+
+    def set_status(self, path: Path, status: str, error: str | None = None) -> None:
+        with self._lock:
+            entry = self.files[str(path)]
+            entry["status"] = status
+            entry["error"] = error
+            if self.finished_at is None and all(f["status"] in _FINAL_STATES for f in self.files.values()):
+                self.finished_at = time.monotonic()
+
+    def add_bytes(self, n: int) -> None:
+        with self._lock:
+            self.bytes_uploaded += n
+
+    def throughput(self) -> Tuple[float, float]:
+        """(MB/s uploaded, files/s ready) since the job was queued."""
+        with self._lock:
+            end = self.finished_at or time.monotonic()
+            elapsed = max(end - self.created_at, 1e-6)
+            ready = sum(1 for f in self.files.values() if f["status"] == READY)
+            return self.bytes_uploaded / (1024 * 1024) / elapsed, ready / elapsed
+
+    def claim_hash(self, sha: str) -> bool:
+        """Return False if another file of this job has the same contents."""
+        with self._lock:
+            if sha in self._seen_hashes:
+                return False
+            self._seen_hashes.add(sha)
+            return True
+
+    @property
+    def done(self) -> bool:
+        with self._lock:
+            return all(f["status"] in _FINAL_STATES for f in self.files.values())
+
+    def counts(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        with self._lock:
+            for f in self.files.values():
+                out[f["status"]] = out.get(f["status"], 0) + 1
+        return out
+
+    def summary(self) -> str:
+        counts = self.counts()
+        total = len(self.files)
+        head = (
+            f"Job {self.id}: {counts.get(READY, 0)}/{total} ready"
+            f", {counts.get(INDEXING, 0) + counts.get(UPLOADED, 0)} indexing"
+            f", {counts.get(QUEUED, 0)} queued"
+        )
+        if counts.get(SKIPPED):
+            head += f", {counts[SKIPPED]} skipped (duplicate or already indexed)"
+        if counts.get(FAILED):
+            head += f", {counts[FAILED]} failed"
+        mb_s, files_s = self.throughput()
+        head += f" | {mb_s:.2f} MB/s, {files_s:.2f} files/s"
+        head += " (done)" if self.done else ""
+        with self._lock:
+            lines = [head]
+            for f in self.files.values():
+                line = f"- {f['name']}: {f['status']}"
+                if f["error"]:
+                    line += f" ({f['error']})"
+                lines.append(line)
+        return "\n".join(lines)
+
+
+class IngestionManager:
+    """Runs file uploads/indexing on a bounded pool so the UI request returns immediately."""
+
+    def __init__(self, max_workers: int, max_jobs: int = 256) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._max_jobs = max_jobs
+        self._lock = threading.Lock()
+        # (vector_store_id, sha256) being attached right now, across all jobs
+        self._in_flight: set[Tuple[str, str]] = set()
+
+    def submit(
+        self,
+        vector_store_id: str,
+        paths: List[Path],
+        rejected: List[Tuple[Path, str]] | None = None,
+    ) -> IngestionJob:
+        """Queue `paths` for ingestion; `rejected` files are listed as failed with their reason.
+
+        Files are opened only inside workers, so at most `max_workers` are open at once.
+        """
+        job = self._new_job(vector_store_id, paths, rejected)
+        for p in paths:
+            self._executor.submit(self._ingest_one, job, p)
+        return job
+
+    def submit_local(
+        self,
+        session: SessionState,
+        paths: List[Path],
+        rejected: List[Tuple[Path, str]] | None = None,
+    ) -> IngestionJob:
+        """Queue `paths` for the local retrieval index; each ready file is added to `session`'s documents."""
+        job = self._new_job(LOCAL_STORE, paths, rejected)
+        for p in paths:
+            self._executor.submit(self._index_local_one, job, p, session)
+        return job
+
+    def _new_job(self, vector_store_id: str, paths: List[Path], rejected: List[Tuple[Path, str]] | None) -> IngestionJob:
+        rejected = rejected or []
+        job = IngestionJob(vector_store_id, list(paths) + [p for p, _ in rejected])
+        for p, reason in rejected:
+            job.set_status(p, FAILED, reason)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str | None) -> IngestionJob | None:
+        if not job_id:
+            return None
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _claim(self, vector_store_id: str, sha: str) -> bool:
+        """Reserve `sha` for attaching to the store; False if it is indexed there or another worker has it."""
+        key = (vector_store_id, sha)
+        with self._lock:
+            if key in self._in_flight or sha in manifest.store_hashes(vector_store_id):
+                return False
+            self._in_flight.add(key)
+            return True
+
+    def _ingest_one(self, job: IngestionJob, path: Path) -> None:
+        claimed: Tuple[str, str] | None = None
+        try:
+            with metrics.span("hash", "upload"):
+                sha = file_sha256(path)
+            # Checked at run time, not submit time, so concurrent jobs on one store never attach a file twice
+            if not job.claim_hash(sha) or not self._claim(job.vector_store_id, sha):
+                job.set_status(path, SKIPPED)
+                return
+            claimed = (job.vector_store_id, sha)
+            file_id = self._upload_or_reuse(job, path, sha)
+            job.set_status(path, INDEXING)
+            with metrics.span("index", "upload"):
+                vs_file = self._wait_indexed(job.vector_store_id, file_id)
+            if vs_file.status == "completed":
+                manifest.add_to_store(job.vector_store_id, sha)
+                job.set_status(path, READY)
+            else:
+                err = getattr(getattr(vs_file, "last_error", None), "message", None)
+                job.set_status(path, FAILED, err or vs_file.status)
+        except Exception as e:
+            print(f"Error ingesting {path}: {e}")
+            job.set_status(path, FAILED, str(e))
+        finally:
+            if claimed is not None:
+                with self._lock:
+                    self._in_flight.discard(claimed)
+
+    def _index_local_one(self, job: IngestionJob, path: Path, session: SessionState) -> None:
+        try:
+            with metrics.span("hash", "upload"):
+                sha = file_sha256(path)
+            if session.has_document(sha) or not job.claim_hash(sha):
+                job.set_status(path, SKIPPED)
+                return
+            job.set_status(path, INDEXING)
+            with metrics.span("index", "upload"):
+                reused = retriever.build(path, sha, session.session_id)
+            if not reused:
+                job.add_bytes(path.stat().st_size)
+            session.add_document(sha, path.name)
+            job.set_status(path, READY)
+        except Exception as e:
+            print(f"Error indexing {path} locally: {e}")
+            job.set_status(path, FAILED, str(e))
+
+    @staticmethod
+    def _wait_indexed(vector_store_id: str, file_id: str) -> Any:
+        """Poll the file's indexing status until it leaves in_progress; each GET is admitted by the limiter.
+
+        Raises TimeoutError after UPLOAD_INDEX_TIMEOUT_SECONDS so a stuck file releases its worker.
+        """
+        delay = settings.RUN_POLL_INITIAL_DELAY_SECONDS
+        deadline = time.monotonic() + settings.UPLOAD_INDEX_TIMEOUT_SECONDS
+        while True:
+            vs_file = limiter.call(
+                settings.client.vector_stores.files.retrieve, file_id, vector_store_id=vector_store_id
+            )
+            if vs_file.status != "in_progress":
+                return vs_file
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"indexing did not finish within {settings.UPLOAD_INDEX_TIMEOUT_SECONDS:.0f}s")
+            time.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, settings.RUN_POLL_MAX_DELAY_SECONDS)
+
+    def _upload_or_reuse(self, job: IngestionJob, path: Path, sha: str) -> str:
+        """Attach the file to the job's store, uploading only unseen contents. Returns the file ID."""
+        file_id = manifest.file_id(sha)
+        if file_id:
+            try:
+                limiter.call(
+                    settings.client.vector_stores.files.create, vector_store_id=job.vector_store_id, file_id=file_id
+                )
+                return file_id
+            except Exception as e:
+                # The remote file may have been deleted; fall back to a fresh upload
+                settings.dprint(f"Re-attaching {path.name} ({file_id}) failed, re-uploading: {e}")
+                manifest.forget_file(sha)
+
+        with open(str(path), "rb") as fh:
+
+            def create() -> Any:
+                fh.seek(0)  # a 429 retry must send the whole file again
+                return settings.client.files.create(file=fh, purpose="assistants")
+
+            with metrics.span("upload", "upload"):
+                uploaded = limiter.call(create)
+        size = path.stat().st_size
+        manifest.record_file(sha, uploaded.id, path.name, size)
+        job.add_bytes(size)
+        job.set_status(path, UPLOADED)
+        limiter.call(settings.client.vector_stores.files.create, vector_store_id=job.vector_store_id, file_id=uploaded.id)
+        return uploaded.id
+
+
+ingestion = IngestionManager(settings.UPLOAD_CONCURRENCY)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import config.settings as settings
+
+# Seconds; covers sub-10ms API hops up to multi-minute runs
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for labelvalues, series in sorted(snapshot.items()):
+            base = list(zip(self.labelnames, labelvalues))
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(base + [('le', repr(bound))])} {cumulative:.0f}")
+            lines.append(f"{self.name}_bucket{_labels(base + [('le', '+Inf')])} {series[-1]:.0f}")
+            lines.append(f"{self.name}_sum{_labels(base)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(base)} {series[-1]:.0f}")
+        return lines
+
+
+# Timing spans on the chat and upload hot paths, labelled by span name and code path
+SPANS = Histogram(
+    "chatbot_span_seconds",
+    "Duration of chat and upload pipeline phases.",
+    ("span", "path"),
+)
+
+# (metric name, type, help, label name, values callback) sampled at scrape time
+_collectors: List[Tuple[str, str, str, str, Callable[[], Dict[str, float]]]] = []
+_NOOP = nullcontext()
+
+
+@contextmanager
+def _timed(span_name: str, path: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPANS.observe(time.perf_counter() - start, span_name, path)
+
+
+def span(span_name: str, path: str = ""):
+    """Context manager timing a block into `chatbot_span_seconds`; a shared no-op when metrics are off."""
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _timed(span_name, path)
+
+
+def observe(span_name: str, seconds: float, path: str = "") -> None:
+    """Record a duration measured by the caller (e.g. time to first delta)."""
+    if settings.METRICS_ENABLED:
+        SPANS.observe(seconds, span_name, path)
+
+
+class StreamTimer:
+    """Per-reply marks for a streamed answer: run start (first stream event) and time to first delta."""
+
+    __slots__ = ("path", "on", "started", "opened", "saw_event", "saw_delta")
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.on = settings.METRICS_ENABLED
+        self.started = time.perf_counter() if self.on else 0.0
+        self.opened = self.started
+        self.saw_event = False
+        self.saw_delta = False
+
+    def stream_opened(self) -> None:
+        if self.on:
+            self.opened = time.perf_counter()
+            self.saw_event = False
+
+    def event(self) -> None:
+        if self.on and not self.saw_event:
+            self.saw_event = True
+            SPANS.observe(time.perf_counter() - self.opened, "run_start", self.path)
+
+    def delta(self) -> None:
+        if self.on and not self.saw_delta:
+            self.saw_delta = True
+            SPANS.observe(time.perf_counter() - self.started, "ttft", self.path)
+
+    def finish(self) -> None:
+        if self.on:
+            SPANS.observe(time.perf_counter() - self.started, "reply", self.path)
+
+
+def register(name: str, kind: str, help_text: str, label: str, values: Callable[[], Dict[str, float]]) -> None:
+    """Expose counters/gauges kept elsewhere (e.g. cache stats), read only when /metrics is scraped."""
+    _collectors.append((name, kind, help_text, label, values))
+
+
+def render() -> str:
+    lines = SPANS.render()
+    for name, kind, help_text, label, values in _collectors:
+        try:
+            samples = values()
+        except Exception as e:
+            settings.dprint(f"[metrics] collector {name} failed: {e}")
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{_labels([(label, str(k))])} {float(v):g}" for k, v in sorted(samples.items())]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Any, Dict, List
+
+import config.settings as settings
+from core.batch_runner import build_task_messages, read_rows, task_model
+from core.upload_manifest import file_sha256
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Batch API input file limits
+MAX_REQUESTS_PER_FILE = 50_000
+MAX_BYTES_PER_FILE = 190 * 1024 * 1024
+
+_TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def pack_requests(
+    rows: List[Dict[str, Any]],
+    task: str,
+    prefix: str,
+    max_requests: int = MAX_REQUESTS_PER_FILE,
+    max_bytes: int = MAX_BYTES_PER_FILE,
+) -> List[str]:
+    """Write Batch API JSONL input files for `rows`, sharded by the API's per-file limits.
+
+    Each line's `custom_id` is the row id. Returns the shard paths.
+    """
+    model, temperature = task_model(task)
+    paths: List[str] = []
+    fh = None
+    count = size = 0
+    try:
+        for row in rows:
+            line = json.dumps(
+                {
+                    "custom_id": row["id"],
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": {
+                        "model": model,
+                        "temperature": temperature,
+                        "messages": build_task_messages(task, row["input"]),
+                    },
+                },
+                ensure_ascii=False,
+            ) + "\n"
+            encoded = len(line.encode("utf-8"))
+            if fh is None or count >= max_requests or size + encoded > max_bytes:
+                if fh is not None:
+                    fh.close()
+                paths.append(f"{prefix}.{len(paths):03d}.jsonl")
+                fh = open(paths[-1], "w", encoding="utf-8")
+                count = size = 0
+            fh.write(line)
+            count += 1
+            size += encoded
+    finally:
+        if fh is not None:
+            fh.close()
+    return paths
+
+
+def submit_shard(client: Any, path: str, task: str) -> str:
+    with open(path, "rb") as fh:
+        uploaded = client.files.create(file=fh, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window="24h",
+        metadata={"task": task, "shard": os.path.basename(path)},
+    )
+    settings.dprint(f"[openai_batch] submitted {path} as {batch.id}")
+    return batch.id
+
+
+def wait_for_batches(client: Any, batch_ids: List[str], poll_seconds: float = 30.0, max_poll_seconds: float = 300.0) -> Dict[str, Any]:
+    """Poll until every batch reaches a terminal status; backs off while nothing changes."""
+    pending = list(batch_ids)
+    finished: Dict[str, Any] = {}
+    delay = poll_seconds
+    while pending:
+        progressed = False
+        for batch_id in list(pending):
+            batch = client.batches.retrieve(batch_id)
+            counts = getattr(batch, "request_counts", None)
+            if counts is not None:
+                print(f"{batch_id}: {batch.status} {counts.completed + counts.failed}/{counts.total}", flush=True)
+            if batch.status in _TERMINAL_STATUSES:
+                finished[batch_id] = batch
+                pending.remove(batch_id)
+                progressed = True
+        if pending:
+            delay = poll_seconds if progressed else min(max_poll_seconds, delay * 1.5)
+            time.sleep(delay)
+    return finished
+
+
+def _read_file_lines(client: Any, file_id: str | None) -> List[Dict[str, Any]]:
+    if not file_id:
+        return []
+    text = client.files.content(file_id).text
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def collect_results(client: Any, batch: Any) -> Dict[str, Dict[str, Any]]:
+    """Map custom_id -> {"output", "error", "usage"} from a finished batch's output and error files."""
+    results: Dict[str, Dict[str, Any]] = {}
+    lines = _read_file_lines(client, getattr(batch, "output_file_id", None))
+    lines += _read_file_lines(client, getattr(batch, "error_file_id", None))
+    for line in lines:
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        error = line.get("error")
+        if error is None and response.get("status_code", 200) != 200:
+            error = body.get("error") or {"message": f"HTTP {response.get('status_code')}"}
+        record: Dict[str, Any] = {"output": None, "error": None, "usage": body.get("usage")}
+        if error is not None:
+            record["error"] = error.get("message") if isinstance(error, dict) else str(error)
+        else:
+            record["output"] = body["choices"][0]["message"].get("content") or ""
+        results[str(line.get("custom_id"))] = record
+    if batch.status != "completed":
+        settings.dprint(f"[openai_batch] {batch.id} ended as {batch.status}")
+    return results
+
+
+def batch_error(batch: Any) -> str:
+    """Why a batch that did not complete returned no results, from its status and `errors`."""
+    details = []
+    for e in getattr(getattr(batch, "errors", None), "data", None) or []:
+        line = getattr(e, "line", None)
+        details.append(f"{getattr(e, 'code', None) or 'error'}: {getattr(e, 'message', '')}" + (f" (line {line})" if line else ""))
+    message = f"batch {batch.id} {batch.status}"
+    return f"{message}: {'; '.join(details)}" if details else message
+
+
+def _check_unique_ids(rows: List[Dict[str, Any]]) -> None:
+    """The Batch API matches results by custom_id, so row ids must be unique."""
+    seen: set[str] = set()
+    duplicates: List[str] = []
+    for row in rows:
+        if row["id"] in seen:
+            duplicates.append(row["id"])
+        seen.add(row["id"])
+    if duplicates:
+        shown = ", ".join(repr(d) for d in duplicates[:5]) + (", ..." if len(duplicates) > 5 else "")
+        raise ValueError(f"{len(duplicates)} duplicate row id(s) in the input: {shown}")
+
+
+def _count_lines(path: str) -> int:
+    with open(path, "rb") as fh:
+        return sum(1 for _ in fh)
+
+
+def _load_state(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(path: str, state: Dict[str, Any]) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh, indent=2)
+    os.replace(tmp, path)
+
+
+def run_offline_batch(
+    input_path: str,
+    output_path: str,
+    task: str,
+    client: Any = None,
+    input_field: str = "input",
+    id_field: str = "id",
+    poll_seconds: float = 30.0,
+    max_requests_per_file: int = MAX_REQUESTS_PER_FILE,
+    resume: bool = True,
+) -> Dict[str, int]:
+    """Run `input_path` through the Batch API and write results to `output_path` in input order.
+
+    Submitted batch IDs are recorded in `<output_path>.batch.json` with the
+    input's SHA-256; running the same command again on an unchanged input
+    re-attaches to those batches instead of resubmitting (pass `resume=False`
+    to always submit fresh batches). The output file is rewritten, not appended,
+    and the shard input files are deleted once it is written. Rows of a batch
+    that failed or expired carry the batch's errors.
+    """
+    client = client or settings.client
+    if client is None:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    if task not in settings.TASK_CONFIG:
+        raise ValueError(f"Unknown task '{task}'")
+
+    rows = list(read_rows(input_path, input_field, id_field))
+    _check_unique_ids(rows)
+    state_path = f"{output_path}.batch.json"
+    state = _load_state(state_path) if resume else {}
+    # Identify the run by the input's contents, so an edited input is never merged with stale batches
+    source = {"input": os.path.abspath(input_path), "input_sha256": file_sha256(input_path), "task": task}
+    if any(state.get(k) != v for k, v in source.items()):
+        shards = pack_requests(rows, task, f"{output_path}.input", max_requests=max_requests_per_file)
+        state = {**source, "shards": shards, "shard_rows": [_count_lines(p) for p in shards], "batches": []}
+    # Submit shards not yet submitted (all of them, or the rest after an interruption)
+    for shard in state["shards"][len(state["batches"]) :]:
+        state["batches"].append(submit_shard(client, shard, task))
+        _save_state(state_path, state)
+
+    started = time.monotonic()
+    finished = wait_for_batches(client, state["batches"], poll_seconds=poll_seconds)
+    results: Dict[str, Dict[str, Any]] = {}
+    for batch_id in state["batches"]:
+        results.update(collect_results(client, finished[batch_id]))
+    # Shards hold consecutive rows, so each row's batch is known even when it returned nothing
+    row_batches: List[Any] = []
+    for batch_id, n in zip(state["batches"], state.get("shard_rows") or []):
+        row_batches += [finished[batch_id]] * n
+
+    stats = {"rows": len(rows), "errors": 0, "missing": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    tmp = f"{output_path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as out:
+        for i, row in enumerate(rows):
+            result = results.get(row["id"])
+            if result is None:
+                batch = row_batches[i] if i < len(row_batches) else None
+                error = batch_error(batch) if batch is not None and batch.status != "completed" else "no result returned by batch"
+                result = {"output": None, "error": error}
+                stats["missing"] += 1
+            if result["error"] is not None:
+                stats["errors"] += 1
+            usage = result.get("usage") or {}
+            stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            stats["completion_tokens"] += usage.get("completion_tokens") or 0
+            record = {"id": row["id"], "task": task, "output": result["output"], "error": result["error"]}
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    os.replace(tmp, output_path)
+    for shard in state["shards"]:
+        try:
+            os.remove(shard)
+        except FileNotFoundError:
+            pass
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(
+        f"{stats['rows']} rows ({stats['errors']} errors, {stats['missing']} missing) across "
+        f"{len(state['batches'])} batch(es) | {stats['prompt_tokens'] + stats['completion_tokens']} tokens"
+        f" | {stats['rows'] / elapsed:.2f} rows/s since attach",
+        flush=True,
+    )
+    return stats
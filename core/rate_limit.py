@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Set, Tuple, TypeVar
+
+import openai
+
+import config.settings as settings
+from core import metrics
+from utils.token_budget import count_message_tokens
+
+T = TypeVar("T")
+
+# Lane for calls that are not billed against a model (threads, messages, files, vector stores)
+API_LANE = "api"
+_ANONYMOUS_SESSION = "anonymous"
+# Statuses retried by `call`/`acall` (the SDK's own retry set; its retries are off while the limiter is on)
+_TRANSIENT_STATUSES = (408, 409, 500, 502, 503, 504)
+
+
+class RateLimitShed(RuntimeError):
+    """Raised when a request is refused because the admission queue is full or too slow."""
+
+
+def retry_after_seconds(err: Exception) -> float | None:
+    """Server-suggested wait from an OpenAI error's `retry-after(-ms)` headers, if any."""
+    headers = getattr(getattr(err, "response", None), "headers", None) or {}
+    for name in ("retry-after-ms", "retry-after"):
+        value = headers.get(name)
+        if value:
+            try:
+                return float(value) / (1000.0 if name.endswith("-ms") else 1.0)
+            except ValueError:
+                continue
+    return None
+
+
+def estimate_tokens(model: str, messages: List[Dict[str, Any]]) -> int:
+    """Tokens a chat request will count against TPM: prompt plus the expected completion."""
+    return sum(count_message_tokens(model, m) for m in messages) + settings.RATE_LIMIT_COMPLETION_TOKENS
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most one minute's worth."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = max(1.0, float(per_minute))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def shortfall(self, n: float, now: float) -> float:
+        """Seconds until `n` units are available (0 if they are now)."""
+        self._refill(now)
+        n = min(n, self.capacity)  # an oversized request waits for a full bucket, not forever
+        return 0.0 if self.level >= n else (n - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        self.level -= min(n, self.capacity)
+
+
+class _Lane:
+    """Buckets and the per-session wait queues for one model."""
+
+    def __init__(self, rpm: float, tpm: float) -> None:
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.paused_until = 0.0
+        # session_id -> tickets; sessions take turns in insertion order (round robin)
+        self.queues: "OrderedDict[str, Deque[object]]" = OrderedDict()
+        self.depth = 0
+        self.admitted = 0
+        self.shed = 0
+
+
+class RateLimiter:
+    """Process-wide admission control for OpenAI calls.
+
+    Each model gets a lane with requests-per-minute and tokens-per-minute
+    buckets (limits from TASK_CONFIG). Waiting callers are queued per session
+    and sessions are served round robin, so one busy session cannot starve
+    the others. A 429 pauses the whole lane for the server's retry-after;
+    other transient failures are retried with backoff for that caller only.
+    When a lane already has RATE_LIMIT_MAX_QUEUE waiters, or a caller waits
+    longer than RATE_LIMIT_MAX_WAIT_SECONDS, the call is shed with
+    `RateLimitShed` instead of piling up.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        # Events of async waiters, set (on their own loop) whenever sync waiters are notified
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        self._lanes: Dict[str, _Lane] = {}
+        self._limits = self._limits_from_config()
+
+    @staticmethod
+    def _limits_from_config() -> Dict[str, tuple[float, float]]:
+        limits: Dict[str, tuple[float, float]] = {}
+        for cfg in settings.TASK_CONFIG.values():
+            model = cfg.get("model")
+            if not model:
+                continue
+            rpm = float(cfg.get("rpm", settings.RATE_LIMIT_DEFAULT_RPM))
+            tpm = float(cfg.get("tpm", settings.RATE_LIMIT_DEFAULT_TPM))
+            if model in limits:  # several tasks share a model: the strictest limit wins
+                rpm, tpm = min(rpm, limits[model][0]), min(tpm, limits[model][1])
+            limits[model] = (rpm, tpm)
+        return limits
+
+    def _lane(self, lane: str | None) -> _Lane:
+        key = lane or API_LANE
+        found = self._lanes.get(key)
+        if found is None:
+            rpm, tpm = self._limits.get(key) or (
+                settings.model_rate_limit("RPM", key, settings.RATE_LIMIT_DEFAULT_RPM),
+                settings.model_rate_limit("TPM", key, settings.RATE_LIMIT_DEFAULT_TPM),
+            )
+            if key == API_LANE:
+                tpm = 0  # no token accounting for non-model endpoints
+            found = self._lanes[key] = _Lane(rpm, tpm)
+        return found
+
+    def configure(self, lane: str, rpm: float | None = None, tpm: float | None = None) -> None:
+        """Override the limits of model `lane` (e.g. a batch run's --rpm); takes effect immediately."""
+        with self._cond:
+            default = self._limits.get(lane) or (settings.RATE_LIMIT_DEFAULT_RPM, settings.RATE_LIMIT_DEFAULT_TPM)
+            self._limits[lane] = (rpm or default[0], tpm or default[1])
+            state = self._lanes.get(lane)
+            if state is not None:
+                state.requests = TokenBucket(self._limits[lane][0])
+                state.tokens = TokenBucket(self._limits[lane][1]) if self._limits[lane][1] > 0 else None
+            self._notify()
+
+    # --- Queue bookkeeping (callers hold self._cond) ---
+    def _notify(self) -> None:
+        self._cond.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed; its waiter is gone
+
+    def _enqueue(self, lane: _Lane, session_id: str, ticket: object) -> None:
+        if settings.RATE_LIMIT_MAX_QUEUE > 0 and lane.depth >= settings.RATE_LIMIT_MAX_QUEUE:
+            lane.shed += 1
+            raise RateLimitShed(
+                f"The service is busy ({lane.depth} requests queued). Please try again in a moment."
+            )
+        lane.queues.setdefault(session_id, deque()).append(ticket)
+        lane.depth += 1
+
+    def _dequeue(self, lane: _Lane, session_id: str, ticket: object) -> None:
+        queue = lane.queues.get(session_id)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        lane.depth -= 1
+        if not queue:
+            del lane.queues[session_id]
+
+    def _try_admit(self, lane: _Lane, session_id: str, ticket: object, tokens: int) -> float | None:
+        """0.0 if admitted, seconds to wait if `ticket` is next but over budget, None if not its turn."""
+        head_session, head_queue = next(iter(lane.queues.items()))
+        if head_session != session_id or head_queue[0] is not ticket:
+            return None
+        now = time.monotonic()
+        wait = max(lane.paused_until - now, lane.requests.shortfall(1, now))
+        if lane.tokens is not None and tokens:
+            wait = max(wait, lane.tokens.shortfall(tokens, now))
+        if wait > 0:
+            return wait
+        lane.requests.take(1)
+        if lane.tokens is not None and tokens:
+            lane.tokens.take(tokens)
+        head_queue.popleft()
+        lane.depth -= 1
+        lane.admitted += 1
+        # Rotate: this session goes to the back of the line
+        del lane.queues[session_id]
+        if head_queue:
+            lane.queues[session_id] = head_queue
+        return 0.0
+
+    def _shed_timeout(self, lane: _Lane) -> RateLimitShed:
+        lane.shed += 1
+        return RateLimitShed(
+            f"The service is busy (waited {settings.RATE_LIMIT_MAX_WAIT_SECONDS:.0f}s for capacity). "
+            "Please try again in a moment."
+        )
+
+    # --- Admission ---
+    def acquire(self, lane: str | None, tokens: int = 0, session_id: str | None = None) -> None:
+        """Block until a request for model `lane` (None: non-model API call) may be sent."""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        session_id = session_id or _ANONYMOUS_SESSION
+        ticket = object()
+        deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        with self._cond:
+            state = self._lane(lane)
+            self._enqueue(state, session_id, ticket)
+            try:
+                while True:
+                    wait = self._try_admit(state, session_id, ticket, tokens)
+                    if wait == 0.0:
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise self._shed_timeout(state)
+                    # Not our turn: sleep until the queue moves; our turn: until the bucket refills
+                    self._cond.wait(timeout=min(remaining, wait if wait is not None else remaining))
+            finally:
+                self._dequeue(state, session_id, ticket)
+                self._notify()
+
+    async def acquire_async(self, lane: str | None, tokens: int = 0, session_id: str | None = None) -> None:
+        """Asyncio counterpart of `acquire`; waits without blocking the event loop."""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        session_id = session_id or _ANONYMOUS_SESSION
+        ticket = object()
+        deadline = time.monotonic() + settings.RATE_LIMIT_MAX_WAIT_SECONDS
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._cond:
+            state = self._lane(lane)
+            self._enqueue(state, session_id, ticket)
+            self._async_waiters.add(waiter)
+        try:
+            while True:
+                with self._cond:
+                    waiter[1].clear()  # a release after this point sets it again
+                    wait = self._try_admit(state, session_id, ticket, tokens)
+                    if wait == 0.0:
+                        return
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._cond:
+                        raise self._shed_timeout(state)
+                # Not our turn: sleep until the queue moves; our turn: until the bucket refills
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), min(remaining, wait if wait is not None else remaining))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self._async_waiters.discard(waiter)
+                self._dequeue(state, session_id, ticket)
+                self._notify()
+
+    def pause(self, lane: str | None, seconds: float) -> None:
+        """Hold every caller of `lane` for `seconds` (after a 429)."""
+        with self._cond:
+            state = self._lane(lane)
+            state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+            self._notify()
+
+    def _backoff(self, lane: str | None, err: Exception, attempt: int) -> float | None:
+        """Seconds to sleep before retrying `err` (0 after a 429: the lane pause holds admission), or None to raise."""
+        if not settings.RATE_LIMIT_ENABLED or attempt >= settings.RATE_LIMIT_MAX_RETRIES:
+            return None  # with the limiter off the SDK's own retries apply
+        status = getattr(err, "status_code", None)
+        delay = retry_after_seconds(err) or min(30.0, 2.0**attempt) * random.uniform(0.5, 1.5)
+        if status == 429:
+            settings.dprint(f"[rate_limit] 429 on lane '{lane or API_LANE}', pausing {delay:.2f}s")
+            self.pause(lane, delay)
+            return 0.0
+        if status in _TRANSIENT_STATUSES or isinstance(err, openai.APIConnectionError):
+            settings.dprint(f"[rate_limit] {type(err).__name__} on lane '{lane or API_LANE}', retrying in {delay:.2f}s")
+            return delay
+        return None
+
+    # --- Wrapped calls ---
+    def call(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        lane: str | None = None,
+        tokens: int = 0,
+        session_id: str | None = None,
+        **kwargs: Any,
+    ) -> T:
+        """Admit, then call `fn(*args, **kwargs)`; on 429 pause the lane and retry, on transient errors back off and retry."""
+        attempt = 0
+        while True:
+            self.acquire(lane, tokens, session_id)
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff(lane, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+
+    async def acall(
+        self,
+        fn: Callable[..., Awaitable[T]],
+        *args: Any,
+        lane: str | None = None,
+        tokens: int = 0,
+        session_id: str | None = None,
+        **kwargs: Any,
+    ) -> T:
+        """Asyncio counterpart of `call`."""
+        attempt = 0
+        while True:
+            await self.acquire_async(lane, tokens, session_id)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._backoff(lane, e, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        with self._cond:
+            return {
+                key: {"queued": lane.depth, "admitted": lane.admitted, "shed": lane.shed}
+                for key, lane in self._lanes.items()
+            }
+
+
+limiter = RateLimiter()
+
+
+def _lane_stat(stat: str) -> Callable[[], Dict[str, int]]:
+    return lambda: {lane: values[stat] for lane, values in limiter.stats().items()}
+
+
+metrics.register("chatbot_rate_limit_queued", "gauge", "Requests waiting for admission per lane.", "lane", _lane_stat("queued"))
+metrics.register("chatbot_rate_limit_admitted_total", "counter", "Requests admitted per lane.", "lane", _lane_stat("admitted"))
+metrics.register("chatbot_rate_limit_shed_total", "counter", "Requests shed per lane.", "lane", _lane_stat("shed"))
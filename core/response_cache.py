@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+import config.settings as settings
+from core import metrics
+from core.rate_limit import limiter
+from utils.cache import SQLiteCache, TTLCache
+from utils.token_budget import count_message_tokens
+
+
+def cacheable(task: str) -> bool:
+    """Only deterministic (temperature 0) tasks opted in via RESPONSE_CACHE_TASKS are cached."""
+    if settings.RESPONSE_CACHE_TTL_SECONDS <= 0 or task not in settings.RESPONSE_CACHE_TASKS:
+        return False
+    return float(settings.TASK_CONFIG.get(task, {}).get("temperature", 1.0)) == 0.0
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split())
+
+
+class CacheProbe:
+    """Result of a lookup; carries what `store` needs so nothing is computed twice."""
+
+    def __init__(self, task: str, key: str, bucket: str, query_text: str) -> None:
+        self.task = task
+        self.key = key
+        self.bucket = bucket
+        self.query_text = query_text
+        self.vector: np.ndarray | None = None
+        self.hit: str | None = None
+
+
+class ResponseCache:
+    """Exact-match response cache with an optional embedding-similarity tier.
+
+    Exact keys hash (task, model, system prompt, normalized history). The
+    semantic tier compares the conversation text's embedding against earlier
+    requests in the same (task, model, system prompt) bucket and reuses an
+    answer above `RESPONSE_CACHE_SEMANTIC_THRESHOLD` cosine similarity; it is
+    limited to RESPONSE_CACHE_SEMANTIC_TASKS, where a near-duplicate input may
+    share an answer (a label, not a translation).
+    """
+
+    def __init__(self) -> None:
+        backend = None
+        if settings.RESPONSE_CACHE_PATH:
+            backend = SQLiteCache(settings.RESPONSE_CACHE_PATH, settings.RESPONSE_CACHE_TTL_SECONDS)
+        self.exact = TTLCache(settings.RESPONSE_CACHE_MAX_ENTRIES, settings.RESPONSE_CACHE_TTL_SECONDS, backend=backend)
+        self.semantic_threshold = settings.RESPONSE_CACHE_SEMANTIC_THRESHOLD
+        self._semantic: "OrderedDict[str, tuple[str, np.ndarray, str]]" = OrderedDict()
+        self._semantic_lock = threading.Lock()
+        self.semantic_hits = 0
+
+    # --- Keys ---
+    def probe(self, task: str, model: str, oa_messages: List[Dict[str, str]]) -> CacheProbe:
+        """Build the lookup for a Chat Completions payload (system prompt first)."""
+        system = "".join(m["content"] for m in oa_messages if m.get("role") == "system")
+        turns = [(m.get("role"), _normalize(m.get("content") or "")) for m in oa_messages if m.get("role") != "system"]
+        prompt_hash = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        bucket = f"{task}|{model}|{prompt_hash}"
+        blob = json.dumps([bucket, turns], separators=(",", ":"))
+        key = hashlib.sha256(blob.encode("utf-8")).hexdigest()
+        query_text = "\n".join(f"{role}: {content}" for role, content in turns)
+        return CacheProbe(task, key, bucket, query_text)
+
+    # --- Lookup ---
+    def lookup(self, probe: CacheProbe) -> str | None:
+        probe.hit = self.exact.get(probe.key)
+        if probe.hit is None and self._semantic_enabled(probe):
+            probe.vector = _embed_sync(probe.query_text)
+            probe.hit = self._nearest(probe)
+        return probe.hit
+
+    async def alookup(self, probe: CacheProbe) -> str | None:
+        probe.hit = await asyncio.to_thread(self.exact.get, probe.key) if settings.RESPONSE_CACHE_PATH else self.exact.get(probe.key)
+        if probe.hit is None and self._semantic_enabled(probe):
+            probe.vector = await _embed_async(probe.query_text)
+            probe.hit = self._nearest(probe)
+        return probe.hit
+
+    def store(self, probe: CacheProbe, text: str) -> None:
+        if not text:
+            return
+        self.exact.set(probe.key, text)
+        if probe.vector is not None:
+            with self._semantic_lock:
+                self._semantic[probe.key] = (probe.bucket, probe.vector, text)
+                while len(self._semantic) > settings.RESPONSE_CACHE_SEMANTIC_MAX_ENTRIES:
+                    self._semantic.popitem(last=False)
+
+    async def astore(self, probe: CacheProbe, text: str) -> None:
+        """`store` off the event loop (the exact tier may write to SQLite)."""
+        await asyncio.to_thread(self.store, probe, text)
+
+    def _semantic_enabled(self, probe: CacheProbe) -> bool:
+        return (
+            self.semantic_threshold > 0
+            and probe.task in settings.RESPONSE_CACHE_SEMANTIC_TASKS
+            and settings.client is not None
+        )
+
+    def _nearest(self, probe: CacheProbe) -> str | None:
+        if probe.vector is None:
+            return None
+        with self._semantic_lock:
+            candidates = [(k, v, t) for k, (b, v, t) in self._semantic.items() if b == probe.bucket]
+        if not candidates:
+            return None
+        matrix = np.stack([v for _, v, _ in candidates])
+        scores = matrix @ probe.vector
+        best = int(np.argmax(scores))
+        if float(scores[best]) < self.semantic_threshold:
+            return None
+        key, _, text = candidates[best]
+        with self._semantic_lock:
+            if key in self._semantic:
+                self._semantic.move_to_end(key)
+            self.semantic_hits += 1
+        return text
+
+    def stats(self) -> Dict[str, int]:
+        out = self.exact.stats()
+        out["semantic_hits"] = self.semantic_hits
+        return out
+
+
+def _unit(vector: Any) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
+
+
+def _embed_sync(text: str) -> np.ndarray | None:
+    try:
+        resp = limiter.call(
+            settings.client.embeddings.create,
+            model=settings.EMBEDDING_MODEL,
+            input=text,
+            lane=settings.EMBEDDING_MODEL,
+            tokens=count_message_tokens(settings.EMBEDDING_MODEL, {"content": text}),
+        )
+        return _unit(resp.data[0].embedding)
+    except Exception as e:
+        settings.dprint(f"[response_cache] embedding failed: {e}")
+        return None
+
+
+async def _embed_async(text: str) -> np.ndarray | None:
+    try:
+        resp = await limiter.acall(
+            settings.async_client.embeddings.create,
+            model=settings.EMBEDDING_MODEL,
+            input=text,
+            lane=settings.EMBEDDING_MODEL,
+            tokens=count_message_tokens(settings.EMBEDDING_MODEL, {"content": text}),
+        )
+        return _unit(resp.data[0].embedding)
+    except Exception as e:
+        settings.dprint(f"[response_cache] embedding failed: {e}")
+        return None
+
+
+def replay_chunks(text: str, size: int | None = None) -> Iterator[str]:
+    """Split a cached answer into stream-sized pieces for a synthetic stream."""
+    size = size or settings.RESPONSE_CACHE_REPLAY_CHARS
+    for i in range(0, len(text), max(1, size)):
+        yield text[i : i + size]
+
+
+response_cache = ResponseCache()
+metrics.register("chatbot_response_cache", "gauge", "Response cache counters.", "stat", response_cache.stats)
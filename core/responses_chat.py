@@ -1,21 +1,52 @@
 from __future__ import annotations
 
-from typing import Iterator, List, Tuple, Dict, Any
+from typing import AsyncIterator, Iterator, List, Tuple, Dict, Any
 
 import config.settings as settings
-from config.prompts import SYS_PROMPTS
-from utils.chat_format import (
-    messages_to_openai,
-    messages_append_user,
-    ensure_last_assistant_message,
-    append_to_last_assistant,
+from config.prompts import LOCAL_DOCUMENT_PROMPT, SYS_PROMPTS
+from core import metrics
+from core.rate_limit import estimate_tokens, limiter
+from core.response_cache import cacheable, replay_chunks, response_cache
+from core.retrieval import context_message, retriever, uses_local_retrieval
+from core.state import SessionState
+from utils.chat_format import StreamingMessageBuffer, messages_to_openai
+from utils.coalesce import UpdateCoalescer
+from utils.token_budget import context_budget, fit_messages
+
+
+_MISSING_KEY_TEXT = (
+    "Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'."
 )
 
 
+def _chunk_text(chunk: Any) -> str:
+    try:
+        delta = chunk.choices[0].delta
+        return getattr(delta, "content", None) or ""
+    except Exception:
+        return ""
+
+
+def _with_context(oa_messages: List[Dict[str, Any]], message: str, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Replace the final user turn with retrieved excerpts plus the question (the UI keeps the plain text)."""
+    return oa_messages[:-1] + [{"role": "user", "content": context_message(message, hits)}]
+
+
+def _replay_cached(buf: StreamingMessageBuffer, text: str) -> Iterator[List[Dict[str, Any]]]:
+    """Replay a cached answer as a synthetic stream so the UI renders it like a live reply."""
+    coalescer = UpdateCoalescer()
+    for piece in replay_chunks(text):
+        buf.append(piece)
+        if coalescer.ready(len(piece)):
+            yield buf.snapshot()
+    yield buf.snapshot()
+
+
 def responses_stream_chat(
     message: str,
     history_messages: List[Dict[str, Any]],
     task: str,
+    session: SessionState | None = None,
 ) -> Iterator[tuple[str, List[Dict[str, Any]]]]:
     """Stream tokens using Chat Completions API (no tools), messages-based.
 
@@ -23,50 +54,155 @@ def responses_stream_chat(
     """
     # Guard: require OpenAI client
     if settings.client is None:
-        work_messages: List[Dict[str, Any]] = messages_append_user(list(history_messages or []), message)
-        work_messages = ensure_last_assistant_message(work_messages)
-        work_messages[-1]["content"] = (
-            "Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'."
-        )
-        yield "", work_messages
+        buf = StreamingMessageBuffer(history_messages, message)
+        buf.set_text(_MISSING_KEY_TEXT)
+        yield "", buf.snapshot()
         return
     # Prepare system instruction and model
-    instructions = SYS_PROMPTS.get(task, "You are a helpful assistant.")
+    local_documents = uses_local_retrieval(task, session)
+    instructions = LOCAL_DOCUMENT_PROMPT if local_documents else SYS_PROMPTS.get(task, "You are a helpful assistant.")
     cfg = settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"})
     model = cfg.get("model", "gpt-4o-mini")
 
     # Working copy: add user message and a placeholder assistant
-    work_messages: List[Dict[str, Any]] = messages_append_user(list(history_messages or []), message)
-    work_messages = ensure_last_assistant_message(work_messages)
+    buf = StreamingMessageBuffer(history_messages, message)
     # Immediate placeholder so UI shows activity
     try:
-        yield "", list(work_messages)
+        yield "", buf.snapshot()
     except Exception:
         pass
 
     # Build OpenAI chat payload
-    oa_messages = messages_to_openai(work_messages, system_instruction=instructions)
+    oa_messages = messages_to_openai(buf.messages, system_instruction=instructions)
+    # Exclude the placeholder assistant for API call; last element is the assistant placeholder
+    oa_messages = oa_messages[:-1]
+    if local_documents:
+        # Local index: top-k chunks go into the final user turn before history is trimmed
+        try:
+            with metrics.span("retrieve", "chat"):
+                hits = retriever.search(session.document_shas(), message, session_id=session.session_id)
+        except Exception as e:
+            buf.append(f"Error: Retrieval failed. {e}")
+            yield "", buf.snapshot()
+            return
+        oa_messages = _with_context(oa_messages, message, hits)
+    request_messages = fit_messages(oa_messages, model, context_budget(task))
+
+    probe = None
+    if cacheable(task):
+        probe = response_cache.probe(task, model, request_messages)
+        cached = response_cache.lookup(probe)
+        if cached is not None:
+            settings.dprint(f"[responses_stream] cache hit for task '{task}'")
+            for snapshot in _replay_cached(buf, cached):
+                yield "", snapshot
+            return
+
+    coalescer = UpdateCoalescer()
+    timer = metrics.StreamTimer("chat")
     try:
-        stream = settings.client.chat.completions.create(
+        timer.stream_opened()
+        stream = limiter.call(
+            settings.client.chat.completions.create,
             model=model,
-            # Exclude the placeholder assistant for API call; last element is the assistant placeholder
-            messages=oa_messages[:-1],
+            messages=request_messages,
+            temperature=cfg.get("temperature", 1.0),
             stream=True,
+            lane=model,
+            tokens=estimate_tokens(model, request_messages),
+            session_id=session.session_id if session else None,
         )
+        timer.event()
         for chunk in stream:
-            try:
-                delta = chunk.choices[0].delta
-                delta_text = getattr(delta, "content", None) or ""
-            except Exception:
-                delta_text = ""
+            delta_text = _chunk_text(chunk)
             if delta_text:
-                # Debug: log small snippet of delta
-                settings.dprint(f"[responses_stream] delta({len(delta_text)}): {delta_text[:40]!r}")
-                work_messages = append_to_last_assistant(work_messages, delta_text)
-                yield "", list(work_messages)
+                if settings.DEBUG:
+                    # Debug: log small snippet of delta
+                    settings.dprint(f"[responses_stream] delta({len(delta_text)}): {delta_text[:40]!r}")
+                buf.append(delta_text)
+                if coalescer.ready(len(delta_text)):
+                    timer.delta()
+                    yield "", buf.snapshot()
 
         # Done: nothing else to fetch; accumulated content is in last assistant message
-        yield "", work_messages
+        if probe is not None:
+            response_cache.store(probe, buf.text)
+        timer.finish()
+        yield "", buf.snapshot()
+    except Exception as e:
+        buf.append(f"Error: Streaming failed. {e}")
+        yield "", buf.snapshot()
+
+
+async def responses_stream_chat_async(
+    message: str,
+    history_messages: List[Dict[str, Any]],
+    task: str,
+    session: SessionState | None = None,
+) -> AsyncIterator[tuple[str, List[Dict[str, Any]]]]:
+    """Async generator version of `responses_stream_chat` on `settings.async_client`."""
+    buf = StreamingMessageBuffer(history_messages, message)
+    if settings.async_client is None:
+        buf.set_text(_MISSING_KEY_TEXT)
+        yield "", buf.snapshot()
+        return
+    local_documents = uses_local_retrieval(task, session)
+    instructions = LOCAL_DOCUMENT_PROMPT if local_documents else SYS_PROMPTS.get(task, "You are a helpful assistant.")
+    cfg = settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"})
+    model = cfg.get("model", "gpt-4o-mini")
+
+    yield "", buf.snapshot()
+
+    oa_messages = messages_to_openai(buf.messages, system_instruction=instructions)[:-1]
+    if local_documents:
+        try:
+            with metrics.span("retrieve", "chat_async"):
+                hits = await retriever.asearch(session.document_shas(), message, session_id=session.session_id)
+        except Exception as e:
+            buf.append(f"Error: Retrieval failed. {e}")
+            yield "", buf.snapshot()
+            return
+        oa_messages = _with_context(oa_messages, message, hits)
+    request_messages = fit_messages(oa_messages, model, context_budget(task))
+
+    probe = None
+    if cacheable(task):
+        probe = response_cache.probe(task, model, request_messages)
+        cached = await response_cache.alookup(probe)
+        if cached is not None:
+            for snapshot in _replay_cached(buf, cached):
+                yield "", snapshot
+            return
+
+    coalescer = UpdateCoalescer()
+    timer = metrics.StreamTimer("chat_async")
+    try:
+        timer.stream_opened()
+        stream = await limiter.acall(
+            settings.async_client.chat.completions.create,
+            model=model,
+            messages=request_messages,
+            temperature=cfg.get("temperature", 1.0),
+            stream=True,
+            lane=model,
+            tokens=estimate_tokens(model, request_messages),
+            session_id=session.session_id if session else None,
+        )
+        timer.event()
+        async for chunk in stream:
+            delta_text = _chunk_text(chunk)
+            if delta_text:
+                if settings.DEBUG:
+                    settings.dprint(f"[responses_stream] delta({len(delta_text)}): {delta_text[:40]!r}")
+                buf.append(delta_text)
+                if coalescer.ready(len(delta_text)):
+                    timer.delta()
+                    yield "", buf.snapshot()
+
+        if probe is not None:
+            await response_cache.astore(probe, buf.text)
+        timer.finish()
+        yield "", buf.snapshot()
     except Exception as e:
-        work_messages = append_to_last_assistant(work_messages, f"Error: Streaming failed. {e}")
-        yield "", work_messages
+        buf.append(f"Error: Streaming failed. {e}")
+        yield "", buf.snapshot()
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import html
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+import config.settings as settings
+from core import metrics
+from core.embeddings import embedder
+
+DOCUMENT_TASK = "Chat with Document"
+
+_TAG = re.compile(r"<[^>]+>")
+_WS = re.compile(r"[ \t\r\f\v]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def enabled() -> bool:
+    return settings.RETRIEVAL_BACKEND == "local"
+
+
+def uses_local_retrieval(task: str, session: Any, enabled_tools: List[str] | None = None) -> bool:
+    """True when a Chat with Document turn should be answered from the local index."""
+    return (
+        enabled()
+        and task == DOCUMENT_TASK
+        and session is not None
+        and bool(session.document_shas())
+        and "Web Search" not in (enabled_tools or [])
+    )
+
+
+# --- Text extraction ---
+def _xml_text(xml: str, paragraph_tag: str) -> str:
+    xml = xml.replace(f"</{paragraph_tag}>", "\n")
+    return html.unescape(_TAG.sub("", xml))
+
+
+def _zip_text(path: Path) -> str:
+    """Text of .docx (word/document.xml) and .pptx (slide XML) files, without extra dependencies."""
+    with zipfile.ZipFile(path) as zf:
+        if path.suffix.lower() == ".docx":
+            return _xml_text(zf.read("word/document.xml").decode("utf-8", "replace"), "w:p")
+        slides = sorted(
+            (n for n in zf.namelist() if re.fullmatch(r"ppt/slides/slide\d+\.xml", n)),
+            key=lambda n: int(re.findall(r"\d+", n)[-1]),
+        )
+        return "\n\n".join(_xml_text(zf.read(n).decode("utf-8", "replace"), "a:p") for n in slides)
+
+
+def _pdf_text(path: Path) -> str:
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("Indexing PDF files locally requires the 'pypdf' package.") from e
+    return "\n\n".join(page.extract_text() or "" for page in PdfReader(str(path)).pages)
+
+
+def extract_text(path: Path) -> str:
+    suffix = path.suffix.lower()
+    if suffix in (".docx", ".pptx"):
+        text = _zip_text(path)
+    elif suffix == ".pdf":
+        text = _pdf_text(path)
+    elif suffix == ".doc":
+        raise RuntimeError("Legacy .doc files cannot be indexed locally; convert to .docx or use the remote backend.")
+    else:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        if suffix in (".html", ".htm"):
+            text = html.unescape(_TAG.sub(" ", text))
+    text = "\n".join(_WS.sub(" ", line).strip() for line in text.splitlines())
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def chunk_text(text: str, size: int, overlap: int) -> List[Tuple[int, str]]:
+    """(offset, text) chunks of about `size` characters, cut at paragraph or sentence ends where possible."""
+    size = max(200, size)
+    overlap = max(0, min(overlap, size // 2))
+    chunks: List[Tuple[int, str]] = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            window = text[start:end]
+            cut = max(window.rfind("\n\n"), window.rfind(". "), window.rfind("\n"))
+            if cut > size // 2:
+                end = start + cut + 1
+        piece = text[start:end].strip()
+        if piece:
+            chunks.append((start, piece))
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        # Begin the overlap at a word boundary
+        space = text.find(" ", next_start, end)
+        start = space + 1 if space != -1 else next_start
+    return chunks
+
+
+# --- Index ---
+class DocumentIndex:
+    """Chunks of one document and their unit embeddings (memory-mapped float32 .npy)."""
+
+    def __init__(self, directory: Path) -> None:
+        meta = json.loads((directory / "chunks.json").read_text(encoding="utf-8"))
+        self.name: str = meta["name"]
+        self.chunks: List[Dict[str, Any]] = meta["chunks"]
+        self.vectors = np.load(directory / "vectors.npy", mmap_mode="r")
+
+
+class LocalRetriever:
+    """In-process retrieval: chunk, embed and index documents on disk, keyed by content hash.
+
+    Each document's index lives in RETRIEVAL_INDEX_DIR/<key>/ (chunks.json and a
+    memory-mapped vectors.npy); the key covers the file hash, embedding model and
+    chunking, so any session uploading the same file reuses it. Search is an
+    exact dot product over the mapped vectors.
+    """
+
+    def __init__(self, root: str, max_open: int = 64) -> None:
+        self.root = Path(root)
+        self._open: "OrderedDict[str, DocumentIndex]" = OrderedDict()
+        self._max_open = max(1, max_open)
+        self._lock = threading.Lock()
+        self._building: Dict[str, threading.Lock] = {}
+        self.built = 0
+        self.reused = 0
+
+    def _key(self, sha: str) -> str:
+        params = f"{sha}|{settings.EMBEDDING_MODEL}|{settings.RETRIEVAL_CHUNK_CHARS}|{settings.RETRIEVAL_CHUNK_OVERLAP}"
+        return hashlib.sha256(params.encode("utf-8")).hexdigest()[:32]
+
+    def _dir(self, sha: str) -> Path:
+        return self.root / self._key(sha)
+
+    def has(self, sha: str) -> bool:
+        return (self._dir(sha) / "vectors.npy").exists()
+
+    def build(self, path: Path, sha: str, session_id: str | None = None) -> bool:
+        """Index `path` unless an index for its contents exists. Returns True if it was reused."""
+        with self._lock:
+            gate = self._building.setdefault(sha, threading.Lock())
+        with gate:  # one build per document, even if several sessions upload it at once
+            if self.has(sha):
+                self.reused += 1
+                return True
+            with metrics.span("chunk", "retrieval"):
+                chunks = chunk_text(extract_text(path), settings.RETRIEVAL_CHUNK_CHARS, settings.RETRIEVAL_CHUNK_OVERLAP)
+            if not chunks:
+                raise RuntimeError("no text could be extracted")
+            vectors = embedder.embed([text for _, text in chunks], session_id=session_id)
+            self.root.mkdir(parents=True, exist_ok=True)
+            tmp = Path(tempfile.mkdtemp(prefix=".build-", dir=self.root))
+            try:
+                np.save(tmp / "vectors.npy", vectors.astype(np.float32))
+                meta = {"name": path.name, "chunks": [{"offset": o, "text": t} for o, t in chunks]}
+                (tmp / "chunks.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+                os.replace(tmp, self._dir(sha))  # publish atomically
+            except OSError:
+                if not self.has(sha):
+                    raise
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+            self.built += 1
+            return False
+
+    def _index(self, sha: str) -> DocumentIndex:
+        with self._lock:
+            index = self._open.get(sha)
+            if index is not None:
+                self._open.move_to_end(sha)
+                return index
+        index = DocumentIndex(self._dir(sha))
+        with self._lock:
+            self._open[sha] = index
+            while len(self._open) > self._max_open:
+                self._open.popitem(last=False)
+        return index
+
+    def _rank(self, shas: List[str], query_vector: np.ndarray, k: int) -> List[Dict[str, Any]]:
+        hits: List[Tuple[float, str, int]] = []
+        with metrics.span("search", "retrieval"):
+            for sha in shas:
+                try:
+                    index = self._index(sha)
+                except OSError as e:
+                    settings.dprint(f"[retrieval] index for {sha[:12]} unavailable: {e}")
+                    continue
+                scores = np.asarray(index.vectors @ query_vector)
+                top = np.argpartition(-scores, min(k, scores.size) - 1)[:k] if scores.size > k else np.arange(scores.size)
+                hits += [(float(scores[i]), sha, int(i)) for i in top]
+        hits.sort(key=lambda h: -h[0])
+        out: List[Dict[str, Any]] = []
+        for score, sha, i in hits[:k]:
+            index = self._index(sha)
+            out.append({"name": index.name, "score": score, "text": index.chunks[i]["text"]})
+        return out
+
+    def search(self, shas: List[str], query: str, k: int | None = None, session_id: str | None = None) -> List[Dict[str, Any]]:
+        """Top-`k` chunks across the documents `shas` for `query`, best first."""
+        if not shas or not query.strip():
+            return []
+        query_vector = embedder.embed([query], session_id=session_id)[0]
+        return self._rank(shas, query_vector, k or settings.RETRIEVAL_TOP_K)
+
+    async def asearch(
+        self, shas: List[str], query: str, k: int | None = None, session_id: str | None = None
+    ) -> List[Dict[str, Any]]:
+        if not shas or not query.strip():
+            return []
+        query_vector = (await embedder.aembed([query], session_id=session_id))[0]
+        return await asyncio.to_thread(self._rank, shas, query_vector, k or settings.RETRIEVAL_TOP_K)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open": len(self._open), "built": self.built, "reused": self.reused}
+
+
+def context_message(question: str, hits: List[Dict[str, Any]]) -> str:
+    """The user turn sent to the model: retrieved excerpts followed by the question."""
+    if not hits:
+        return f"(No relevant passages were found in the uploaded documents.)\n\nQuestion: {question}"
+    excerpts = "\n\n".join(f"[{n}] ({h['name']})\n{h['text']}" for n, h in enumerate(hits, 1))
+    return (
+        "Excerpts retrieved from the uploaded documents:\n\n"
+        f"{excerpts}\n\nQuestion: {question}"
+    )
+
+
+retriever = LocalRetriever(settings.RETRIEVAL_INDEX_DIR)
+metrics.register("chatbot_retrieval_index", "gauge", "Local retrieval indexes open, built and reused.", "stat", retriever.stats)
@@ -0,0 +1,320 @@
+from __future__ import annotations
+
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List
+
+import numpy as np
+
+import config.settings as settings
+from config.prompts import SYS_PROMPTS
+from core.batch_runner import completed_ids, ends_with_newline, field, read_records, row_id
+from core.embeddings import embedder
+from core.rate_limit import estimate_tokens, limiter
+from core.state import SessionState
+from utils.chat_format import StreamingMessageBuffer
+from utils.coalesce import UpdateCoalescer
+
+SIMILARITY_TASK = "Sentence Similarity"
+
+_SEPARATOR = re.compile(r"^-{3,}$")
+_TOP = re.compile(r"^/top\s*-?\s*(\d+)$", re.IGNORECASE)
+_EXPLAIN = re.compile(r"^/explain$", re.IGNORECASE)
+_USAGE = (
+    "Enter two sentences on separate lines to compare them. More lines give a similarity matrix; "
+    "put `---` between two groups for an N×M matrix. Add `/top 3` to list the nearest matches "
+    "(for the first line, or for each line above `---`), and `/explain` for a written explanation."
+)
+
+
+def embedding_enabled(task: str) -> bool:
+    """True when Sentence Similarity should be computed from embeddings instead of the chat model."""
+    return settings.SIMILARITY_ENGINE == "embedding" and task == SIMILARITY_TASK
+
+
+# --- Vector math ---
+def cosine_matrix(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """(N, M) cosine similarities between rows of two unit-normalized matrices."""
+    return left @ right.T
+
+
+def pair_scores(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Row-wise cosine similarity of aligned pairs (left[i], right[i])."""
+    return np.einsum("ij,ij->i", left, right)
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """(indices, scores) of the `k` highest columns per row, best first."""
+    k = max(1, min(k, scores.shape[1]))
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-part, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(part, order, axis=1)
+
+
+# --- Chat requests ---
+class SimilarityRequest:
+    """Sentences and options parsed from a chat message (see `_USAGE`)."""
+
+    def __init__(self, message: str) -> None:
+        self.left: List[str] = []
+        self.right: List[str] = []
+        self.top_k = 0
+        self.explain = False
+        self.separated = False
+        for raw in (message or "").splitlines():
+            line = raw.strip()
+            if not line:
+                continue
+            top = _TOP.match(line)
+            if top:
+                self.top_k = int(top.group(1))
+            elif _EXPLAIN.match(line):
+                self.explain = True
+            elif _SEPARATOR.match(line):
+                self.separated = True
+            else:
+                (self.right if self.separated else self.left).append(line)
+        if not self.separated:
+            if self.top_k:
+                # First line is the query, the rest are candidates
+                self.left, self.right = self.left[:1], self.left[1:]
+            elif len(self.left) == 2:
+                self.left, self.right = self.left[:1], self.left[1:]
+            else:
+                self.right = self.left
+
+    @property
+    def valid(self) -> bool:
+        # Identical texts are fine (they score 1.0); an all-pairs matrix needs at least two lines
+        if self.right is self.left:
+            return len(self.left) >= 2
+        return bool(self.left) and bool(self.right)
+
+    @property
+    def texts(self) -> List[str]:
+        return list(dict.fromkeys(self.left + self.right))
+
+
+def _cell(text: str, limit: int = 60) -> str:
+    text = text.replace("|", "\\|")
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def format_scores(req: SimilarityRequest, scores: np.ndarray) -> str:
+    """Markdown for a pair score, a top-k list or a (truncated) matrix."""
+    model = settings.EMBEDDING_MODEL
+    if len(req.left) == 1 and len(req.right) == 1:
+        return f"**Cosine similarity:** {scores[0, 0]:.4f}\n\n_Embedding model: {model}_"
+    if req.top_k:
+        idx, best = top_k(scores, req.top_k)
+        blocks = []
+        for i, query in enumerate(req.left[: settings.SIMILARITY_DISPLAY_MAX]):
+            rows = "\n".join(f"| {r + 1} | {_cell(req.right[j])} | {s:.4f} |" for r, (j, s) in enumerate(zip(idx[i], best[i])))
+            blocks.append(f"**{_cell(query, 120)}**\n\n| Rank | Match | Cosine |\n|---|---|---|\n{rows}")
+        return "\n\n".join(blocks) + f"\n\n_Embedding model: {model}_"
+    n = settings.SIMILARITY_DISPLAY_MAX
+    left, right = req.left[:n], req.right[:n]
+    # All-pairs matrices number rows and columns alike; N×M ones use A/B labels
+    square = req.right is req.left
+    row_label = (lambda i: f"{i + 1}") if square else (lambda i: f"A{i + 1}")
+    col_label = (lambda j: f"{j + 1}") if square else (lambda j: f"B{j + 1}")
+    header = "| | " + " | ".join(col_label(j) for j in range(len(right))) + " |"
+    rule = "|---" * (len(right) + 1) + "|"
+    body = "\n".join(
+        f"| **{row_label(i)}** | " + " | ".join(f"{scores[i, j]:.3f}" for j in range(len(right))) + " |"
+        for i in range(len(left))
+    )
+    legend = [f"- {row_label(i)}: {_cell(t, 120)}" for i, t in enumerate(left)]
+    if not square:
+        legend += [f"- {col_label(j)}: {_cell(t, 120)}" for j, t in enumerate(right)]
+    note = ""
+    if len(req.left) > n or len(req.right) > n:
+        note = (
+            f"\n\n_Showing the first {len(left)}×{len(right)} of {len(req.left)}×{len(req.right)} cells; "
+            "use `batch_cli.py --backend embedding` for bulk runs._"
+        )
+    return f"{header}\n{rule}\n{body}\n\n" + "\n".join(legend) + f"{note}\n\n_Embedding model: {model}_"
+
+
+def _explain_messages(req: SimilarityRequest, table: str) -> List[Dict[str, str]]:
+    pairs = "\n".join(req.left) + ("\n---\n" + "\n".join(req.right) if req.right is not req.left else "")
+    return [
+        {"role": "system", "content": SYS_PROMPTS.get(SIMILARITY_TASK, "You are a helpful assistant.")},
+        {
+            "role": "user",
+            "content": (
+                f"Sentences:\n{pairs}\n\nEmbedding cosine similarities:\n{table}\n\n"
+                "Explain briefly what makes these sentences similar or different. Do not recompute the scores."
+            ),
+        },
+    ]
+
+
+def _explain_kwargs(req: SimilarityRequest, table: str, session: SessionState | None) -> Dict[str, Any]:
+    cfg = settings.TASK_CONFIG.get(SIMILARITY_TASK, {"model": "gpt-4o-mini"})
+    model = cfg.get("model", "gpt-4o-mini")
+    messages = _explain_messages(req, table)
+    return {
+        "model": model,
+        "messages": messages,
+        "stream": True,
+        "lane": model,
+        "tokens": estimate_tokens(model, messages),
+        "session_id": session.session_id if session else None,
+    }
+
+
+def _chunk_text(chunk: Any) -> str:
+    try:
+        return getattr(chunk.choices[0].delta, "content", None) or ""
+    except Exception:
+        return ""
+
+
+def similarity_stream_chat(
+    message: str,
+    history_messages: List[Dict[str, Any]],
+    task: str,
+    session: SessionState | None = None,
+) -> Iterator[tuple[str, List[Dict[str, Any]]]]:
+    """Answer a Sentence Similarity turn from embeddings; the chat model only streams `/explain` text.
+
+    Yields ("", messages_list) like `responses_stream_chat`.
+    """
+    buf = StreamingMessageBuffer(history_messages, message)
+    if settings.client is None:
+        buf.set_text("Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'.")
+        yield "", buf.snapshot()
+        return
+    req = SimilarityRequest(message)
+    if not req.valid:
+        buf.set_text(_USAGE)
+        yield "", buf.snapshot()
+        return
+    yield "", buf.snapshot(placeholder="Computing similarity...")
+    try:
+        vectors = dict(zip(req.texts, embedder.embed(req.texts, session_id=session.session_id if session else None)))
+        scores = cosine_matrix(np.stack([vectors[t] for t in req.left]), np.stack([vectors[t] for t in req.right]))
+        table = format_scores(req, scores)
+        buf.set_text(table)
+        yield "", buf.snapshot()
+        if not req.explain:
+            return
+        buf.append("\n\n**Explanation**\n\n")
+        coalescer = UpdateCoalescer()
+        stream = limiter.call(settings.client.chat.completions.create, **_explain_kwargs(req, table, session))
+        for chunk in stream:
+            delta_text = _chunk_text(chunk)
+            if delta_text:
+                buf.append(delta_text)
+                if coalescer.ready(len(delta_text)):
+                    yield "", buf.snapshot()
+        yield "", buf.snapshot()
+    except Exception as e:
+        buf.append(f"\n\nError: Similarity failed. {e}")
+        yield "", buf.snapshot()
+
+
+async def similarity_stream_chat_async(
+    message: str,
+    history_messages: List[Dict[str, Any]],
+    task: str,
+    session: SessionState | None = None,
+) -> AsyncIterator[tuple[str, List[Dict[str, Any]]]]:
+    """Async generator version of `similarity_stream_chat`."""
+    buf = StreamingMessageBuffer(history_messages, message)
+    if settings.async_client is None:
+        buf.set_text("Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'.")
+        yield "", buf.snapshot()
+        return
+    req = SimilarityRequest(message)
+    if not req.valid:
+        buf.set_text(_USAGE)
+        yield "", buf.snapshot()
+        return
+    yield "", buf.snapshot(placeholder="Computing similarity...")
+    try:
+        matrix = await embedder.aembed(req.texts, session_id=session.session_id if session else None)
+        vectors = dict(zip(req.texts, matrix))
+        scores = cosine_matrix(np.stack([vectors[t] for t in req.left]), np.stack([vectors[t] for t in req.right]))
+        table = format_scores(req, scores)
+        buf.set_text(table)
+        yield "", buf.snapshot()
+        if not req.explain:
+            return
+        buf.append("\n\n**Explanation**\n\n")
+        coalescer = UpdateCoalescer()
+        stream = await limiter.acall(settings.async_client.chat.completions.create, **_explain_kwargs(req, table, session))
+        async for chunk in stream:
+            delta_text = _chunk_text(chunk)
+            if delta_text:
+                buf.append(delta_text)
+                if coalescer.ready(len(delta_text)):
+                    yield "", buf.snapshot()
+        yield "", buf.snapshot()
+    except Exception as e:
+        buf.append(f"\n\nError: Similarity failed. {e}")
+        yield "", buf.snapshot()
+
+
+# --- Bulk ---
+async def run_similarity_batch(
+    input_path: str,
+    output_path: str,
+    left_field: str = "text_a",
+    right_field: str = "text_b",
+    id_field: str = "id",
+    chunk_rows: int = 1000,
+) -> Dict[str, float]:
+    """Score sentence pairs from a JSONL/CSV file with batched embeddings.
+
+    Appends {"id", "task", "output": cosine, "error"} records to `output_path`;
+    rows already written without an error are skipped, so an interrupted run can be resumed.
+    """
+    if settings.async_client is None:
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    started = time.monotonic()
+    done = completed_ids(output_path)
+    rows = skipped = errors = 0
+
+    terminated = ends_with_newline(output_path)
+    with open(output_path, "a", encoding="utf-8") as out:
+        if not terminated:
+            out.write("\n")  # close off a line truncated by an interrupted run
+
+        async def flush(chunk: List[Dict[str, str]]) -> int:
+            texts = [r["a"] for r in chunk] + [r["b"] for r in chunk]
+            try:
+                vectors = await embedder.aembed(texts)
+                scores = pair_scores(vectors[: len(chunk)], vectors[len(chunk) :])
+                records = [{"id": r["id"], "task": SIMILARITY_TASK, "output": round(float(s), 6), "error": None} for r, s in zip(chunk, scores)]
+                failed = 0
+            except Exception as e:
+                records = [{"id": r["id"], "task": SIMILARITY_TASK, "output": None, "error": str(e)} for r in chunk]
+                failed = len(chunk)
+            out.write("".join(json.dumps(rec, ensure_ascii=False) + "\n" for rec in records))
+            out.flush()
+            return failed
+
+        chunk: List[Dict[str, str]] = []
+        for index, record in enumerate(read_records(input_path)):
+            rid = row_id(record, id_field, index)
+            if rid in done:
+                skipped += 1
+                continue
+            chunk.append({"id": rid, "a": field(record, left_field, index), "b": field(record, right_field, index)})
+            if len(chunk) >= chunk_rows:
+                errors += await flush(chunk)
+                rows += len(chunk)
+                chunk = []
+                elapsed = max(time.monotonic() - started, 1e-6)
+                print(f"{rows} pairs ({errors} errors, {skipped} skipped) | {rows / elapsed:.1f} pairs/s", flush=True)
+        if chunk:
+            errors += await flush(chunk)
+            rows += len(chunk)
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"{rows} pairs ({errors} errors, {skipped} skipped) in {elapsed:.1f}s | {rows / elapsed:.1f} pairs/s", flush=True)
+    return {"rows": rows, "errors": errors, "skipped": skipped, "seconds": elapsed}
@@ -1,15 +1,132 @@
 # Shared application state and session management
+from __future__ import annotations
 
-# Global variables to hold state across Gradio interactions
-vector_store_id: str | None = None
-assistant_id: str | None = None
-thread_id: str | None = None
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
 
+import gradio as gr
 
-def reset_session() -> str:
+import config.settings as settings
+from utils.chat_format import MessageNormalizer
+
+# Key used when no Gradio request is available (e.g. scripts calling the core directly)
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionState:
+    """IDs owned by a single conversation (one Gradio browser session)."""
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.vector_store_id: str | None = None
+        self.assistant_id: str | None = None
+        self.thread_id: str | None = None
+        self.ingestion_job_id: str | None = None
+        # Documents in the local retrieval index (RETRIEVAL_BACKEND=local): sha256 -> file name.
+        # Filled by ingestion workers while chat turns read it, so access goes through the lock.
+        self.documents: "OrderedDict[str, str]" = OrderedDict()
+        self._documents_lock = threading.Lock()
+        # Uploaded tables for Table Question Answering: name -> core.tables.TableRef
+        self.tables: "OrderedDict[str, Any]" = OrderedDict()
+        # Memoized history sanitization for this conversation
+        self.normalizer = MessageNormalizer()
+        self.last_access = time.monotonic()
+
+    def add_document(self, sha: str, name: str) -> bool:
+        """Record an indexed document; False if it was already in the session."""
+        with self._documents_lock:
+            if sha in self.documents:
+                return False
+            self.documents[sha] = name
+            return True
+
+    def has_document(self, sha: str) -> bool:
+        with self._documents_lock:
+            return sha in self.documents
+
+    def document_shas(self) -> list[str]:
+        """Snapshot of the session's document hashes, in upload order."""
+        with self._documents_lock:
+            return list(self.documents)
+
+    def reset(self) -> None:
+        self.assistant_id = None
+        self.thread_id = None
+
+
+class SessionStore:
+    """Thread-safe session map with LRU eviction and an idle TTL.
+
+    Memory is bounded by `max_sessions`; entries idle for longer than
+    `ttl_seconds` are dropped lazily on access.
+    """
+
+    def __init__(self, max_sessions: int, ttl_seconds: float) -> None:
+        self.max_sessions = max(1, int(max_sessions))
+        self.ttl_seconds = float(ttl_seconds)
+        self._sessions: OrderedDict[str, SessionState] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str | None) -> SessionState:
+        key = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+            sess = self._sessions.get(key)
+            if sess is None:
+                sess = SessionState(key)
+                self._sessions[key] = sess
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    settings.dprint(f"Evicted session {evicted} (LRU).")
+            else:
+                self._sessions.move_to_end(key)
+            sess.last_access = now
+            return sess
+
+    def discard(self, session_id: str | None) -> None:
+        """Forget a session now (its browser tab closed) rather than waiting for LRU/TTL eviction."""
+        with self._lock:
+            self._sessions.pop(session_id or DEFAULT_SESSION_ID, None)
+
+    def _evict_expired(self, now: float) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        # Oldest entries are at the front; stop at the first live one
+        while self._sessions:
+            key, sess = next(iter(self._sessions.items()))
+            if now - sess.last_access <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            settings.dprint(f"Evicted session {key} (idle TTL).")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+sessions = SessionStore(settings.SESSION_MAX_SESSIONS, settings.SESSION_TTL_SECONDS)
+
+
+def session_id_from_request(request: Any) -> str | None:
+    """Extract Gradio's per-browser session hash from a `gr.Request`, if any."""
+    return getattr(request, "session_hash", None) if request is not None else None
+
+
+def get_session(request: gr.Request | None = None) -> SessionState:
+    """Return the state for the Gradio session behind `request` (or the default session)."""
+    return sessions.get(session_id_from_request(request))
+
+
+def close_session(request: gr.Request) -> None:
+    """`Blocks.unload` handler: drop the state of the session whose browser tab went away."""
+    sessions.discard(session_id_from_request(request))
+
+
+def reset_session(request: gr.Request | None = None) -> str:
     """Resets the assistant and thread, forcing recreation on the next message."""
-    global assistant_id, thread_id
-    assistant_id = None
-    thread_id = None
+    get_session(request).reset()
     print("Session reset. New assistant and thread will be created.")
     return "Session has been reset."
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import json
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+
+import config.settings as settings
+from config.prompts import SYS_PROMPTS
+from core import metrics
+from core.rate_limit import estimate_tokens, limiter
+from core.state import SessionState
+from core.tables import AGGREGATIONS, FILTER_OPS, Table, TableQueryError, format_result, query_table, table_store
+from utils.chat_format import StreamingMessageBuffer, messages_to_openai
+from utils.coalesce import UpdateCoalescer
+from utils.token_budget import context_budget, fit_messages
+
+TABLE_QA_TASK = "Table Question Answering"
+
+_MISSING_KEY_TEXT = (
+    "Error: OpenAI API key is not set. Please enter your key under '0. API Key' and click 'Set API Key'."
+)
+
+# Function tool run in-process against the parsed tables; `table` gets an enum of the session's tables
+QUERY_TABLE_TOOL: Dict[str, Any] = {
+    "type": "function",
+    "function": {
+        "name": "query_table",
+        "description": (
+            "Run a filter / group-by / aggregate query over an uploaded table and return the result rows "
+            "as JSON. Without group_by or aggregations, returns matching rows (optionally only `columns`)."
+        ),
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "table": {"type": "string", "description": "Table name."},
+                "filters": {
+                    "type": "array",
+                    "description": "Conditions combined with AND.",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "column": {"type": "string"},
+                            "op": {"type": "string", "enum": list(FILTER_OPS)},
+                            "value": {"description": "Number, string, or a list for in / not_in."},
+                        },
+                        "required": ["column", "op"],
+                    },
+                },
+                "group_by": {"type": "array", "items": {"type": "string"}},
+                "aggregations": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "func": {"type": "string", "enum": list(AGGREGATIONS)},
+                            "column": {"type": "string", "description": "Omit for a row count."},
+                            "as": {"type": "string", "description": "Result column name."},
+                        },
+                        "required": ["func"],
+                    },
+                },
+                "columns": {"type": "array", "items": {"type": "string"}, "description": "Columns to return for row queries."},
+                "order_by": {"type": "string", "description": "Column or aggregation alias to sort by."},
+                "descending": {"type": "boolean"},
+                "limit": {"type": "integer", "minimum": 1},
+            },
+            "required": ["table"],
+        },
+    },
+}
+
+_TOOL_INSTRUCTIONS = (
+    "The user's tables are loaded locally; you only see their schema below. Answer questions about the data "
+    "by calling `query_table` (filters, group_by, aggregations, order_by, limit) rather than guessing, and "
+    "base numbers on the returned rows. Results list at most a few rows, so aggregate instead of listing."
+)
+
+
+def has_tables(task: str, session: SessionState | None) -> bool:
+    """True when a turn should take the local table path."""
+    return settings.TABLE_QA_ENABLED and task == TABLE_QA_TASK and session is not None and bool(session.tables)
+
+
+def _tool_schema(names: List[str]) -> Dict[str, Any]:
+    tool = copy.deepcopy(QUERY_TABLE_TOOL)
+    tool["function"]["parameters"]["properties"]["table"]["enum"] = names
+    return tool
+
+
+def _resolve_tables(session: SessionState) -> Tuple[Dict[str, Table], List[str]]:
+    """Parsed tables of the session (waits for parses in progress) and per-table errors."""
+    tables: Dict[str, Table] = {}
+    errors: List[str] = []
+    for name, ref in list(session.tables.items()):
+        try:
+            tables[name] = table_store.get(ref)
+        except Exception as e:
+            errors.append(f"{ref.path.name}: {e}")
+    return tables, errors
+
+
+def _system_prompt(task: str, tables: Dict[str, Table]) -> str:
+    instructions = SYS_PROMPTS.get(task, "You are a helpful assistant.")
+    schemas = "\n\n".join(t.schema() for t in tables.values())
+    return f"{instructions}\n\n{_TOOL_INSTRUCTIONS}\n\n{schemas}"
+
+
+def run_query(tables: Dict[str, Table], arguments_json: str | None) -> str:
+    """Execute one `query_table` call; errors are returned to the model so it can correct the query."""
+    try:
+        args = json.loads(arguments_json or "{}")
+        if not isinstance(args, dict):
+            raise TableQueryError("Arguments must be a JSON object.")
+        name = args.get("table")
+        table = tables.get(name) if name else (next(iter(tables.values())) if len(tables) == 1 else None)
+        if table is None:
+            raise TableQueryError(f"Unknown table {name!r}. Tables: {', '.join(tables)}")
+        result = query_table(
+            table,
+            filters=args.get("filters"),
+            group_by=args.get("group_by"),
+            aggregations=args.get("aggregations"),
+            columns=args.get("columns"),
+            order_by=args.get("order_by"),
+            descending=bool(args.get("descending", False)),
+            limit=args.get("limit"),
+        )
+        return format_result(result)
+    except (TableQueryError, ValueError, TypeError, KeyError) as e:
+        return json.dumps({"error": str(e)})
+
+
+class _ToolCalls:
+    """Reassembles streamed `tool_calls` deltas (arguments arrive in fragments, keyed by index)."""
+
+    def __init__(self) -> None:
+        self._calls: Dict[int, Dict[str, str]] = {}
+
+    def add(self, deltas: List[Any]) -> None:
+        for d in deltas:
+            call = self._calls.setdefault(getattr(d, "index", 0) or 0, {"id": "", "name": "", "arguments": ""})
+            if getattr(d, "id", None):
+                call["id"] = d.id
+            fn = getattr(d, "function", None)
+            if fn is not None:
+                call["name"] += getattr(fn, "name", None) or ""
+                call["arguments"] += getattr(fn, "arguments", None) or ""
+
+    def __bool__(self) -> bool:
+        return bool(self._calls)
+
+    def calls(self) -> List[Dict[str, str]]:
+        return [self._calls[i] for i in sorted(self._calls)]
+
+    def assistant_message(self, text: str) -> Dict[str, Any]:
+        return {
+            "role": "assistant",
+            "content": text or None,
+            "tool_calls": [
+                {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+                for c in self.calls()
+            ],
+        }
+
+
+def _consume_chunk(chunk: Any, calls: _ToolCalls) -> str:
+    """Record tool-call fragments from one chunk and return its text delta."""
+    try:
+        delta = chunk.choices[0].delta
+    except Exception:
+        return ""
+    tool_deltas = getattr(delta, "tool_calls", None)
+    if tool_deltas:
+        calls.add(tool_deltas)
+    return getattr(delta, "content", None) or ""
+
+
+def _tool_messages(tables: Dict[str, Table], calls: _ToolCalls) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for call in calls.calls():
+        if call["name"] == "query_table":
+            content = run_query(tables, call["arguments"])
+        else:
+            content = json.dumps({"error": f"Unknown tool {call['name']!r}."})
+        out.append({"role": "tool", "tool_call_id": call["id"], "content": content})
+    return out
+
+
+def _prepare(
+    task: str, tables: Dict[str, Table], buf: StreamingMessageBuffer
+) -> Tuple[str, List[Dict[str, Any]], Dict[str, Any]]:
+    """(model, trimmed request messages with the schema prompt, tool schema) for the first round."""
+    cfg = settings.TASK_CONFIG.get(task, {"model": "gpt-4o-mini"})
+    model = cfg.get("model", "gpt-4o-mini")
+    oa_messages = messages_to_openai(buf.messages, system_instruction=_system_prompt(task, tables))
+    request_messages = fit_messages(oa_messages[:-1], model, context_budget(task))
+    return model, request_messages, _tool_schema(list(tables))
+
+
+def _round_kwargs(model: str, messages: List[Dict[str, Any]], tool: Dict[str, Any], last: bool, session: SessionState) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "messages": messages,
+        "tools": [tool],
+        # The final round must answer with what it has
+        "tool_choice": "none" if last else "auto",
+        "stream": True,
+        "lane": model,
+        "tokens": estimate_tokens(model, messages),
+        "session_id": session.session_id,
+    }
+
+
+def _tables_error(errors: List[str]) -> str:
+    return "Error: none of the uploaded tables could be read. " + "; ".join(errors)
+
+
+def table_stream_chat(
+    message: str,
+    history_messages: List[Dict[str, Any]],
+    task: str,
+    session: SessionState,
+) -> Iterator[tuple[str, List[Dict[str, Any]]]]:
+    """Stream an answer about the session's uploaded tables (Chat Completions + `query_table`).
+
+    Tables are parsed once into columnar arrays (see `core.tables`); the model
+    sees only their schema and asks for filter/group/aggregate queries, which
+    run in-process. Yields ("", messages_list) like `responses_stream_chat`.
+    """
+    buf = StreamingMessageBuffer(history_messages, message)
+    if settings.client is None:
+        buf.set_text(_MISSING_KEY_TEXT)
+        yield "", buf.snapshot()
+        return
+    yield "", buf.snapshot(placeholder="Reading tables...")
+    tables, errors = _resolve_tables(session)
+    if not tables:
+        buf.set_text(_tables_error(errors))
+        yield "", buf.snapshot()
+        return
+    model, request_messages, tool = _prepare(task, tables, buf)
+
+    coalescer = UpdateCoalescer()
+    timer = metrics.StreamTimer("table")
+    try:
+        rounds = max(0, settings.TABLE_QA_MAX_TOOL_ROUNDS)
+        for round_no in range(rounds + 1):
+            calls = _ToolCalls()
+            round_text: List[str] = []
+            timer.stream_opened()
+            stream = limiter.call(
+                settings.client.chat.completions.create,
+                **_round_kwargs(model, request_messages, tool, round_no == rounds, session),
+            )
+            timer.event()
+            for chunk in stream:
+                delta_text = _consume_chunk(chunk, calls)
+                if delta_text:
+                    round_text.append(delta_text)
+                    buf.append(delta_text)
+                    if coalescer.ready(len(delta_text)):
+                        timer.delta()
+                        yield "", buf.snapshot()
+            if not calls:
+                break
+            yield "", buf.snapshot(placeholder="Querying tables...")
+            with metrics.span("tools", "table"):
+                outputs = _tool_messages(tables, calls)
+            request_messages = request_messages + [calls.assistant_message("".join(round_text))] + outputs
+        timer.finish()
+        yield "", buf.snapshot()
+    except Exception as e:
+        buf.append(f"Error: Streaming failed. {e}")
+        yield "", buf.snapshot()
+
+
+async def table_stream_chat_async(
+    message: str,
+    history_messages: List[Dict[str, Any]],
+    task: str,
+    session: SessionState,
+) -> AsyncIterator[tuple[str, List[Dict[str, Any]]]]:
+    """Async generator version of `table_stream_chat`; parsing and queries run off the event loop."""
+    buf = StreamingMessageBuffer(history_messages, message)
+    if settings.async_client is None:
+        buf.set_text(_MISSING_KEY_TEXT)
+        yield "", buf.snapshot()
+        return
+    yield "", buf.snapshot(placeholder="Reading tables...")
+    tables, errors = await asyncio.to_thread(_resolve_tables, session)
+    if not tables:
+        buf.set_text(_tables_error(errors))
+        yield "", buf.snapshot()
+        return
+    model, request_messages, tool = _prepare(task, tables, buf)
+
+    coalescer = UpdateCoalescer()
+    timer = metrics.StreamTimer("table_async")
+    try:
+        rounds = max(0, settings.TABLE_QA_MAX_TOOL_ROUNDS)
+        for round_no in range(rounds + 1):
+            calls = _ToolCalls()
+            round_text: List[str] = []
+            timer.stream_opened()
+            stream = await limiter.acall(
+                settings.async_client.chat.completions.create,
+                **_round_kwargs(model, request_messages, tool, round_no == rounds, session),
+            )
+            timer.event()
+            async for chunk in stream:
+                delta_text = _consume_chunk(chunk, calls)
+                if delta_text:
+                    round_text.append(delta_text)
+                    buf.append(delta_text)
+                    if coalescer.ready(len(delta_text)):
+                        timer.delta()
+                        yield "", buf.snapshot()
+            if not calls:
+                break
+            yield "", buf.snapshot(placeholder="Querying tables...")
+            with metrics.span("tools", "table_async"):
+                outputs = await asyncio.to_thread(_tool_messages, tables, calls)
+            request_messages = request_messages + [calls.assistant_message("".join(round_text))] + outputs
+        timer.finish()
+        yield "", buf.snapshot()
+    except Exception as e:
+        buf.append(f"Error: Streaming failed. {e}")
+        yield "", buf.snapshot()
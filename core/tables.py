@@ -0,0 +1,575 @@
+from __future__ import annotations
+
+import csv
+import json
+import math
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+import config.settings as settings
+from core import metrics
+from core.upload_manifest import file_sha256
+
+# Strings read as missing values in text files
+_NULL_STRINGS = frozenset(("", "na", "n/a", "nan", "null", "none", "-"))
+_SNIFF_BYTES = 64 * 1024
+_MAX_CELL_CHARS = 200
+_SAMPLE_CATEGORIES = 8
+
+AGGREGATIONS = ("count", "sum", "mean", "min", "max", "nunique")
+FILTER_OPS = ("==", "!=", ">", ">=", "<", "<=", "in", "not_in", "contains", "is_null", "not_null")
+
+
+class TableQueryError(ValueError):
+    """A `query_table` request that cannot be executed (unknown column, bad operator...)."""
+
+
+class Column:
+    """One column in columnar form.
+
+    Built from the distinct raw cells and an int32 code per row (see
+    `_read_rows`), so each distinct cell is converted once. Numeric columns
+    hold a float64 array (NaN for missing) and remember whether every value
+    was integral. Text columns are dictionary-encoded: sorted unique
+    `categories` plus int32 `codes` (-1 for missing), so equality filters and
+    group-bys work on integers and code order is lexical order. Numbers
+    written with a leading zero (ZIP codes, account numbers) keep the column
+    as text.
+    """
+
+    __slots__ = ("name", "kind", "values", "is_int", "codes", "categories")
+
+    def __init__(self, name: str, distinct: Sequence[Any], codes: np.ndarray) -> None:
+        self.name = name
+        self.values: np.ndarray | None = None
+        self.codes: np.ndarray | None = None
+        self.categories: np.ndarray | None = None
+        self.is_int = False
+        numbers = None if _has_leading_zero(distinct) else _as_numbers(distinct)
+        if numbers is not None:
+            self.kind = "number"
+            self.values = numbers[codes]
+            finite = numbers[~np.isnan(numbers)]
+            self.is_int = bool(finite.size) and bool(np.all(finite == np.round(finite)))
+        else:
+            self.kind = "text"
+            self.categories, self.codes = _dictionary_encode(distinct, codes)
+
+    def __len__(self) -> int:
+        return len(self.values if self.kind == "number" else self.codes)  # type: ignore[arg-type]
+
+    def null_mask(self) -> np.ndarray:
+        return np.isnan(self.values) if self.kind == "number" else self.codes < 0  # type: ignore[operator]
+
+    def sort_key(self) -> np.ndarray:
+        """Float view that orders like the column (missing values as NaN)."""
+        if self.kind == "number":
+            return self.values  # type: ignore[return-value]
+        key = self.codes.astype(np.float64)  # type: ignore[union-attr]
+        key[self.codes < 0] = np.nan  # type: ignore[operator]
+        return key
+
+    def group_codes(self) -> np.ndarray:
+        if self.kind == "text":
+            return self.codes  # type: ignore[return-value]
+        _, inverse = np.unique(self.values, return_inverse=True)
+        return inverse
+
+    def value(self, i: int) -> Any:
+        if self.kind == "number":
+            return _number(self.values[i], self.is_int)  # type: ignore[index]
+        code = int(self.codes[i])  # type: ignore[index]
+        return None if code < 0 else _clip(str(self.categories[code]))  # type: ignore[index]
+
+    def describe(self) -> str:
+        if self.kind == "number":
+            finite = self.values[~np.isnan(self.values)]  # type: ignore[index]
+            if not finite.size:
+                return f"- {self.name} (number): empty"
+            lo, hi = _number(finite.min(), self.is_int), _number(finite.max(), self.is_int)
+            return f"- {self.name} ({'integer' if self.is_int else 'number'}): min {lo}, max {hi}"
+        n = len(self.categories)  # type: ignore[arg-type]
+        sample = ", ".join(json.dumps(_clip(str(c), 40)) for c in self.categories[:_SAMPLE_CATEGORIES])  # type: ignore[index]
+        more = ", ..." if n > _SAMPLE_CATEGORIES else ""
+        return f"- {self.name} (text): {n} distinct, e.g. {sample}{more}"
+
+
+class Table:
+    """A parsed table: named columns of equal length."""
+
+    def __init__(self, name: str, header: List[str], columns: List[Tuple[List[Any], np.ndarray]]) -> None:
+        self.name = name
+        self.columns: "OrderedDict[str, Column]" = OrderedDict()
+        for col_name, (distinct, codes) in zip(_unique_names(header), columns):
+            self.columns[col_name] = Column(col_name, distinct, codes)
+        self.n_rows = len(columns[0][1]) if columns else 0
+
+    def column(self, name: Any) -> Column:
+        col = self.columns.get(str(name))
+        if col is None:
+            raise TableQueryError(f"Unknown column {name!r}. Columns: {', '.join(self.columns)}")
+        return col
+
+    def schema(self) -> str:
+        """Compact description for the prompt: size, column types, ranges and sample values."""
+        lines = [f"Table {json.dumps(self.name)}: {self.n_rows} rows, {len(self.columns)} columns"]
+        lines += [col.describe() for col in self.columns.values()]
+        return "\n".join(lines)
+
+
+# --- Parsing ---
+def _as_text(v: Any) -> str:
+    if v is None:
+        return ""
+    if isinstance(v, float) and math.isnan(v):
+        return ""
+    if hasattr(v, "isoformat"):
+        return v.isoformat()
+    s = str(v).strip()
+    return "" if s.lower() in _NULL_STRINGS else s
+
+
+def _has_leading_zero(raw: Sequence[Any]) -> bool:
+    """True if a text cell is a number written with a leading zero ("02134"), which float parsing would lose."""
+    for v in raw:
+        if isinstance(v, str) and v[:1] in ("0", " ", "+", "-"):
+            s = v.strip().lstrip("+-")
+            if len(s) > 1 and s[0] == "0" and s[1].isdigit():
+                return True
+    return False
+
+
+def _as_numbers(raw: Sequence[Any]) -> np.ndarray | None:
+    """Column as float64 (NaN for missing), or None if any value is not numeric."""
+    if not len(raw):
+        return None
+    try:
+        # Fast path: clean numeric text or cells
+        return np.array(raw, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    # Vectorized clean-up: blanks and null markers to NaN, thousands separators dropped
+    text = np.strings.strip(np.array(raw, dtype=str))
+    missing = np.isin(np.strings.lower(text), list(_NULL_STRINGS) + ["none"])
+    if missing.all():
+        return None
+    # np.where widens the fixed-width dtype; assigning in place would truncate "nan" in <U1/<U2 columns
+    text = np.where(missing, "nan", text)
+    try:
+        return np.strings.replace(text, ",", "").astype(np.float64)
+    except ValueError:
+        return None
+
+
+def _dictionary_encode(distinct: Sequence[Any], first: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(sorted distinct values, int32 codes) with missing values coded -1."""
+    # Normalize once per distinct cell; cells that normalize alike share a code
+    normalized = [_as_text(v) for v in distinct]
+    categories = sorted(set(normalized))
+    if categories and categories[0] == "":
+        categories = categories[1:]
+    position = {c: i for i, c in enumerate(categories)}
+    position[""] = -1
+    remap = np.array([position[n] for n in normalized], dtype=np.int32)
+    return np.array(categories, dtype=str), remap[first]
+
+
+def _unique_names(header: List[str]) -> List[str]:
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for i, h in enumerate(header):
+        base = str(h).strip() if h is not None and str(h).strip() else f"column_{i + 1}"
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        names.append(base if n == 0 else f"{base}_{n + 1}")
+    return names
+
+
+def _read_rows(rows: Iterable[Sequence[Any]]) -> tuple[List[str], List[Tuple[List[Any], np.ndarray]]]:
+    """Header plus per-column (distinct cells, int32 codes), built while the rows stream in.
+
+    Each column keeps a dict of the cells seen so far and appends one code per
+    row, so the body is never held as row lists or transposed; ragged rows are
+    padded with None. Empty rows are skipped.
+    """
+    rows = filter(None, rows)
+    first = next(rows, None)
+    if first is None:
+        return [], []
+    header = [str(h) if h is not None else "" for h in first]
+    indexes: List[Dict[Any, int]] = [{} for _ in header]
+    codes: List[array] = [array("i") for _ in header]
+    n_rows = 0
+    for row in rows:
+        if len(row) > len(indexes):  # a wider row: new columns are missing in earlier rows
+            for _ in range(len(row) - len(indexes)):
+                header.append("")
+                indexes.append({None: 0})
+                codes.append(array("i", bytes(4 * n_rows)))
+        for index, out, v in zip(indexes, codes, row):
+            out.append(index.setdefault(v, len(index)))
+        if len(row) < len(indexes):
+            for index, out in zip(indexes[len(row) :], codes[len(row) :]):
+                out.append(index.setdefault(None, len(index)))
+        n_rows += 1
+    return header, [(list(index), np.frombuffer(out, dtype=np.intc).astype(np.int32)) for index, out in zip(indexes, codes)]
+
+
+def _read_delimited(path: Path) -> tuple[List[str], List[Tuple[List[Any], np.ndarray]]]:
+    with open(path, "r", encoding="utf-8-sig", errors="replace", newline="") as fh:
+        head = fh.read(_SNIFF_BYTES)
+        fh.seek(0)
+        if path.suffix.lower() == ".tsv":
+            delimiter = "\t"
+        else:
+            try:
+                delimiter = csv.Sniffer().sniff(head, delimiters=",;\t|").delimiter
+            except csv.Error:
+                delimiter = ","
+        return _read_rows(csv.reader(fh, delimiter=delimiter))
+
+
+def _read_xlsx(path: Path) -> tuple[List[str], List[Tuple[List[Any], np.ndarray]]]:
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise TableQueryError("Reading .xlsx files requires the 'openpyxl' package.") from e
+    wb = openpyxl.load_workbook(str(path), read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        return _read_rows(r for r in ws.iter_rows(values_only=True) if any(v is not None for v in r))
+    finally:
+        wb.close()
+
+
+def parse_table(path: Path | str, name: str | None = None) -> Table:
+    """Parse a CSV/TSV file or the active sheet of an XLSX workbook (first row is the header)."""
+    path = Path(path)
+    reader = _read_xlsx if path.suffix.lower() == ".xlsx" else _read_delimited
+    with metrics.span("table_parse", "table"):
+        header, columns = reader(path)
+        if not header:
+            raise TableQueryError(f"{path.name} is empty.")
+        return Table(name or path.stem, header, columns)
+
+
+# --- Queries ---
+def _number(v: Any, is_int: bool = False) -> Any:
+    f = float(v)
+    if math.isnan(f):
+        return None
+    if math.isinf(f):
+        return str(f)
+    if is_int or f.is_integer():
+        return int(f)
+    return round(f, 6)
+
+
+def _clip(s: str, limit: int = _MAX_CELL_CHARS) -> str:
+    return s if len(s) <= limit else s[: limit - 3] + "..."
+
+
+def _filter_mask(table: Table, filters: List[Dict[str, Any]]) -> np.ndarray:
+    mask = np.ones(table.n_rows, dtype=bool)
+    for f in filters or []:
+        if not isinstance(f, dict):
+            raise TableQueryError(f"Each filter must be an object, got {f!r}.")
+        col = table.column(f.get("column"))
+        op = f.get("op", "==")
+        value = f.get("value")
+        if op not in FILTER_OPS:
+            raise TableQueryError(f"Unknown filter op {op!r}. Use one of: {', '.join(FILTER_OPS)}")
+        if op == "is_null":
+            mask &= col.null_mask()
+        elif op == "not_null":
+            mask &= ~col.null_mask()
+        elif col.kind == "number":
+            mask &= _number_mask(col, op, value)
+        else:
+            mask &= _text_mask(col, op, value)
+    return mask
+
+
+def _number_mask(col: Column, op: str, value: Any) -> np.ndarray:
+    values = col.values
+    if op in ("in", "not_in"):
+        try:
+            wanted = np.array([float(v) for v in (value if isinstance(value, list) else [value])])
+        except (TypeError, ValueError):
+            raise TableQueryError(f"Column {col.name!r} is numeric; {op} needs numbers.")
+        hit = np.isin(values, wanted)
+        return hit if op == "in" else ~hit & ~np.isnan(values)  # type: ignore[operator]
+    if op == "contains":
+        raise TableQueryError(f"Column {col.name!r} is numeric; 'contains' only applies to text columns.")
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        raise TableQueryError(f"Column {col.name!r} is numeric; {value!r} is not a number.")
+    return {
+        "==": np.equal,
+        "!=": np.not_equal,
+        ">": np.greater,
+        ">=": np.greater_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+    }[op](values, x) & ~np.isnan(values)  # type: ignore[arg-type]
+
+
+def _text_mask(col: Column, op: str, value: Any) -> np.ndarray:
+    categories = col.categories
+    codes = col.codes
+    # Evaluate the predicate once per distinct value, then map through the codes
+    if op in ("in", "not_in"):
+        wanted = {_as_text(v) for v in (value if isinstance(value, list) else [value])}
+        matched = np.array([c in wanted for c in categories], dtype=bool)
+    elif op == "contains":
+        needle = _as_text(value).lower()
+        matched = np.array([needle in c.lower() for c in categories], dtype=bool)
+    elif op in ("==", "!="):
+        matched = categories == _as_text(value)
+    else:
+        s = _as_text(value)
+        matched = {">": categories > s, ">=": categories >= s, "<": categories < s, "<=": categories <= s}[op]
+    matched = np.append(np.asarray(matched, dtype=bool), False)  # index -1 (missing) never matches
+    hit = matched[codes]
+    if op in ("!=", "not_in"):
+        hit = ~hit & (codes >= 0)  # type: ignore[operator]
+    return hit
+
+
+def _combine_codes(keys: List[np.ndarray]) -> np.ndarray:
+    """One int64 key per row whose order matches the tuple of `keys` (codes >= -1)."""
+    combined = keys[0].astype(np.int64) + 1
+    for key in keys[1:]:
+        width = int(key.max()) + 2 if key.size else 1
+        if int(combined.max(initial=0)) >= np.iinfo(np.int64).max // width:
+            # Too many distinct combinations for one integer: renumber first
+            combined = np.unique(combined, return_inverse=True)[1].reshape(-1).astype(np.int64)
+        combined = combined * width + key + 1
+    return combined
+
+
+def _group_index(table: Table, group_by: List[str], rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(group id per selected row, first selected row of each group), groups in key order."""
+    key = _combine_codes([table.column(g).group_codes()[rows] for g in group_by])
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    return inverse.reshape(-1), rows[first]
+
+
+def _aggregate(col: Column | None, func: str, inverse: np.ndarray, rows: np.ndarray, n_groups: int) -> List[Any]:
+    if func == "count" and col is None:
+        return [int(c) for c in np.bincount(inverse, minlength=n_groups)]
+    assert col is not None
+    present = ~col.null_mask()[rows]
+    counts = np.bincount(inverse, weights=present, minlength=n_groups)
+    if func == "count":
+        return [int(c) for c in counts]
+    if func == "nunique":
+        codes = col.group_codes()[rows][present]
+        width = int(codes.max()) + 1 if codes.size else 1
+        pairs = np.unique(inverse[present].astype(np.int64) * width + codes)
+        return [int(c) for c in np.bincount(pairs // width, minlength=n_groups)]
+    if func in ("sum", "mean"):
+        if col.kind != "number":
+            raise TableQueryError(f"Cannot compute {func} of text column {col.name!r}.")
+        sums = np.bincount(inverse, weights=np.where(present, col.values[rows], 0.0), minlength=n_groups)  # type: ignore[index]
+        if func == "sum":
+            return [_number(s, col.is_int) for s in sums]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return [_number(m) for m in np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)]
+    # min / max: sort rows by group and reduce each contiguous run, ignoring NaN
+    key = col.sort_key()[rows]
+    order = np.argsort(inverse, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    reducer = np.fmin if func == "min" else np.fmax
+    reduced = np.full(n_groups, np.nan)
+    if order.size:
+        reduced[inverse[order][starts]] = reducer.reduceat(key[order], starts)
+    if col.kind == "number":
+        return [_number(v, col.is_int) for v in reduced]
+    return [None if math.isnan(v) else _clip(str(col.categories[int(v)])) for v in reduced]  # type: ignore[index]
+
+
+def _order(values: List[Any], descending: bool) -> np.ndarray:
+    """Stable order of result values with missing values last."""
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, (int, float)) for v in present):
+        key = np.array([np.nan if v is None else float(v) for v in values])
+    else:
+        _, key = np.unique(np.array(["" if v is None else str(v) for v in values], dtype=object), return_inverse=True)
+        key = key.astype(np.float64)
+        key[[i for i, v in enumerate(values) if v is None]] = np.nan
+    missing = np.isnan(key)
+    key = np.where(missing, 0.0, -key if descending else key)
+    return np.lexsort((key, missing))
+
+
+def query_table(
+    table: Table,
+    filters: List[Dict[str, Any]] | None = None,
+    group_by: List[str] | None = None,
+    aggregations: List[Dict[str, Any]] | None = None,
+    columns: List[str] | None = None,
+    order_by: str | None = None,
+    descending: bool = False,
+    limit: int | None = None,
+) -> Dict[str, Any]:
+    """Filter, group and aggregate `table` with vectorized NumPy operations.
+
+    Only the first `limit` result rows (capped at TABLE_QUERY_MAX_ROWS) are
+    materialized; `result_rows` reports how many there were in total.
+    """
+    max_rows = max(1, settings.TABLE_QUERY_MAX_ROWS)
+    limit = max(1, min(int(limit or max_rows), max_rows))
+    group_by = [str(g) for g in (group_by or [])]
+    aggregations = list(aggregations or [])
+    with metrics.span("table_query", "table"):
+        rows = np.flatnonzero(_filter_mask(table, filters or []))
+        out: "OrderedDict[str, List[Any]]" = OrderedDict()
+
+        if group_by or aggregations:
+            if not aggregations:
+                aggregations = [{"func": "count"}]
+            if group_by:
+                inverse, first = _group_index(table, group_by, rows)
+                n_groups = len(first)
+                for g in group_by:
+                    col = table.column(g)
+                    out[g] = [col.value(int(i)) for i in first]
+            else:
+                inverse, n_groups = np.zeros(rows.size, dtype=np.intp), 1
+            for agg in aggregations:
+                if not isinstance(agg, dict):
+                    raise TableQueryError(f"Each aggregation must be an object, got {agg!r}.")
+                func = agg.get("func", "count")
+                if func not in AGGREGATIONS:
+                    raise TableQueryError(f"Unknown aggregation {func!r}. Use one of: {', '.join(AGGREGATIONS)}")
+                col = table.column(agg["column"]) if agg.get("column") else None
+                if col is None and func != "count":
+                    raise TableQueryError(f"Aggregation {func!r} needs a column.")
+                alias = str(agg.get("as") or (f"{func}_{col.name}" if col else "count"))
+                out[alias] = _aggregate(col, func, inverse, rows, n_groups)
+            total = n_groups
+            if order_by:
+                if order_by not in out:
+                    raise TableQueryError(f"order_by must be a group_by column or aggregation alias: {', '.join(out)}")
+                order = _order(out[order_by], descending)[:limit]
+            else:
+                order = np.arange(min(total, limit))
+            records = [{k: v[int(i)] for k, v in out.items()} for i in order]
+        else:
+            selected = [table.column(c) for c in columns] if columns else list(table.columns.values())
+            total = int(rows.size)
+            if order_by:
+                key = table.column(order_by).sort_key()[rows]
+                missing = np.isnan(key)
+                key = np.where(missing, 0.0, -key if descending else key)
+                picked = rows[np.lexsort((key, missing))[:limit]]
+            else:
+                picked = rows[:limit]
+            records = [{c.name: c.value(int(i)) for c in selected} for i in picked]
+
+    return {
+        "table": table.name,
+        "matched_rows": int(rows.size),
+        "result_rows": total,
+        "rows": records,
+        "truncated": total > len(records),
+    }
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    """JSON for the tool message, dropping trailing rows past TABLE_RESULT_MAX_CHARS."""
+    text = json.dumps(result, ensure_ascii=False, default=str)
+    rows = result.get("rows", [])
+    while len(text) > settings.TABLE_RESULT_MAX_CHARS and len(rows) > 1:
+        rows = rows[: max(1, len(rows) // 2)]
+        text = json.dumps({**result, "rows": rows, "truncated": True}, ensure_ascii=False, default=str)
+    return text
+
+
+# --- Cache ---
+class TableRef:
+    """A table attached to a session; parsing happens in the background, keyed by content hash."""
+
+    def __init__(self, name: str, path: Path, sha: "Future[str]") -> None:
+        self.name = name
+        self.path = path
+        self.sha = sha
+
+
+class TableStore:
+    """Parsed tables cached by the SHA-256 of the file contents (LRU bounded).
+
+    Each upload is hashed and parsed on a small worker pool; identical
+    contents uploaded again, by any session, reuse the parsed table.
+    """
+
+    def __init__(self, max_tables: int, max_workers: int = 2) -> None:
+        self.max_tables = max(1, max_tables)
+        self._tables: "OrderedDict[str, Table]" = OrderedDict()
+        self._parsing: Dict[str, "Future[Table]"] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="table-parse")
+        self.hits = 0
+        self.parses = 0
+
+    def register(self, path: Path, name: str) -> TableRef:
+        """Start hashing and parsing `path` without waiting for it."""
+        return TableRef(name, path, self._executor.submit(self._warm, path, name))
+
+    def _warm(self, path: Path, name: str) -> str:
+        sha = file_sha256(path)
+        self._load(sha, path, name)
+        return sha
+
+    def get(self, ref: TableRef) -> Table:
+        """The parsed table behind `ref`, waiting for a parse in progress (re-parsed if evicted)."""
+        return self._load(ref.sha.result(), ref.path, ref.name)
+
+    def _load(self, sha: str, path: Path, name: str) -> Table:
+        with self._lock:
+            table = self._tables.get(sha)
+            if table is not None:
+                self._tables.move_to_end(sha)
+                self.hits += 1
+                return table
+            pending = self._parsing.get(sha)
+            owner = pending is None
+            if owner:
+                pending = self._parsing[sha] = Future()
+        if not owner:
+            return pending.result()  # type: ignore[union-attr]
+        try:
+            table = parse_table(path, name)
+        except BaseException as e:
+            with self._lock:
+                self._parsing.pop(sha, None)
+            pending.set_exception(e)  # type: ignore[union-attr]
+            raise
+        with self._lock:
+            self.parses += 1
+            self._tables[sha] = table
+            while len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+            self._parsing.pop(sha, None)
+        pending.set_result(table)  # type: ignore[union-attr]
+        settings.dprint(f"[tables] parsed {path.name}: {table.n_rows} rows x {len(table.columns)} columns")
+        return table
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"tables": len(self._tables), "hits": self.hits, "parses": self.parses}
+
+
+table_store = TableStore(settings.TABLE_CACHE_MAX_TABLES)
+
+metrics.register(
+    "chatbot_table_cache", "gauge", "Parsed table cache: cached tables, hits and parses.", "stat", table_store.stats
+)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, Set
+
+import config.settings as settings
+
+
+def file_sha256(path: Path | str) -> str:
+    """SHA-256 of a file's contents, streamed in chunks (never fully in memory)."""
+    with open(path, "rb") as fh:
+        return hashlib.file_digest(fh, "sha256").hexdigest()
+
+
+class UploadManifest:
+    """Local record of what has already been uploaded and indexed.
+
+    Layout (JSON):
+      files:         "<account>:<sha256>" -> {file_id, name, size}
+      vector_stores: "<vector_store_id>"  -> [sha256, ...] indexed in that store
+    """
+
+    def __init__(self, path: str | None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._stores: Dict[str, list[str]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            self._files = dict(data.get("files") or {})
+            self._stores = {k: list(v) for k, v in (data.get("vector_stores") or {}).items()}
+        except Exception as e:
+            print(f"Warning: could not load upload manifest from {self.path}: {e}")
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        try:
+            parent = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(parent, exist_ok=True)
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"files": self._files, "vector_stores": self._stores}, fh)
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"Warning: could not persist upload manifest to {self.path}: {e}")
+
+    @staticmethod
+    def _file_key(sha: str) -> str:
+        return f"{settings.account_fingerprint()}:{sha}"
+
+    def file_id(self, sha: str) -> str | None:
+        with self._lock:
+            entry = self._files.get(self._file_key(sha))
+            return entry.get("file_id") if entry else None
+
+    def record_file(self, sha: str, file_id: str, name: str, size: int) -> None:
+        with self._lock:
+            self._files[self._file_key(sha)] = {"file_id": file_id, "name": name, "size": size}
+            self._save_locked()
+
+    def forget_file(self, sha: str) -> None:
+        with self._lock:
+            if self._files.pop(self._file_key(sha), None) is not None:
+                self._save_locked()
+
+    def store_hashes(self, vector_store_id: str) -> Set[str]:
+        with self._lock:
+            return set(self._stores.get(vector_store_id) or [])
+
+    def add_to_store(self, vector_store_id: str, sha: str) -> None:
+        with self._lock:
+            hashes = self._stores.setdefault(vector_store_id, [])
+            if sha not in hashes:
+                hashes.append(sha)
+                self._save_locked()
+
+
+manifest = UploadManifest(settings.UPLOAD_MANIFEST_PATH)
@@ -0,0 +1 @@
+# Offline load-test harness (mock OpenAI/Tavily server and driver)
@@ -0,0 +1,317 @@
+"""Load-test driver: runs simulated chat sessions against the mock server.
+
+Starts `loadtest.mock_server` in a subprocess (or uses --mock-url), points
+the app's OpenAI and Tavily clients at it, then ramps the number of
+concurrent sessions. For each level it reports p50/p95/p99 time to first
+token (TTFT), tokens/s and error rate. The largest level whose p95 TTFT
+stays within --slo-ttft-ms is the estimated capacity of one process.
+
+Run from the repository root:
+
+    python -m loadtest.driver --scenario mix --sessions 8,16,32,64 --turns 3
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+from loadtest.mock_server import add_config_arguments
+
+# Contents of a reply that are progress placeholders, not model tokens
+_PLACEHOLDERS = ("", "...", "_Searching the web..._")
+_SCENARIO_TOOLS = {"chat": [], "assistant": ["Web Search"]}
+
+
+class TurnResult:
+    def __init__(self, kind: str, ttft: float | None, duration: float, tokens: int, error: str | None) -> None:
+        self.kind = kind
+        self.ttft = ttft
+        self.duration = duration
+        self.tokens = tokens
+        self.error = error
+
+
+class InFlight:
+    """Counts concurrently active sessions and remembers the peak."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+
+    def __enter__(self) -> "InFlight":
+        with self._lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        with self._lock:
+            self.current -= 1
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _reply_text(messages: List[dict]) -> str:
+    if not messages or messages[-1].get("role") != "assistant":
+        return ""
+    content = messages[-1].get("content")
+    return content if isinstance(content, str) else ""
+
+
+def _finish(kind: str, start: float, first: float | None, text: str) -> TurnResult:
+    error = text if "Error:" in text else None
+    # The mock emits one word per token
+    return TurnResult(kind, None if first is None else first - start, time.perf_counter() - start, len(text.split()), error)
+
+
+# --- Turns ---
+def _chat_turn_sync(kind: str, request: Any, history: List[dict], message: str, task: str) -> tuple[TurnResult, List[dict]]:
+    from core.assistant import chat_entry
+
+    start = time.perf_counter()
+    first = None
+    messages: List[dict] = history
+    for _, messages in chat_entry(message, history, task, _SCENARIO_TOOLS[kind], True, request):
+        if first is None and _reply_text(messages) not in _PLACEHOLDERS:
+            first = time.perf_counter()
+    return _finish(kind, start, first, _reply_text(messages)), messages
+
+
+async def _chat_turn_async(kind: str, request: Any, history: List[dict], message: str, task: str) -> tuple[TurnResult, List[dict]]:
+    from core.assistant import chat_entry_async
+
+    start = time.perf_counter()
+    first = None
+    messages: List[dict] = history
+    async for _, messages in chat_entry_async(message, history, task, _SCENARIO_TOOLS[kind], True, request):
+        if first is None and _reply_text(messages) not in _PLACEHOLDERS:
+            first = time.perf_counter()
+    return _finish(kind, start, first, _reply_text(messages)), messages
+
+
+def _upload_turn(request: Any, workdir: str, n_files: int, file_kb: int) -> TurnResult:
+    """Upload fresh files for this session and wait until the ingestion job is done."""
+    from core import state
+    from core.file_handler import upload_files
+    from core.ingestion import ingestion
+
+    paths = []
+    for i in range(n_files):
+        path = os.path.join(workdir, f"{request.session_hash}_{uuid.uuid4().hex[:8]}_{i}.txt")
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write((uuid.uuid4().hex + " ") * max(1, file_kb * 1024 // 33))
+        paths.append(path)
+    start = time.perf_counter()
+    summary, _, _, _ = upload_files(paths, request)
+    job = ingestion.get(state.get_session(request).ingestion_job_id)
+    while job is not None and not job.done:
+        time.sleep(0.05)
+    duration = time.perf_counter() - start
+    failed = job.counts().get("failed", 0) if job is not None else 0
+    error = None if job is not None and not failed else (job.summary() if job is not None else summary)
+    return TurnResult("upload", None, duration, 0, error)
+
+
+# --- Sessions ---
+def _session_kinds(scenario: str, index: int) -> str:
+    if scenario == "mix":
+        return ("chat", "assistant", "chat", "upload")[index % 4]
+    return scenario
+
+
+def _run_session_sync(kind: str, index: int, args: argparse.Namespace, inflight: InFlight, workdir: str) -> List[TurnResult]:
+    request = SimpleNamespace(session_hash=f"load-{uuid.uuid4().hex[:12]}")
+    results: List[TurnResult] = []
+    history: List[dict] = []
+    with inflight:
+        for turn in range(args.turns):
+            if kind == "upload":
+                results.append(_upload_turn(request, workdir, args.upload_files, args.upload_kb))
+                continue
+            result, history = _chat_turn_sync(kind, request, history, f"Session {index} question {turn}: search the news", args.task)
+            results.append(result)
+    return results
+
+
+async def _run_session_async(kind: str, index: int, args: argparse.Namespace, inflight: InFlight, workdir: str) -> List[TurnResult]:
+    request = SimpleNamespace(session_hash=f"load-{uuid.uuid4().hex[:12]}")
+    results: List[TurnResult] = []
+    history: List[dict] = []
+    with inflight:
+        for turn in range(args.turns):
+            if kind == "upload":
+                results.append(await asyncio.to_thread(_upload_turn, request, workdir, args.upload_files, args.upload_kb))
+                continue
+            result, history = await _chat_turn_async(kind, request, history, f"Session {index} question {turn}: search the news", args.task)
+            results.append(result)
+    return results
+
+
+def run_level(n_sessions: int, args: argparse.Namespace, workdir: str) -> Dict[str, Any]:
+    inflight = InFlight()
+    start = time.perf_counter()
+    if args.mode == "async":
+
+        async def main() -> List[List[TurnResult]]:
+            return await asyncio.gather(
+                *[
+                    _run_session_async(_session_kinds(args.scenario, i), i, args, inflight, workdir)
+                    for i in range(n_sessions)
+                ]
+            )
+
+        per_session = asyncio.run(main())
+    else:
+        with ThreadPoolExecutor(max_workers=n_sessions) as pool:
+            futures = [
+                pool.submit(_run_session_sync, _session_kinds(args.scenario, i), i, args, inflight, workdir)
+                for i in range(n_sessions)
+            ]
+            per_session = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+
+    results = [r for session in per_session for r in session]
+    chats = [r for r in results if r.kind != "upload"]
+    uploads = [r for r in results if r.kind == "upload"]
+    ttfts = [r.ttft * 1000 for r in chats if r.ttft is not None and r.error is None]
+    tokens = sum(r.tokens for r in chats)
+    stream_rates = [r.tokens / (r.duration - r.ttft) for r in chats if r.ttft is not None and r.duration > r.ttft and r.tokens]
+    errors = [r.error for r in results if r.error]
+    return {
+        "sessions": n_sessions,
+        "turns": len(results),
+        "peak_inflight": inflight.peak,
+        "p50": percentile(ttfts, 50),
+        "p95": percentile(ttfts, 95),
+        "p99": percentile(ttfts, 99),
+        "tokens_per_sec": tokens / wall if wall else 0.0,
+        "stream_tokens_per_sec": percentile(stream_rates, 50),
+        "upload_p95": percentile([r.duration * 1000 for r in uploads], 95),
+        "error_rate": len(errors) / len(results) if results else 0.0,
+        "first_error": errors[0] if errors else None,
+        "wall": wall,
+    }
+
+
+# --- Mock server process ---
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_mock(args: argparse.Namespace) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "loadtest.mock_server", "--port", str(port)]
+    for name in ("ttft_ms", "ttft_sigma", "tokens_per_sec", "reply_tokens", "tool_call_rate", "index_ms", "tavily_ms", "api_ms", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            cmd += [f"--{name.replace('_', '-')}", str(value)]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/mock/stats", timeout=1).read()
+            return proc, url
+        except Exception:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("mock server did not start")
+
+
+def _configure_env(url: str, args: argparse.Namespace, workdir: str) -> None:
+    """Point the app at the mock; must run before config.settings is imported."""
+    os.environ["OPENAI_API_KEY"] = "sk-mock"
+    os.environ["OPENAI_BASE_URL"] = f"{url}/v1"
+    os.environ["TAVILY_API_KEY"] = "tvly-mock"
+    os.environ["TAVILY_API_URL"] = f"{url}/tavily/search"
+    os.environ["TAVILY_CACHE_TTL_SECONDS"] = "0"  # every search goes to the mock
+    os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+    os.environ["UPLOAD_MANIFEST_PATH"] = os.path.join(workdir, "manifest.json")
+    os.environ.pop("ASSISTANT_POOL_PATH", None)
+    if args.rate_limit:
+        os.environ["RATE_LIMIT_ENABLED"] = "1"
+
+
+def _print_report(rows: List[Dict[str, Any]], slo_ms: float, max_error_rate: float) -> None:
+    header = f"{'sessions':>8} {'turns':>6} {'peak':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'tok/s':>9} {'stream tok/s':>12} {'upload p95':>10} {'errors':>7}"
+    print(header)
+    for r in rows:
+        print(
+            f"{r['sessions']:>8} {r['turns']:>6} {r['peak_inflight']:>5} {r['p50']:>8.0f} {r['p95']:>8.0f} {r['p99']:>8.0f}"
+            f" {r['tokens_per_sec']:>9.0f} {r['stream_tokens_per_sec']:>12.1f} {r['upload_p95']:>10.0f} {r['error_rate']:>6.1%}"
+        )
+    ok = [r for r in rows if r["p95"] <= slo_ms and r["error_rate"] <= max_error_rate]
+    best = max((r["sessions"] for r in ok), default=0)
+    print(f"\nMax concurrent sessions per process within p95 TTFT <= {slo_ms:.0f} ms and errors <= {max_error_rate:.0%}: {best}")
+    for r in rows:
+        if r["first_error"]:
+            print(f"First error at {r['sessions']} sessions: {r['first_error'][:300]}")
+            break
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline load test of the chat pipeline against the mock server.")
+    parser.add_argument("--scenario", choices=("chat", "assistant", "upload", "mix"), default="mix")
+    parser.add_argument("--sessions", default="4,16,64", help="Comma-separated concurrency levels to ramp through")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--mode", choices=("async", "sync"), default="async", help="chat_entry_async on one loop, or chat_entry on threads")
+    parser.add_argument("--task", default="Generic Assistant")
+    parser.add_argument("--upload-files", type=int, default=2, help="Files per upload turn")
+    parser.add_argument("--upload-kb", type=int, default=64, help="Size of each uploaded file")
+    parser.add_argument("--slo-ttft-ms", type=float, default=2000.0)
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--mock-url", default=None, help="Use an already running mock server instead of starting one")
+    parser.add_argument("--rate-limit", action="store_true", help="Enable the app's rate limiter (off measures raw capacity)")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    proc = None
+    url = args.mock_url
+    if url is None:
+        proc, url = _start_mock(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="loadtest_") as workdir:
+            _configure_env(url.rstrip("/"), args, workdir)
+            rows = []
+            for level in [int(x) for x in args.sessions.split(",") if x.strip()]:
+                print(f"Running {level} concurrent sessions x {args.turns} turns ({args.scenario}, {args.mode})...", flush=True)
+                rows.append(run_level(level, args, workdir))
+            print()
+            _print_report(rows, args.slo_ttft_ms, args.max_error_rate)
+            try:
+                print("\nMock server:", urllib.request.urlopen(f"{url}/mock/stats", timeout=2).read().decode())
+            except Exception:
+                pass
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,647 @@
+"""Local stand-in for the OpenAI and Tavily HTTP APIs used by the app.
+
+Emulates streamed Chat Completions, Assistants (assistants, threads,
+messages, runs with streaming and `web_search` tool calls), file uploads
+into vector stores, embeddings and Tavily search, with configurable
+latency distributions. Point the app at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+    TAVILY_API_URL=http://127.0.0.1:8001/tavily/search
+
+Run from the repository root:
+
+    python -m loadtest.mock_server --port 8001 --ttft-ms 400 --tokens-per-sec 60
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_WORDS = (
+    "the quick brown fox jumps over a lazy dog while measured latency stays within budget and "
+    "every token arrives on time across sessions threads runs and vector stores"
+).split()
+_EMBEDDING_DIM = 256
+
+
+class MockConfig:
+    """Latency model. Durations are log-normal around their median (sigma 0 = fixed)."""
+
+    def __init__(
+        self,
+        ttft_ms: float = 300.0,
+        ttft_sigma: float = 0.4,
+        tokens_per_sec: float = 80.0,
+        reply_tokens: int = 120,
+        reply_sigma: float = 0.3,
+        tool_call_rate: float = 0.5,
+        index_ms: float = 800.0,
+        tavily_ms: float = 300.0,
+        api_ms: float = 15.0,
+        seed: int | None = None,
+    ) -> None:
+        self.ttft_ms = ttft_ms
+        self.ttft_sigma = ttft_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+        self.reply_sigma = reply_sigma
+        self.tool_call_rate = tool_call_rate
+        self.index_ms = index_ms
+        self.tavily_ms = tavily_ms
+        self.api_ms = api_ms
+        self.rng = random.Random(seed)
+
+    def _lognormal(self, median: float, sigma: float) -> float:
+        return median * (self.rng.lognormvariate(0.0, sigma) if sigma > 0 else 1.0)
+
+    def ttft(self) -> float:
+        return self._lognormal(self.ttft_ms, self.ttft_sigma) / 1000.0
+
+    def token_gap(self) -> float:
+        return 1.0 / self.tokens_per_sec if self.tokens_per_sec > 0 else 0.0
+
+    def reply(self) -> List[str]:
+        n = max(1, int(self._lognormal(self.reply_tokens, self.reply_sigma)))
+        return [(" " if i else "") + self.rng.choice(_WORDS) for i in range(n)]
+
+    def api_delay(self) -> float:
+        return self._lognormal(self.api_ms, 0.3) / 1000.0
+
+    def index_delay(self) -> float:
+        return self._lognormal(self.index_ms, 0.4) / 1000.0
+
+    def tavily_delay(self) -> float:
+        return self._lognormal(self.tavily_ms, 0.4) / 1000.0
+
+
+_ids = itertools.count(1)
+
+
+def _id(prefix: str) -> str:
+    return f"{prefix}_mock{next(_ids):08d}"
+
+
+def _now() -> int:
+    return int(time.time())
+
+
+def _sse(data: Any, event: str | None = None) -> str:
+    payload = data if isinstance(data, str) else json.dumps(data)
+    return (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+
+
+def _text_content(text: str) -> List[Dict[str, Any]]:
+    return [{"type": "text", "text": {"value": text, "annotations": []}}]
+
+
+def _usage(prompt_tokens: int, completion_tokens: int) -> Dict[str, int]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+def _embedding(text: str) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(_EMBEDDING_DIM).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class MockState:
+    def __init__(self) -> None:
+        self.assistants: Dict[str, Dict[str, Any]] = {}
+        self.threads: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.vector_stores: Dict[str, Dict[str, Any]] = {}
+        self.vs_files: Dict[tuple[str, str], Dict[str, Any]] = {}
+        self.requests: Counter[str] = Counter()
+        self.open_streams = 0
+        self.peak_streams = 0
+
+
+def _tool_arguments(fn: Dict[str, Any]) -> Dict[str, Any]:
+    """Arguments for a mock function call: the first enum value (or a word) for each required string."""
+    props = fn.get("parameters", {}).get("properties", {})
+    args: Dict[str, Any] = {}
+    for name in fn.get("parameters", {}).get("required", []):
+        spec = props.get(name, {})
+        args[name] = (spec.get("enum") or ["mock"])[0]
+    return args
+
+
+def create_app(config: MockConfig | None = None) -> FastAPI:
+    cfg = config or MockConfig()
+    st = MockState()
+    app = FastAPI(title="Mock OpenAI/Tavily")
+
+    @app.middleware("http")
+    async def count_requests(request: Request, call_next):
+        response = await call_next(request)
+        route = getattr(request.scope.get("route"), "path", request.url.path)
+        st.requests[f"{request.method} {route}"] += 1
+        return response
+
+    async def streamed(events: AsyncIterator[str]) -> AsyncIterator[str]:
+        st.open_streams += 1
+        st.peak_streams = max(st.peak_streams, st.open_streams)
+        try:
+            async for chunk in events:
+                yield chunk
+        finally:
+            st.open_streams -= 1
+
+    def sse_response(events: AsyncIterator[str]) -> StreamingResponse:
+        return StreamingResponse(streamed(events), media_type="text/event-stream")
+
+    # --- Chat Completions ---
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-mock")
+        prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+        tokens = cfg.reply()
+        cid = _id("chatcmpl")
+
+        def chunk(delta: Dict[str, Any], finish: str | None = None) -> Dict[str, Any]:
+            return {
+                "id": cid,
+                "object": "chat.completion.chunk",
+                "created": _now(),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+
+        messages = body.get("messages", [])
+        tools = body.get("tools") or []
+        if (
+            tools
+            and body.get("tool_choice") != "none"
+            and not any(m.get("role") == "tool" for m in messages)
+            and cfg.rng.random() < cfg.tool_call_rate
+        ):
+            # One function call per request, answered on the next round
+            fn = tools[0]["function"]
+            call = {"index": 0, "id": _id("call"), "type": "function", "function": {"name": fn["name"], "arguments": json.dumps(_tool_arguments(fn))}}
+            if body.get("stream"):
+                async def call_events() -> AsyncIterator[str]:
+                    await asyncio.sleep(cfg.ttft())
+                    yield _sse(chunk({"role": "assistant", "content": None, "tool_calls": [call]}))
+                    yield _sse(chunk({}, "tool_calls"))
+                    yield _sse("[DONE]")
+
+                return sse_response(call_events())
+            await asyncio.sleep(cfg.ttft())
+            message = {"role": "assistant", "content": None, "tool_calls": [{k: v for k, v in call.items() if k != "index"}]}
+            return {
+                "id": cid,
+                "object": "chat.completion",
+                "created": _now(),
+                "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls"}],
+                "usage": _usage(prompt_tokens, 16),
+            }
+
+        if not body.get("stream"):
+            await asyncio.sleep(cfg.ttft() + cfg.token_gap() * len(tokens))
+            return {
+                "id": cid,
+                "object": "chat.completion",
+                "created": _now(),
+                "model": model,
+                "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}
+                ],
+                "usage": _usage(prompt_tokens, len(tokens)),
+            }
+
+        async def events() -> AsyncIterator[str]:
+            await asyncio.sleep(cfg.ttft())
+            yield _sse(chunk({"role": "assistant", "content": ""}))
+            for tok in tokens:
+                yield _sse(chunk({"content": tok}))
+                await asyncio.sleep(cfg.token_gap())
+            yield _sse(chunk({}, "stop"))
+            yield _sse("[DONE]")
+
+        return sse_response(events())
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        await asyncio.sleep(cfg.api_delay())
+        data = []
+        for i, text in enumerate(inputs):
+            vec = _embedding(str(text))
+            value: Any = (
+                base64.b64encode(vec.tobytes()).decode("ascii")
+                if body.get("encoding_format") == "base64"
+                else vec.tolist()
+            )
+            data.append({"object": "embedding", "index": i, "embedding": value})
+        n_tokens = sum(len(str(t).split()) for t in inputs)
+        return {"object": "list", "data": data, "model": body.get("model"), "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens}}
+
+    # --- Assistants ---
+    @app.post("/v1/assistants")
+    async def create_assistant(request: Request):
+        body = await request.json()
+        await asyncio.sleep(cfg.api_delay())
+        assistant = {
+            "id": _id("asst"),
+            "object": "assistant",
+            "created_at": _now(),
+            "name": body.get("name"),
+            "description": None,
+            "model": body.get("model"),
+            "instructions": body.get("instructions"),
+            "tools": body.get("tools") or [],
+            "tool_resources": body.get("tool_resources") or {},
+            "metadata": {},
+            "temperature": 1.0,
+            "top_p": 1.0,
+            "response_format": "auto",
+        }
+        st.assistants[assistant["id"]] = assistant
+        return assistant
+
+    @app.delete("/v1/assistants/{assistant_id}")
+    async def delete_assistant(assistant_id: str):
+        if st.assistants.pop(assistant_id, None) is None:
+            raise HTTPException(404, detail="No assistant found")
+        return {"id": assistant_id, "object": "assistant.deleted", "deleted": True}
+
+    @app.post("/v1/threads")
+    async def create_thread():
+        await asyncio.sleep(cfg.api_delay())
+        thread_id = _id("thread")
+        st.threads[thread_id] = []
+        return {"id": thread_id, "object": "thread", "created_at": _now(), "metadata": {}, "tool_resources": {}}
+
+    def thread_messages(thread_id: str) -> List[Dict[str, Any]]:
+        if thread_id not in st.threads:
+            raise HTTPException(404, detail="No thread found")
+        return st.threads[thread_id]
+
+    def new_message(thread_id: str, role: str, text: str, run: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        return {
+            "id": _id("msg"),
+            "object": "thread.message",
+            "created_at": _now(),
+            "thread_id": thread_id,
+            "role": role,
+            "content": _text_content(text) if text else [],
+            "assistant_id": run["assistant_id"] if run else None,
+            "run_id": run["id"] if run else None,
+            "attachments": [],
+            "metadata": {},
+            "status": "completed" if role == "user" else "in_progress",
+            "completed_at": None,
+            "incomplete_at": None,
+            "incomplete_details": None,
+        }
+
+    @app.post("/v1/threads/{thread_id}/messages")
+    async def create_message(thread_id: str, request: Request):
+        body = await request.json()
+        messages = thread_messages(thread_id)
+        await asyncio.sleep(cfg.api_delay())
+        content = body.get("content")
+        text = content if isinstance(content, str) else json.dumps(content)
+        message = new_message(thread_id, body.get("role", "user"), text)
+        messages.append(message)
+        return message
+
+    @app.get("/v1/threads/{thread_id}/messages")
+    async def list_messages(thread_id: str, limit: int = 20, order: str = "desc"):
+        messages = thread_messages(thread_id)
+        await asyncio.sleep(cfg.api_delay())
+        ordered = list(reversed(messages)) if order == "desc" else list(messages)
+        page = ordered[: max(1, min(limit, 100))]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(ordered) > len(page),
+        }
+
+    def new_run(thread_id: str, assistant_id: str) -> Dict[str, Any]:
+        assistant = st.assistants.get(assistant_id)
+        if assistant is None:
+            raise HTTPException(404, detail="No assistant found")
+        thread_messages(thread_id)
+        run = {
+            "id": _id("run"),
+            "object": "thread.run",
+            "created_at": _now(),
+            "assistant_id": assistant_id,
+            "thread_id": thread_id,
+            "status": "queued",
+            "started_at": None,
+            "expires_at": _now() + 600,
+            "cancelled_at": None,
+            "failed_at": None,
+            "completed_at": None,
+            "required_action": None,
+            "last_error": None,
+            "model": assistant["model"],
+            "instructions": assistant["instructions"] or "",
+            "tools": assistant["tools"],
+            "metadata": {},
+            "usage": None,
+            "incomplete_details": None,
+            "temperature": 1.0,
+            "top_p": 1.0,
+            "max_prompt_tokens": None,
+            "max_completion_tokens": None,
+            "truncation_strategy": {"type": "auto", "last_messages": None},
+            "response_format": "auto",
+            "tool_choice": "auto",
+            "parallel_tool_calls": True,
+            # Private scheduling fields, stripped from responses
+            "_tools_done": False,
+        }
+        st.runs[run["id"]] = run
+        return run
+
+    def public(run: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in run.items() if not k.startswith("_")}
+
+    def wants_tool_call(run: Dict[str, Any]) -> bool:
+        has_search = any(
+            t.get("type") == "function" and t.get("function", {}).get("name") == "web_search" for t in run["tools"]
+        )
+        return has_search and not run["_tools_done"] and cfg.rng.random() < cfg.tool_call_rate
+
+    def require_action(run: Dict[str, Any]) -> None:
+        last_user = next((m for m in reversed(st.threads[run["thread_id"]]) if m["role"] == "user"), None)
+        query = last_user["content"][0]["text"]["value"] if last_user and last_user["content"] else "news"
+        run["status"] = "requires_action"
+        run["required_action"] = {
+            "type": "submit_tool_outputs",
+            "submit_tool_outputs": {
+                "tool_calls": [
+                    {
+                        "id": _id("call"),
+                        "type": "function",
+                        "function": {"name": "web_search", "arguments": json.dumps({"query": query[:200]})},
+                    }
+                ]
+            },
+        }
+
+    def finish_run(run: Dict[str, Any], message: Dict[str, Any], n_tokens: int) -> None:
+        message["status"] = "completed"
+        message["completed_at"] = _now()
+        run["status"] = "completed"
+        run["completed_at"] = _now()
+        run["required_action"] = None
+        run["usage"] = _usage(sum(len(m["content"][0]["text"]["value"].split()) for m in st.threads[run["thread_id"]] if m["content"]), n_tokens)
+
+    async def run_events(run: Dict[str, Any], created: bool) -> AsyncIterator[str]:
+        """Assistants stream: run.created, message.created, message.delta..., message.completed, run.completed, done."""
+        if created:
+            yield _sse(public(run), "thread.run.created")
+        run["status"] = "in_progress"
+        run["started_at"] = run["started_at"] or _now()
+        yield _sse(public(run), "thread.run.in_progress")
+        await asyncio.sleep(cfg.ttft())
+        if run["status"] == "cancelling":
+            run["status"] = "cancelled"
+            yield _sse(public(run), "thread.run.cancelled")
+            yield _sse("[DONE]", "done")
+            return
+        if wants_tool_call(run):
+            require_action(run)
+            yield _sse(public(run), "thread.run.requires_action")
+            yield _sse("[DONE]", "done")
+            return
+
+        message = new_message(run["thread_id"], "assistant", "", run)
+        st.threads[run["thread_id"]].append(message)
+        yield _sse(message, "thread.message.created")
+        tokens = cfg.reply()
+        for i, tok in enumerate(tokens):
+            delta = {
+                "id": message["id"],
+                "object": "thread.message.delta",
+                "delta": {"content": [{"index": 0, "type": "text", "text": {"value": tok, "annotations": []}}]},
+            }
+            yield _sse(delta, "thread.message.delta")
+            await asyncio.sleep(cfg.token_gap())
+        message["content"] = _text_content("".join(tokens))
+        finish_run(run, message, len(tokens))
+        yield _sse(message, "thread.message.completed")
+        yield _sse(public(run), "thread.run.completed")
+        yield _sse("[DONE]", "done")
+
+    async def complete_in_background(run: Dict[str, Any]) -> None:
+        """Non-streaming runs advance on their own; clients observe them via retrieve."""
+        async for _ in run_events(run, created=False):
+            pass
+
+    @app.post("/v1/threads/{thread_id}/runs")
+    async def create_run(thread_id: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(cfg.api_delay())
+        run = new_run(thread_id, body.get("assistant_id", ""))
+        if body.get("stream"):
+            return sse_response(run_events(run, created=True))
+        asyncio.get_running_loop().create_task(complete_in_background(run))
+        return public(run)
+
+    def get_run(thread_id: str, run_id: str) -> Dict[str, Any]:
+        run = st.runs.get(run_id)
+        if run is None or run["thread_id"] != thread_id:
+            raise HTTPException(404, detail="No run found")
+        return run
+
+    @app.get("/v1/threads/{thread_id}/runs/{run_id}")
+    async def retrieve_run(thread_id: str, run_id: str):
+        await asyncio.sleep(cfg.api_delay())
+        return public(get_run(thread_id, run_id))
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/submit_tool_outputs")
+    async def submit_tool_outputs(thread_id: str, run_id: str, request: Request):
+        body = await request.json()
+        run = get_run(thread_id, run_id)
+        if run["status"] != "requires_action":
+            raise HTTPException(400, detail=f"Run is not awaiting tool outputs (status {run['status']})")
+        run["_tools_done"] = True
+        run["required_action"] = None
+        run["status"] = "queued"
+        if body.get("stream"):
+            return sse_response(run_events(run, created=False))
+        asyncio.get_running_loop().create_task(complete_in_background(run))
+        return public(run)
+
+    @app.post("/v1/threads/{thread_id}/runs/{run_id}/cancel")
+    async def cancel_run(thread_id: str, run_id: str):
+        run = get_run(thread_id, run_id)
+        if run["status"] in ("queued", "in_progress", "requires_action"):
+            run["status"] = "cancelling" if run["status"] == "in_progress" else "cancelled"
+        return public(run)
+
+    # --- Files and vector stores ---
+    @app.post("/v1/files")
+    async def upload_file(request: Request):
+        form = await request.form()
+        upload = form.get("file")
+        data = await upload.read() if upload is not None else b""
+        # Upload time grows with size: ~100 MB/s on top of the API latency
+        await asyncio.sleep(cfg.api_delay() + len(data) / 100e6)
+        file = {
+            "id": _id("file"),
+            "object": "file",
+            "bytes": len(data),
+            "created_at": _now(),
+            "filename": getattr(upload, "filename", "upload"),
+            "purpose": form.get("purpose", "assistants"),
+            "status": "processed",
+        }
+        st.files[file["id"]] = file
+        return file
+
+    @app.post("/v1/vector_stores")
+    async def create_vector_store(request: Request):
+        body = await request.json()
+        await asyncio.sleep(cfg.api_delay())
+        store = {
+            "id": _id("vs"),
+            "object": "vector_store",
+            "created_at": _now(),
+            "name": body.get("name"),
+            "usage_bytes": 0,
+            "file_counts": {"in_progress": 0, "completed": 0, "failed": 0, "cancelled": 0, "total": 0},
+            "status": "completed",
+            "last_active_at": _now(),
+            "metadata": {},
+        }
+        st.vector_stores[store["id"]] = store
+        return store
+
+    def vs_file_view(entry: Dict[str, Any]) -> Dict[str, Any]:
+        if entry["status"] == "in_progress" and time.monotonic() >= entry["_ready_at"]:
+            entry["status"] = "completed"
+        return public(entry)
+
+    @app.post("/v1/vector_stores/{vs_id}/files")
+    async def attach_file(vs_id: str, request: Request):
+        body = await request.json()
+        if vs_id not in st.vector_stores:
+            raise HTTPException(404, detail="No vector store found")
+        file_id = body.get("file_id", "")
+        if file_id not in st.files:
+            raise HTTPException(404, detail="No file found")
+        await asyncio.sleep(cfg.api_delay())
+        entry = {
+            "id": file_id,
+            "object": "vector_store.file",
+            "created_at": _now(),
+            "vector_store_id": vs_id,
+            "status": "in_progress",
+            "usage_bytes": st.files[file_id]["bytes"],
+            "last_error": None,
+            "_ready_at": time.monotonic() + cfg.index_delay(),
+        }
+        st.vs_files[(vs_id, file_id)] = entry
+        return vs_file_view(entry)
+
+    @app.get("/v1/vector_stores/{vs_id}/files/{file_id}")
+    async def get_vs_file(vs_id: str, file_id: str):
+        entry = st.vs_files.get((vs_id, file_id))
+        if entry is None:
+            raise HTTPException(404, detail="No vector store file found")
+        await asyncio.sleep(cfg.api_delay())
+        return JSONResponse(vs_file_view(entry), headers={"openai-poll-after-ms": "100"})
+
+    # --- Tavily ---
+    @app.post("/tavily/search")
+    async def tavily_search(request: Request):
+        body = await request.json()
+        await asyncio.sleep(cfg.tavily_delay())
+        query = body.get("query", "")
+        n = max(1, min(int(body.get("max_results") or 5), 10))
+        return {
+            "query": query,
+            "answer": f"Mock answer for: {query}",
+            "results": [
+                {
+                    "title": f"Result {i + 1} for {query[:40]}",
+                    "url": f"https://example.com/{hashlib.sha1(f'{query}{i}'.encode()).hexdigest()[:10]}",
+                    "content": " ".join(cfg.rng.choice(_WORDS) for _ in range(30)),
+                    "score": round(1.0 - i * 0.05, 2),
+                }
+                for i in range(n)
+            ],
+        }
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {
+            "requests": dict(st.requests),
+            "open_streams": st.open_streams,
+            "peak_streams": st.peak_streams,
+            "assistants": len(st.assistants),
+            "threads": len(st.threads),
+            "runs": len(st.runs),
+            "files": len(st.files),
+        }
+
+    return app
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Median time to first token (ms)")
+    parser.add_argument("--ttft-sigma", type=float, default=0.4, help="Log-normal spread of TTFT (0 = fixed)")
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0, help="Streaming rate per reply")
+    parser.add_argument("--reply-tokens", type=int, default=120, help="Median reply length in tokens")
+    parser.add_argument("--tool-call-rate", type=float, default=0.5, help="Share of web-search-enabled runs that call the tool")
+    parser.add_argument("--index-ms", type=float, default=800.0, help="Median vector store indexing time per file (ms)")
+    parser.add_argument("--tavily-ms", type=float, default=300.0, help="Median Tavily search latency (ms)")
+    parser.add_argument("--api-ms", type=float, default=15.0, help="Median latency of plain API calls (ms)")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(
+        ttft_ms=args.ttft_ms,
+        ttft_sigma=args.ttft_sigma,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        tool_call_rate=args.tool_call_rate,
+        index_ms=args.index_ms,
+        tavily_ms=args.tavily_ms,
+        api_ms=args.api_ms,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Tavily server for offline load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmarks for the chat history helpers in utils/chat_format.py.
+
+Run from the repository root:
+
+    python scripts/bench_chat_format.py
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from utils.chat_format import (  # noqa: E402
+    MessageNormalizer,
+    StreamingMessageBuffer,
+    append_to_last_assistant,
+    ensure_last_assistant_message,
+    messages_append_user,
+    messages_to_openai,
+    sanitize_messages,
+)
+
+
+def _history(n: int) -> list[dict]:
+    roles = ("user", "assistant")
+    return [{"role": roles[i % 2], "content": f"message {i} " * 20} for i in range(n)]
+
+
+def _legacy_stream(history: list[dict], tokens: int) -> None:
+    # Pre-buffer streaming loop: copy on every delta and every yield
+    work = messages_append_user(list(history), "question")
+    work = ensure_last_assistant_message(work)
+    for _ in range(tokens):
+        work = append_to_last_assistant(work, "tok ")
+        _ = list(work)
+
+
+def _buffer_stream(history: list[dict], tokens: int) -> None:
+    buf = StreamingMessageBuffer(history, "question")
+    for _ in range(tokens):
+        buf.append("tok ")
+        _ = buf.snapshot()
+
+
+def bench_streaming(sizes: tuple[int, ...] = (10, 100, 1000, 5000), tokens: int = 500) -> None:
+    print(f"Streaming {tokens} deltas; per-delta cost in microseconds")
+    print(f"{'history':>8} {'legacy':>10} {'buffer':>10}")
+    for n in sizes:
+        history = _history(n)
+        row = []
+        for fn in (_legacy_stream, _buffer_stream):
+            start = time.perf_counter()
+            fn(history, tokens)
+            row.append((time.perf_counter() - start) / tokens * 1e6)
+        print(f"{n:>8} {row[0]:>10.2f} {row[1]:>10.2f}")
+
+
+def _gradio_history(n: int) -> list[dict]:
+    # Gradio re-parses the history on every submit: fresh dicts, some list contents
+    out = []
+    for i, m in enumerate(_history(n)):
+        content = [{"type": "text", "text": m["content"]}] if i % 10 == 0 else m["content"]
+        out.append({"role": m["role"], "content": content, "metadata": None, "options": None})
+    return out
+
+
+def bench_sanitize(n: int = 10_000, turns: int = 20) -> None:
+    """Per-submit cost of sanitize_messages + messages_to_openai as a conversation grows."""
+    print(f"Sanitize + messages_to_openai over {n}-message histories, {turns} submits; ms per submit")
+    full_total = inc_total = 0.0
+    normalizer = MessageNormalizer()
+    for t in range(turns):
+        history = _gradio_history(n + t * 2)
+
+        start = time.perf_counter()
+        messages_to_openai(sanitize_messages(history), system_instruction="sys")
+        full_total += time.perf_counter() - start
+
+        start = time.perf_counter()
+        messages_to_openai(normalizer.sanitize(history), system_instruction="sys")
+        inc_total += time.perf_counter() - start
+    print(f"{'full':>12} {full_total / turns * 1e3:>8.2f}")
+    print(f"{'incremental':>12} {inc_total / turns * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    bench_streaming()
+    print()
+    bench_sanitize()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 
+import config.settings as settings
 from ui.components import build_app
 
 
@@ -21,10 +22,39 @@ def main() -> None:
     share = str_to_bool(os.getenv("GRADIO_SHARE"), default=False)
     debug = str_to_bool(os.getenv("DEBUG"), default=False)
 
+    if settings.METRICS_ENABLED and share:
+        # uvicorn serves the app directly; Gradio's share tunnel only exists under demo.launch
+        raise SystemExit("GRADIO_SHARE is not supported with METRICS_ENABLED=1; unset one of them.")
+
     demo = build_app()
+    if settings.METRICS_ENABLED:
+        _serve_with_metrics(demo, server_name, port, debug)
+        return
     demo.launch(server_name=server_name, server_port=port, share=share, debug=debug)
 
 
+def _serve_with_metrics(demo, server_name: str, port: int, debug: bool = False) -> None:
+    """Serve the Gradio app under FastAPI with a Prometheus `/metrics` route next to it.
+
+    DEBUG maps to uvicorn's debug log level (the app's own DEBUG logging is unaffected).
+    """
+    import gradio as gr
+    import uvicorn
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+
+    from core import metrics
+
+    app = FastAPI()
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def prometheus_metrics() -> PlainTextResponse:
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    app = gr.mount_gradio_app(app, demo, path="/")
+    uvicorn.run(app, host=server_name, port=port, log_level="debug" if debug else "info")
+
+
 if __name__ == "__main__":
     main()
 
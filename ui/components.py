@@ -5,9 +5,9 @@ import gradio as gr
 
 from config.settings import TASK_CONFIG, set_openai_api_key
 import config.settings as settings
-from core.assistant import chat_entry
-from core.file_handler import upload_files
-from core.state import reset_session
+from core.assistant import chat_entry, chat_entry_async
+from core.file_handler import ingestion_status, upload_files
+from core.state import close_session, reset_session
 
 
 def build_app() -> gr.Blocks:
@@ -54,6 +54,7 @@ def build_app() -> gr.Blocks:
                         label="OpenAI API Key",
                         placeholder="sk-...",
                         type="password",
+                        info="Applies to every session served by this process.",
                     )
                     set_key_btn = gr.Button("Set API Key")
                     api_key_status = gr.Textbox(
@@ -78,16 +79,18 @@ def build_app() -> gr.Blocks:
                     value=[],
                 )
 
-                gr.Markdown("### 3. Upload Files (for File Search)")
+                gr.Markdown("### 3. Upload Files (File Search, or CSV/XLSX tables)")
                 with gr.Column():
                     file_upload = gr.File(
-                        label="Upload documents",
+                        label="Upload documents or tables",
                         file_count="multiple",
                         type="filepath",
                         height=150,
                     )
                     upload_btn = gr.Button("Upload to Vector Store")
                     upload_status = gr.Textbox(label="Upload Status", interactive=False)
+                    # Polls background ingestion progress; active only while a job runs
+                    upload_timer = gr.Timer(1.0, active=False)
 
                 gr.Markdown("### 4. Session Control")
                 reset_btn = gr.Button("Reset Session")
@@ -97,20 +100,20 @@ def build_app() -> gr.Blocks:
                 stream_default = gr.State(True)
 
         # --- Event Listeners ---
-        def apply_api_key(key: str):
+        def apply_api_key(key: str, request: gr.Request):
             msg = set_openai_api_key(key)
-            reset_msg = reset_session()
+            reset_msg = reset_session(request)
             return msg, reset_msg
 
-        def on_tools_change(selected_tools: list[str] | None):
+        def on_tools_change(selected_tools: list[str] | None, request: gr.Request):
             try:
                 settings.dprint(f"Tools toggled: {selected_tools}")
             except Exception:
                 pass
-            return reset_session()
+            return reset_session(request)
 
         user_input.submit(
-            fn=chat_entry,
+            fn=chat_entry_async if settings.ASYNC_CHAT else chat_entry,
             inputs=[user_input, chatbot, task_select, tool_select, stream_default],
             outputs=[user_input, chatbot],
         )
@@ -119,9 +122,11 @@ def build_app() -> gr.Blocks:
         upload_btn.click(
             fn=upload_files,
             inputs=[file_upload],
-            outputs=[upload_status, tool_select, task_select],
+            outputs=[upload_status, tool_select, task_select, upload_timer],
         )
 
+        upload_timer.tick(fn=ingestion_status, inputs=None, outputs=[upload_status, upload_timer])
+
         task_select.change(fn=reset_session, inputs=None, outputs=[reset_status])
         tool_select.change(
             fn=on_tools_change, inputs=[tool_select], outputs=[reset_status]
@@ -134,6 +139,9 @@ def build_app() -> gr.Blocks:
             outputs=[api_key_status, reset_status],
         )
 
+        # Free the session's state when its browser tab closes
+        demo.unload(close_session)
+
     # Enable queuing so generator outputs stream incrementally in the UI
     demo.queue()
     return demo
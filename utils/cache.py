@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+
+class SQLiteCache:
+    """Small key/value store with expiry, shareable between worker processes.
+
+    Values must be JSON-serializable. WAL mode lets several processes read
+    while one writes.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int = 100_000) -> None:
+        self.path = path
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = int(max_entries)
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires < time.time():
+            self.delete(key)
+            return None
+        try:
+            return json.loads(value)
+        except Exception:
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        self.set_many({key: value})
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        """Write several entries in one transaction."""
+        expires = time.time() + self.ttl_seconds
+        rows = [(key, json.dumps(value), expires) for key, value in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", rows)
+            # Bound the table: drop expired rows, then the soonest-to-expire overflow
+            self._conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+
+class TTLCache:
+    """Thread-safe in-memory LRU cache with per-entry TTL and hit/miss counters.
+
+    An optional `backend` (e.g. `SQLiteCache`) is consulted on memory misses
+    and written through on `set`, so several workers can share results.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, backend: SQLiteCache | None = None) -> None:
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self.backend = backend
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.backend_hits = 0
+
+    def get(self, key: str) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires >= now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._data.pop(key, None)
+        if self.backend is not None:
+            try:
+                value = self.backend.get(key)
+            except Exception:
+                value = None
+            if value is not None:
+                self._put(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.backend_hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self._put(key, value)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, value)
+            except Exception:
+                pass
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        for key, value in items.items():
+            self._put(key, value)
+        if self.backend is not None and items:
+            try:
+                self.backend.set_many(items)
+            except Exception:
+                pass
+
+    def _put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "backend_hits": self.backend_hits,
+                "entries": len(self._data),
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import threading
 from typing import List, Dict, Any
 
 ChatMessage = Dict[str, Any]
@@ -24,6 +25,11 @@ def messages_to_openai(messages: List[ChatMessage], system_instruction: str | No
     for m in messages or []:
         role = m.get("role")
         content = m.get("content")
+        # Already-normalized messages (e.g. from MessageNormalizer) skip flattening; they are
+        # copied so callers that edit the request never touch the cached history
+        if type(content) is str and m.keys() == {"role", "content"}:
+            out.append({"role": role, "content": content})
+            continue
         # Flatten content to string
         if isinstance(content, list):
             parts: List[str] = []
@@ -133,3 +139,96 @@ def sanitize_messages(messages: Any) -> List[ChatMessage]:
             content = str(content) if content is not None else ""
         out.append({"role": role, "content": content})
     return out
+
+
+class StreamingMessageBuffer:
+    """Mutable history for a streamed reply with O(1) delta appends.
+
+    The history is copied once when the buffer is created; deltas are kept as
+    a list of chunks and only joined when a snapshot is taken. `snapshot()`
+    returns the same list object every time with the last assistant message
+    updated in place, so per-token cost does not grow with history length.
+    """
+
+    def __init__(self, history: List[ChatMessage] | None, user_text: str | None = None) -> None:
+        self.messages: List[ChatMessage] = list(history or [])
+        if user_text is not None:
+            self.messages.append({"role": "user", "content": user_text or ""})
+        if not self.messages or self.messages[-1].get("role") != "assistant":
+            self.messages.append({"role": "assistant", "content": ""})
+        self._last = self.messages[-1]
+        prev = self._last.get("content")
+        if not isinstance(prev, str):
+            prev = str(prev) if prev is not None else ""
+        self._chunks: List[str] = [prev] if prev else []
+        self._dirty = False
+
+    def append(self, delta_text: str) -> None:
+        if delta_text:
+            self._chunks.append(delta_text)
+            self._dirty = True
+
+    def set_text(self, text: str) -> None:
+        """Replace the assistant reply (e.g. with the final reconciled text)."""
+        self._chunks = [text] if text else []
+        self._dirty = True
+
+    @property
+    def text(self) -> str:
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    def snapshot(self, placeholder: str | None = None) -> List[ChatMessage]:
+        """Return the messages list with the reply materialized.
+
+        If the reply is still empty and `placeholder` is given, it is shown
+        instead (without becoming part of the reply text).
+        """
+        text = self.text
+        if not text and placeholder:
+            self._last["content"] = placeholder
+            self._dirty = True
+            return self.messages
+        if self._dirty:
+            self._last["content"] = text
+            self._dirty = False
+        return self.messages
+
+
+class MessageNormalizer:
+    """Incremental `sanitize_messages` for a growing Chatbot history.
+
+    Gradio sends the whole history on every submit, usually the previous one
+    plus a few new messages. If the new history is at least as long as the
+    last one and matches it at the first and last previously seen messages,
+    it is treated as an extension: only the messages after that point are
+    normalized and the normalized prefix is reused. Edits in the middle of an
+    otherwise unchanged history are not detected. `messages_to_openai` still
+    copies each normalized dict, so callers cannot alter the cached prefix.
+    """
+
+    def __init__(self) -> None:
+        self._n = 0
+        self._ends: tuple[Any, Any] = (None, None)
+        self._out: List[ChatMessage] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _copy(message: Any) -> Any:
+        return dict(message) if isinstance(message, dict) else message
+
+    def sanitize(self, messages: Any) -> List[ChatMessage]:
+        if not isinstance(messages, list):
+            return sanitize_messages(messages)
+        with self._lock:
+            k = self._n
+            if k and len(messages) >= k and (messages[0], messages[k - 1]) == self._ends:
+                prefix, tail = self._out, messages[k:]
+            else:
+                prefix, tail = [], messages
+            self._out = prefix + sanitize_messages(tail) if tail else prefix
+            self._n = len(messages)
+            # Copies, so a caller mutating its history in place still reads as a change
+            self._ends = (self._copy(messages[0]), self._copy(messages[-1])) if messages else (None, None)
+            return list(self._out)
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import time
+
+import config.settings as settings
+
+
+class UpdateCoalescer:
+    """Decides when a stream loop should push an update to the UI.
+
+    Deltas are accumulated until at least `interval_ms` has passed since the
+    last emit or `max_chars` characters are pending. The first delta is always
+    emitted immediately so time-to-first-token is unaffected. Callers remain
+    responsible for a final yield on completion or error (which flushes).
+    """
+
+    def __init__(self, interval_ms: float | None = None, max_chars: int | None = None) -> None:
+        self.interval_s = (settings.STREAM_FLUSH_INTERVAL_MS if interval_ms is None else interval_ms) / 1000.0
+        self.max_chars = settings.STREAM_FLUSH_CHARS if max_chars is None else max_chars
+        self._last_emit: float | None = None
+        self._pending = 0
+
+    def ready(self, n_chars: int) -> bool:
+        """Record `n_chars` new characters; return True if an update should be emitted now."""
+        self._pending += n_chars
+        now = time.monotonic()
+        if (
+            self._last_emit is None
+            or (self.max_chars > 0 and self._pending >= self.max_chars)
+            or now - self._last_emit >= self.interval_s
+        ):
+            self._last_emit = now
+            self._pending = 0
+            return True
+        return False
+
+    @property
+    def pending(self) -> bool:
+        return self._pending > 0
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import io
+import itertools
+import json
+import random
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_fake{next(_ids):06d}"
+
+
+def echo_responder(body: Dict[str, Any]) -> str:
+    """Default fake completion: echoes the last user message."""
+    return f"echo: {body['messages'][-1]['content']}"
+
+
+class _Files:
+    def __init__(self, store: Dict[str, bytes]) -> None:
+        self._store = store
+
+    def create(self, file: Any, purpose: str) -> SimpleNamespace:
+        data = file.read() if hasattr(file, "read") else file
+        file_id = _new_id("file")
+        self._store[file_id] = data if isinstance(data, bytes) else str(data).encode("utf-8")
+        return SimpleNamespace(id=file_id, purpose=purpose, bytes=len(self._store[file_id]))
+
+    def content(self, file_id: str) -> SimpleNamespace:
+        data = self._store[file_id]
+        return SimpleNamespace(text=data.decode("utf-8"), content=data, read=io.BytesIO(data).read)
+
+
+class _Batches:
+    def __init__(self, owner: "FakeBatchClient") -> None:
+        self._owner = owner
+        self._batches: Dict[str, SimpleNamespace] = {}
+
+    def create(self, input_file_id: str, endpoint: str, completion_window: str, metadata: Dict[str, str] | None = None) -> SimpleNamespace:
+        lines = self._owner.files.content(input_file_id).text.splitlines()
+        batch = SimpleNamespace(
+            id=_new_id("batch"),
+            status="validating",
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            output_file_id=None,
+            error_file_id=None,
+            errors=None,
+            metadata=metadata or {},
+            request_counts=SimpleNamespace(total=len(lines), completed=0, failed=0),
+            _polls=0,
+        )
+        self._batches[batch.id] = batch
+        return batch
+
+    def retrieve(self, batch_id: str) -> SimpleNamespace:
+        batch = self._batches[batch_id]
+        batch._polls += 1
+        if batch.status == "validating":
+            batch.status = "in_progress"
+        elif batch.status == "in_progress" and batch._polls > self._owner.polls_to_complete:
+            self._owner._process(batch)
+        return batch
+
+    def cancel(self, batch_id: str) -> SimpleNamespace:
+        batch = self._batches[batch_id]
+        if batch.status not in ("completed", "failed", "expired"):
+            batch.status = "cancelled"
+        return batch
+
+
+class FakeBatchClient:
+    """In-process stand-in for the OpenAI client's `files` and `batches` APIs.
+
+    Batches move validating -> in_progress -> completed over successive
+    `retrieve` calls and produce output/error files in the Batch API's line
+    format. `responder(body)` returns the completion text; raising marks that
+    request as failed. Output lines are shuffled relative to the input (seeded,
+    so runs are reproducible) like the real service, so callers must merge by
+    `custom_id`.
+    """
+
+    def __init__(
+        self,
+        responder: Callable[[Dict[str, Any]], str] = echo_responder,
+        polls_to_complete: int = 2,
+        seed: int = 0,
+    ) -> None:
+        self.responder = responder
+        self.polls_to_complete = polls_to_complete
+        self._rng = random.Random(seed)
+        self._files: Dict[str, bytes] = {}
+        self.files = _Files(self._files)
+        self.batches = _Batches(self)
+
+    def _process(self, batch: SimpleNamespace) -> None:
+        out: List[str] = []
+        err: List[str] = []
+        for raw in self.files.content(batch.input_file_id).text.splitlines():
+            request = json.loads(raw)
+            line: Dict[str, Any] = {"id": _new_id("batch_req"), "custom_id": request["custom_id"]}
+            try:
+                text = self.responder(request["body"])
+            except Exception as e:
+                line.update(response=None, error={"code": "fake_error", "message": str(e)})
+                err.append(json.dumps(line))
+                batch.request_counts.failed += 1
+                continue
+            prompt_tokens = sum(len(m["content"]) // 4 + 1 for m in request["body"]["messages"])
+            completion_tokens = len(text) // 4 + 1
+            line.update(
+                response={
+                    "status_code": 200,
+                    "request_id": _new_id("req"),
+                    "body": {
+                        "object": "chat.completion",
+                        "model": request["body"]["model"],
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    },
+                },
+                error=None,
+            )
+            out.append(json.dumps(line))
+            batch.request_counts.completed += 1
+        self._rng.shuffle(out)
+        if out:
+            batch.output_file_id = self.files.create(("\n".join(out) + "\n").encode("utf-8"), "batch_output").id
+        if err:
+            batch.error_file_id = self.files.create(("\n".join(err) + "\n").encode("utf-8"), "batch_output").id
+        batch.status = "completed"
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Any, Dict, List
+
+import config.settings as settings
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to a character-based estimate
+    tiktoken = None
+
+# Per-message framing overhead in the chat format (role, separators)
+_MESSAGE_OVERHEAD_TOKENS = 4
+_FALLBACK_ENCODING = "o200k_base"
+
+
+@lru_cache(maxsize=32)
+def _encoding(model: str) -> Any:
+    """tiktoken encoding for `model`, or None to use the character heuristic."""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as e:
+        # Known model whose BPE file cannot be downloaded (e.g. offline container)
+        settings.dprint(f"[token_budget] tokenizer for {model} unavailable, estimating: {e}")
+        return None
+    try:
+        return tiktoken.get_encoding(_FALLBACK_ENCODING)
+    except Exception as e:
+        # e.g. the BPE file cannot be downloaded in an offline container
+        settings.dprint(f"[token_budget] tokenizer unavailable, estimating: {e}")
+        return None
+
+
+@lru_cache(maxsize=16384)
+def _count_text(model: str, text: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(model: str, message: Dict[str, Any]) -> int:
+    """Token count of one chat message; counts are memoized per (model, content)."""
+    content = message.get("content") or ""
+    if not isinstance(content, str):
+        content = str(content)
+    return _count_text(model, content) + _MESSAGE_OVERHEAD_TOKENS
+
+
+def context_budget(task: str) -> int:
+    """Prompt token budget for `task` from TASK_CONFIG (0 means unlimited)."""
+    return int(settings.TASK_CONFIG.get(task, {}).get("max_context_tokens", 0) or 0)
+
+
+def fit_messages(messages: List[Dict[str, Any]], model: str, budget: int) -> List[Dict[str, Any]]:
+    """Drop the oldest turns so `messages` fits in `budget` tokens.
+
+    Leading system messages and the final message are always kept. The cut
+    point is snapped to multiples of CONTEXT_TRIM_STEP messages, so the kept
+    prefix stays byte-identical across consecutive turns and provider-side
+    prompt caching keeps hitting until the window has to move again.
+    """
+    if budget <= 0 or not messages:
+        return messages
+    n_system = 0
+    while n_system < len(messages) - 1 and messages[n_system].get("role") == "system":
+        n_system += 1
+    system, turns = messages[:n_system], messages[n_system:]
+
+    counts = [count_message_tokens(model, m) for m in turns]
+    total = sum(count_message_tokens(model, m) for m in system) + sum(counts)
+    if total <= budget:
+        return messages
+
+    step = max(1, settings.CONTEXT_TRIM_STEP)
+    start = 0
+    last = len(turns) - 1
+    while total > budget and start < last:
+        cut = min(start + step, last)
+        total -= sum(counts[start:cut])
+        start = cut
+    settings.dprint(f"[token_budget] dropped {start} of {len(turns)} messages to fit {budget} tokens")
+    return system + turns[start:]
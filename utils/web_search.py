@@ -1,45 +1,124 @@
 from __future__ import annotations
 
+import asyncio
 import os
-from typing import List
+import threading
+import weakref
+from typing import Any, List
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config.settings as settings
+from utils.cache import SQLiteCache, TTLCache
 
 
 class TavilyError(RuntimeError):
     pass
 
 
-def tavily_search_summarize(query: str, max_results: int = 5) -> str:
-    """Search Tavily and return a compact, source-linked summary.
+# Summaries keyed on (normalized query, max_results, search_depth); optionally
+# backed by SQLite so several workers share results.
+search_cache = TTLCache(
+    settings.TAVILY_CACHE_MAX_ENTRIES,
+    settings.TAVILY_CACHE_TTL_SECONDS,
+    backend=(
+        SQLiteCache(settings.TAVILY_CACHE_PATH, settings.TAVILY_CACHE_TTL_SECONDS)
+        if settings.TAVILY_CACHE_PATH
+        else None
+    ),
+)
 
-    Requires TAVILY_API_KEY in environment.
-    """
+# Transient statuses worth retrying (rate limiting and upstream hiccups)
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A search never outlives the tool step waiting for it
+_REQUEST_TIMEOUT_SECONDS = min(20.0, settings.TOOL_STEP_DEADLINE_SECONDS)
+# Failures where the POST never reached Tavily, so resending cannot duplicate work
+_NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+# One client per event loop; dropped with its loop
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _get_session() -> requests.Session:
+    """Process-wide keep-alive session with a pooled adapter and transient-failure retries."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                # read=0: a read timeout already spent the full timeout and is not retried
+                retry = Retry(
+                    total=settings.TAVILY_MAX_RETRIES,
+                    read=0,
+                    backoff_factor=0.3,
+                    status_forcelist=_RETRY_STATUSES,
+                    allowed_methods=frozenset({"POST"}),
+                    respect_retry_after_header=True,
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=4,
+                    pool_maxsize=settings.TAVILY_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _get_async_client() -> httpx.AsyncClient:
+    """Keep-alive async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            timeout=_REQUEST_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=settings.TAVILY_POOL_SIZE,
+                max_keepalive_connections=settings.TAVILY_POOL_SIZE,
+            ),
+        )
+    return client
+
+
+def _cache_key(query: str, max_results: int, search_depth: str) -> str:
+    normalized = " ".join((query or "").lower().split())
+    return f"{search_depth}|{max_results}|{normalized}"
+
+
+def _prepare(query: str, max_results: int, search_depth: str) -> tuple[dict[str, Any], str, int]:
+    """Validate inputs and return (request payload, cache key, clamped max_results)."""
     api_key = os.getenv("TAVILY_API_KEY")
     if not api_key:
         raise TavilyError("TAVILY_API_KEY is not set")
     max_results = max(1, min(int(max_results or 5), 10))
+    payload = {
+        "api_key": api_key,
+        "query": query,
+        "max_results": max_results,
+        "search_depth": search_depth,
+        "include_answer": True,
+        "include_raw_content": False,
+    }
+    return payload, _cache_key(query, max_results, search_depth), max_results
 
-    try:
-        resp = requests.post(
-            "https://api.tavily.com/search",
-            json={
-                "api_key": api_key,
-                "query": query,
-                "max_results": max_results,
-                "search_depth": "basic",
-                "include_answer": True,
-                "include_raw_content": False,
-            },
-            timeout=20,
-        )
-    except Exception as e:
-        raise TavilyError(f"Request failed: {e}")
 
-    if resp.status_code != 200:
-        raise TavilyError(f"HTTP {resp.status_code}: {resp.text}")
+def _cached(key: str, query: str) -> str | None:
+    if settings.TAVILY_CACHE_TTL_SECONDS <= 0:
+        return None
+    cached = search_cache.get(key)
+    if cached is not None:
+        settings.dprint(f"[web_search] cache hit: {query!r}")
+    return cached
+
 
-    data = resp.json()
+def _summarize(data: dict, max_results: int) -> str:
     answer = data.get("answer")
     results: List[dict] = data.get("results") or []
 
@@ -56,3 +135,71 @@ def tavily_search_summarize(query: str, max_results: int = 5) -> str:
     return "\n".join(lines).strip()
 
 
+def _store(key: str, summary: str) -> str:
+    if settings.TAVILY_CACHE_TTL_SECONDS > 0:
+        search_cache.set(key, summary)
+    return summary
+
+
+def tavily_search_summarize(
+    query: str, max_results: int = 5, search_depth: str = "basic", timeout: float | None = None
+) -> str:
+    """Search Tavily and return a compact, source-linked summary.
+
+    Requires TAVILY_API_KEY in environment. Successful results are cached
+    (see `search_cache`); errors are not. `timeout` (seconds) lowers the
+    per-attempt request timeout, e.g. to the time left in a tool step.
+    """
+    payload, key, max_results = _prepare(query, max_results, search_depth)
+    cached = _cached(key, query)
+    if cached is not None:
+        return cached
+
+    try:
+        limit = _REQUEST_TIMEOUT_SECONDS if timeout is None else max(0.1, min(timeout, _REQUEST_TIMEOUT_SECONDS))
+        resp = _get_session().post(settings.TAVILY_API_URL, json=payload, timeout=limit)
+    except Exception as e:
+        raise TavilyError(f"Request failed: {e}")
+
+    if resp.status_code != 200:
+        raise TavilyError(f"HTTP {resp.status_code}: {resp.text}")
+
+    return _store(key, _summarize(resp.json(), max_results))
+
+
+async def tavily_search_summarize_async(query: str, max_results: int = 5, search_depth: str = "basic") -> str:
+    """Async variant of `tavily_search_summarize` for asyncio chat paths.
+
+    Shares the result cache; transient failures are retried with backoff
+    (honouring `Retry-After`), but not timeouts after the request was sent.
+    """
+    payload, key, max_results = _prepare(query, max_results, search_depth)
+    cached = _cached(key, query)
+    if cached is not None:
+        return cached
+
+    client = _get_async_client()
+    attempts = settings.TAVILY_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        delay = 0.3 * (2**attempt)
+        try:
+            resp = await client.post(settings.TAVILY_API_URL, json=payload)
+        except _NOT_SENT_ERRORS as e:
+            if attempt + 1 < attempts:
+                await asyncio.sleep(delay)
+                continue
+            raise TavilyError(f"Request failed: {e}")
+        except Exception as e:
+            raise TavilyError(f"Request failed: {e}")
+
+        if resp.status_code in _RETRY_STATUSES and attempt + 1 < attempts:
+            try:
+                delay = max(delay, float(resp.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+            await asyncio.sleep(delay)
+            continue
+        if resp.status_code != 200:
+            raise TavilyError(f"HTTP {resp.status_code}: {resp.text}")
+        return _store(key, _summarize(resp.json(), max_results))
+    raise TavilyError("Request failed: retries exhausted")